@@ -1,10 +1,19 @@
 from django.contrib import admin
-from .models import User, Chat, Message, Order
+from .models import User, Chat, Message, MessageArchive, Order, Rollup, UserPurge
+from .search import search_users, user_query_words
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('email', 'username', 'city', 'roleKey', 'created_at')
-    search_fields = ('email', 'username', 'city')
+    search_fields = ('email', 'username', 'city', 'phone')
+    search_limit = 1000
+    
+    def get_search_results(self, request, queryset, search_term):
+        # The search index instead of an icontains scan per field; too-short terms still scan
+        if not user_query_words(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        ids = [pk for pk, _ in search_users(search_term, limit=self.search_limit)]
+        return queryset.filter(pk__in=ids), False
 
 @admin.register(Chat)
 class ChatAdmin(admin.ModelAdmin):
@@ -16,7 +25,22 @@ class MessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'chat', 'sender', 'created_at')
     list_filter = ('created_at',)
 
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('chat', 'first_at', 'last_at', 'message_count')
+    exclude = ('data',)
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'senderName', 'receiverName', 'origin', 'destination', 'isComplete')
-    list_filter = ('isComplete', 'created_at')
\ No newline at end of file
+    list_filter = ('isComplete', 'created_at')
+
+@admin.register(UserPurge)
+class UserPurgeAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'stage', 'removed', 'created_at', 'finished_at')
+    readonly_fields = ('user_id', 'stage', 'position', 'removed', 'finished_at')
+
+@admin.register(Rollup)
+class RollupAdmin(admin.ModelAdmin):
+    list_display = ('metric', 'dimension', 'bucket', 'value')
+    list_filter = ('metric',)
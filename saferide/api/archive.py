@@ -0,0 +1,219 @@
+"""Cold storage for old chat history.
+
+``run_archive`` moves each chat's messages older than MESSAGE_ARCHIVE_AFTER_DAYS
+out of the ``messages`` table into MessageArchive segments: zlib-compressed,
+delta-encoded runs of up to MESSAGE_ARCHIVE_SEGMENT_SIZE consecutive messages.
+A chat's archive is always a prefix of its history, so every archived message
+is older than every message still in the table. Messages awaiting translation
+and a chat's last message (the inbox summary) stay behind, and nothing after
+them is archived until they can go too.
+
+MessageHistoryPagination reads through to the segments once a client pages
+back past the oldest message left in the table.
+"""
+import json
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from uuid import UUID
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Chat, Message, MessageArchive
+from .pagination import LatestFirstKeysetPagination
+
+FORMAT_VERSION = 1
+COMPRESSION_LEVEL = 9
+CHAT_BATCH_SIZE = 1000
+# Same columns FastListSerializer(MessageSerializer) reads, so archived rows render identically
+COLUMNS = (
+    'id', 'chat_id', 'sender_id', 'text', 'target_language', 'translated_text',
+    'translation_status', 'created_at', 'updated_at',
+)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def archive_after():
+    return timedelta(days=getattr(settings, 'MESSAGE_ARCHIVE_AFTER_DAYS', 90))
+
+
+def encode_segment(rows):
+    """Compress ascending message rows; senders are interned, timestamps delta-encoded."""
+    senders = {}
+    packed = []
+    previous = 0
+    for row in rows:
+        created = (row['created_at'] - _EPOCH) // _MICROSECOND
+        packed.append([
+            row['id'].hex, senders.setdefault(row['sender_id'], len(senders)), row['text'],
+            row['target_language'], row['translated_text'], row['translation_status'],
+            created - previous, (row['updated_at'] - _EPOCH) // _MICROSECOND - created,
+        ])
+        previous = created
+    body = {'v': FORMAT_VERSION, 'senders': [sender.hex for sender in senders], 'rows': packed}
+    return zlib.compress(json.dumps(body, separators=(',', ':'), ensure_ascii=False).encode(), COMPRESSION_LEVEL)
+
+
+def decode_segment(data, chat_id):
+    """The segment's rows, shaped like ``Message.objects.values(*COLUMNS)``."""
+    body = json.loads(zlib.decompress(data))
+    if body['v'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported message archive format {body['v']}")
+    senders = [UUID(sender) for sender in body['senders']]
+    rows = []
+    created = 0
+    for message_id, sender, text, language, translated, translation_status, delta, edited in body['rows']:
+        created += delta
+        rows.append({
+            'id': UUID(message_id),
+            'chat_id': chat_id,
+            'sender_id': senders[sender],
+            'text': text,
+            'target_language': language,
+            'translated_text': translated,
+            'translation_status': translation_status,
+            'created_at': _EPOCH + created * _MICROSECOND,
+            'updated_at': _EPOCH + (created + edited) * _MICROSECOND,
+        })
+    return rows
+
+
+def read_archive(chat_id, bound=None, descending=True, count=50):
+    """Up to ``count`` archived messages of a chat past ``bound`` (created_at, id), nearest first."""
+    segments = MessageArchive.objects.filter(chat_id=chat_id)
+    if descending:
+        if bound is not None:
+            segments = segments.filter(first_at__lte=bound[0])
+        segments = segments.order_by('-first_at', '-id')
+    else:
+        if bound is not None:
+            segments = segments.filter(last_at__gte=bound[0])
+        segments = segments.order_by('first_at', 'id')
+
+    rows = []
+    # Segments are usually full, so this is normally a single query
+    batch = count // getattr(settings, 'MESSAGE_ARCHIVE_SEGMENT_SIZE', 500) + 2
+    offset = 0
+    while len(rows) < count:
+        chunk = list(segments.values_list('data', flat=True)[offset:offset + batch])
+        for data in chunk:
+            segment = decode_segment(data, chat_id)
+            if descending:
+                segment.reverse()
+            if bound is not None:
+                if descending:
+                    segment = [row for row in segment if (row['created_at'], row['id']) < bound]
+                else:
+                    segment = [row for row in segment if (row['created_at'], row['id']) > bound]
+            rows.extend(segment[:count - len(rows)])
+            if len(rows) >= count:
+                break
+        if len(chunk) < batch:
+            break
+        offset += batch
+    return rows
+
+
+class MessageHistoryPagination(LatestFirstKeysetPagination):
+    """Chat history paging that continues into the chat's archive segments.
+
+    Going back, the archive is only read once the table runs out of older
+    messages. Going forward, it is read whenever one of the chat's segments
+    ends at or after the cursor; ``archive_messages --older-than-days`` can
+    archive newer messages than MESSAGE_ARCHIVE_AFTER_DAYS, so the setting is
+    no bound. Polling past the archive costs one indexed lookup that finds no
+    segment.
+    """
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+
+    def fetch(self, queryset, bound, descending, count):
+        rows = super().fetch(queryset, bound, descending, count)
+        if descending:
+            if len(rows) < count:
+                rows += read_archive(self.chat_id, bound, True, count - len(rows))
+        else:
+            rows = (read_archive(self.chat_id, bound, False, count) + rows)[:count]
+        return rows
+
+
+def _archive_step(chat_id, cutoff, segment_size):
+    """Move the next run of a chat's archivable messages into its newest segment or a new one."""
+    with transaction.atomic():
+        locked = list(Chat.objects.select_for_update().filter(pk=chat_id).values_list('last_message_id', flat=True))
+        if not locked:
+            return 0
+        last_message_id = locked[0]
+
+        tail = MessageArchive.objects.filter(chat_id=chat_id).order_by('-first_at', '-id').first()
+        if tail is not None and tail.message_count >= segment_size:
+            tail = None
+        room = segment_size - (tail.message_count if tail is not None else 0)
+        rows = list(
+            Message.objects.select_for_update().filter(chat_id=chat_id, created_at__lt=cutoff)
+            .order_by('created_at', 'id').values(*COLUMNS)[:room]
+        )
+        for index, row in enumerate(rows):
+            if row['id'] == last_message_id or row['translation_status'] == Message.TRANSLATION_PENDING:
+                rows = rows[:index]
+                break
+        if not rows:
+            return 0
+
+        if tail is None:
+            MessageArchive.objects.create(
+                chat_id=chat_id, first_at=rows[0]['created_at'], last_at=rows[-1]['created_at'],
+                message_count=len(rows), data=encode_segment(rows),
+            )
+        else:
+            combined = decode_segment(tail.data, chat_id) + rows
+            tail.data = encode_segment(combined)
+            tail.last_at = rows[-1]['created_at']
+            tail.message_count = len(combined)
+            tail.save(update_fields=['data', 'last_at', 'message_count', 'updated_at'])
+        Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        return len(rows)
+
+
+def archive_chat(chat_id, cutoff, segment_size):
+    archived = 0
+    while True:
+        moved = _archive_step(chat_id, cutoff, segment_size)
+        if not moved:
+            return archived
+        archived += moved
+
+
+@dataclass
+class ArchiveResult:
+    chats: int
+    messages: int
+    seconds: float
+
+
+def run_archive(older_than=None, segment_size=None, chat_ids=None):
+    """Archive every chat's messages older than ``older_than`` (a timedelta)."""
+    started = time.perf_counter()
+    cutoff = timezone.now() - (older_than if older_than is not None else archive_after())
+    segment_size = segment_size or getattr(settings, 'MESSAGE_ARCHIVE_SEGMENT_SIZE', 500)
+
+    # A chat created after the cutoff cannot hold anything old enough
+    chats = Chat.objects.filter(created_at__lt=cutoff)
+    if chat_ids:
+        chats = chats.filter(pk__in=chat_ids)
+    touched = archived = 0
+    batch = list(chats.order_by('pk').values_list('pk', flat=True)[:CHAT_BATCH_SIZE])
+    while batch:
+        for chat_id in batch:
+            moved = archive_chat(chat_id, cutoff, segment_size)
+            if moved:
+                touched += 1
+                archived += moved
+        batch = list(chats.filter(pk__gt=batch[-1]).order_by('pk').values_list('pk', flat=True)[:CHAT_BATCH_SIZE])
+    return ArchiveResult(touched, archived, time.perf_counter() - started)
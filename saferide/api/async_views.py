@@ -0,0 +1,123 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .hashing import HashingOverloaded, get_hashing_pool
+from .models import User
+from .serializers import UserLoginSerializer, UserRegisterSerializer
+
+# Login and registration run as native async views so PBKDF2 work happens on the
+# bounded hashing pool rather than on a request worker thread.
+
+
+def _json(data, status=status.HTTP_200_OK):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def _overloaded():
+    response = _json(
+        {'message': 'Too many authentication requests in progress, please retry'},
+        status=status.HTTP_429_TOO_MANY_REQUESTS
+    )
+    response['Retry-After'] = '1'
+    return response
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST.dict()
+
+
+class AsyncRegisterUserView(View):
+    http_method_names = ['post']
+    
+    async def post(self, request):
+        data = _request_data(request)
+        if not isinstance(data, dict):
+            return _json({'message': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = UserRegisterSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return _json(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        validated = serializer.validated_data
+        try:
+            password = await get_hashing_pool().run(make_password, validated['password'])
+        except HashingOverloaded:
+            return _overloaded()
+        
+        user = User(
+            email=User.objects.normalize_email(validated['email']),
+            password=password,
+            username=validated['username'],
+            roleKey=validated['roleKey'],
+            city=validated['city'],
+            phone=validated.get('phone', '')
+        )
+        await user.asave()
+        
+        refresh = RefreshToken.for_user(user)
+        return _json({
+            'id': str(user.id),
+            'username': user.username,
+            'email': user.email,
+            'city': user.city,
+            'roleKey': user.roleKey,
+            'phone': user.phone,
+            'access': str(refresh.access_token),
+            'refresh': str(refresh)
+        }, status=status.HTTP_201_CREATED)
+
+
+class AsyncLoginUserView(View):
+    http_method_names = ['post']
+    
+    async def post(self, request):
+        data = _request_data(request)
+        if not isinstance(data, dict):
+            return _json({'message': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = UserLoginSerializer(data=data)
+        if not serializer.is_valid():
+            return _json(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        invalid = _json(
+            {'non_field_errors': ['Invalid email or password']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+        user = await User.objects.filter(email=serializer.validated_data['email']).afirst()
+        if user is None:
+            return invalid
+        
+        try:
+            valid = await get_hashing_pool().run(user.check_password, serializer.validated_data['password'])
+        except HashingOverloaded:
+            return _overloaded()
+        if not valid:
+            return invalid
+        
+        refresh = RefreshToken.for_user(user)
+        return _json({
+            'data': {
+                'token': str(refresh.access_token),
+                'user': {
+                    'id': str(user.id),
+                    'username': user.username,
+                    'email': user.email,
+                    'city': user.city,
+                    'roleKey': user.roleKey,
+                    'phone': user.phone
+                }
+            },
+            'message': 'Login successful'
+        })
@@ -0,0 +1,103 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+from .routers import note_user, replica_aliases, use_primary
+
+
+class UserPrincipalCache:
+    """Bounded, short-TTL cache of User rows keyed by id.
+
+    Entries are dropped on User save/delete in this process; other processes
+    see changes once the TTL expires.
+    """
+
+    def __init__(self, ttl=30.0, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Views may modify request.user, so never hand out the shared instance
+            return copy.copy(entry[1])
+
+    def set(self, user):
+        key = str(user.pk)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, copy.copy(user))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserPrincipalCache(
+    ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 30.0),
+    max_size=getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """simplejwt authentication resolving the token's user id to an ``api.User``
+    through ``user_cache``, so most requests skip the users table entirely.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_model = User
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        note_user(user_id)
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = super().get_user(validated_token)
+            except AuthenticationFailed as e:
+                if e.detail.get('code') != 'user_not_found' or not replica_aliases():
+                    raise
+                # Just registered, and not on the replica yet
+                with use_primary():
+                    user = super().get_user(validated_token)
+            user_cache.set(user)
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
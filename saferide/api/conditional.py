@@ -0,0 +1,71 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.utils.cache import quote_etag
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def queryset_validators(queryset):
+    """Cheap version of a collection: (max(updated_at), row count)."""
+    result = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    return result['last_modified'], result['count']
+
+
+def _cache():
+    if not getattr(settings, 'RESPONSE_CACHE_ENABLED', False):
+        return None
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _generation_key(resource):
+    return 'resp-gen:' + ':'.join(str(part) for part in resource)
+
+
+def invalidate_resource(*resource):
+    """Orphan every cached response of a resource; called from model signals."""
+    cache = _cache()
+    if cache is None:
+        return
+    key = _generation_key(resource)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def conditional_response(request, resource, version, last_modified, build, variant=''):
+    """Answer a GET with 304 when the client's ETag is current.
+
+    ``version`` must change whenever the payload does; the ETag also covers the
+    query string and negotiated media type so every page and encoding has its
+    own. Otherwise ``build()`` produces the
+    response data, served from the response cache when RESPONSE_CACHE_ENABLED.
+    """
+    media_type = getattr(request, 'accepted_media_type', '') or ''
+    raw = '|'.join([variant, repr(resource), repr(version), request.get_full_path(), media_type])
+    etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Accept'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+    # Only the ETag is trusted: Last-Modified has one-second resolution and
+    # would miss deletes that leave max(updated_at) unchanged.
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cache = _cache()
+    if cache is None:
+        return Response(build(), headers=headers)
+
+    generation = cache.get(_generation_key(resource), 0)
+    key = f'resp:{generation}:{etag}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return Response(data, headers=headers)
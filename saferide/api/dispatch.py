@@ -0,0 +1,234 @@
+"""Batch matching of unassigned orders to available drivers.
+
+An order is picked up at its sender's last known position. A driver is any
+user with the DISPATCH_DRIVER_ROLE roleKey whose position was refreshed within
+DISPATCH_LOCATION_MAX_AGE seconds and who has no open assigned order.
+"""
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .geo import EARTH_RADIUS_KM
+from .models import Order, User
+from .realtime import publish_to_users
+
+# Keep only the nearest few drivers per order when building greedy candidates
+GREEDY_CANDIDATES = 16
+# Orders handled per distance-matrix block; bounds memory at block * drivers floats
+BLOCK_SIZE = 1024
+# Retry rounds for orders whose candidates were all taken by nearer orders
+GREEDY_ROUNDS = 8
+UNREACHABLE = 1e9
+
+
+def unit_vectors(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lng = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def great_circle_km(dots):
+    """Great-circle distance from dot products of unit vectors."""
+    return EARTH_RADIUS_KM * np.arccos(np.clip(dots, -1.0, 1.0))
+
+
+def distance_matrix_km(order_points, driver_points):
+    """Full (orders x drivers) distance matrix for (lat, lng) arrays."""
+    orders = unit_vectors(order_points[:, 0], order_points[:, 1])
+    drivers = unit_vectors(driver_points[:, 0], driver_points[:, 1])
+    return great_circle_km(orders @ drivers.T)
+
+
+def assign_greedy(order_points, driver_points, max_km=None):
+    """Nearest-first assignment. Returns [(order_index, driver_index, km)].
+
+    Pairs are taken globally in order of increasing distance. Each block of
+    orders is one matrix product of unit vectors, and only the nearest
+    GREEDY_CANDIDATES drivers per order are kept and sorted. Orders that lose
+    all their candidates are retried against the drivers still free.
+    """
+    order_idx = np.arange(len(order_points))
+    driver_idx = np.arange(len(driver_points))
+    assignments = []
+    for _ in range(GREEDY_ROUNDS):
+        if not len(order_idx) or not len(driver_idx):
+            break
+        orders = unit_vectors(order_points[order_idx, 0], order_points[order_idx, 1])
+        drivers = unit_vectors(driver_points[driver_idx, 0], driver_points[driver_idx, 1])
+        k = min(GREEDY_CANDIDATES, len(driver_idx))
+
+        cand_drivers = np.empty((len(order_idx), k), dtype=np.int64)
+        cand_dots = np.empty((len(order_idx), k))
+        for start in range(0, len(order_idx), BLOCK_SIZE):
+            dots = orders[start:start + BLOCK_SIZE] @ drivers.T
+            if k < dots.shape[1]:
+                # Largest dot product = nearest driver
+                nearest = np.argpartition(dots, dots.shape[1] - k, axis=1)[:, -k:]
+            else:
+                nearest = np.broadcast_to(np.arange(k), dots.shape)
+            cand_drivers[start:start + BLOCK_SIZE] = nearest
+            cand_dots[start:start + BLOCK_SIZE] = np.take_along_axis(dots, nearest, axis=1)
+
+        distances = great_circle_km(cand_dots).ravel()
+        rows = np.repeat(np.arange(len(order_idx)), k)
+        cols = cand_drivers.ravel()
+        ranked = np.argsort(distances, kind='stable')
+        if max_km is not None:
+            ranked = ranked[distances[ranked] <= max_km]
+
+        order_taken = np.zeros(len(order_idx), dtype=bool)
+        driver_taken = np.zeros(len(driver_idx), dtype=bool)
+        # Plain lists: element access in this loop is much cheaper than on arrays
+        rows_taken = order_taken.tolist()
+        cols_taken = driver_taken.tolist()
+        found = 0
+        for row, col, km in zip(rows[ranked].tolist(), cols[ranked].tolist(), distances[ranked].tolist()):
+            if rows_taken[row] or cols_taken[col]:
+                continue
+            rows_taken[row] = True
+            cols_taken[col] = True
+            assignments.append((int(order_idx[row]), int(driver_idx[col]), km))
+            found += 1
+        order_taken[:] = rows_taken
+        driver_taken[:] = cols_taken
+
+        if not found or k == len(driver_idx):
+            break
+        order_idx = order_idx[~order_taken]
+        driver_idx = driver_idx[~driver_taken]
+    return assignments
+
+
+def _hungarian(cost):
+    """Minimum-cost assignment for an (n x m) matrix with n <= m.
+
+    Shortest augmenting path with row/column potentials, vectorized over
+    columns; O(n^2 m). Returns the column chosen for each row.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.int64)  # match[j]: 1-based row on column j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        match[0] = row
+        col = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[col] = True
+            current = match[col]
+            free = ~used[1:]
+            reduced = cost[current - 1] - u[current] - v[1:]
+            better = free & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = col
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            next_col = int(np.argmin(candidates)) + 1
+            delta = candidates[next_col - 1]
+            used_cols = np.flatnonzero(used)
+            u[match[used_cols]] += delta
+            v[used_cols] -= delta
+            min_reduced[1:][free] -= delta
+            col = next_col
+            if match[col] == 0:
+                break
+        while col:
+            previous = way[col]
+            match[col] = match[previous]
+            col = previous
+    columns = np.full(n, -1, dtype=np.int64)
+    for col in range(1, m + 1):
+        if match[col]:
+            columns[match[col] - 1] = col - 1
+    return columns
+
+
+def assign_optimal(order_points, driver_points, max_km=None):
+    """Assignment minimising total pickup distance. Returns [(order_index, driver_index, km)]."""
+    if not len(order_points) or not len(driver_points):
+        return []
+    distances = distance_matrix_km(order_points, driver_points)
+    cost = distances if max_km is None else np.where(distances <= max_km, distances, UNREACHABLE)
+    if cost.shape[0] <= cost.shape[1]:
+        pairs = enumerate(_hungarian(cost).tolist())
+    else:
+        pairs = ((row, col) for col, row in enumerate(_hungarian(cost.T).tolist()))
+    return [
+        (row, col, float(distances[row, col]))
+        for row, col in pairs
+        if max_km is None or distances[row, col] <= max_km
+    ]
+
+
+@dataclass
+class DispatchResult:
+    orders: int
+    drivers: int
+    assigned: int
+    mode: str
+    seconds: float
+
+
+def run_dispatch(batch_size=None, mode='auto'):
+    """Assign one batch of queued orders and write the result in one transaction."""
+    started = time.perf_counter()
+    batch_size = batch_size or getattr(settings, 'DISPATCH_BATCH_SIZE', 10000)
+    max_km = getattr(settings, 'DISPATCH_MAX_DISTANCE_KM', 10.0)
+    max_age = timedelta(seconds=getattr(settings, 'DISPATCH_LOCATION_MAX_AGE', 120))
+
+    queue = list(
+        Order.objects.filter(receiver__isnull=True, isComplete=False, sender__deleted_at=None)
+        .exclude(sender__latitude=None).exclude(sender__longitude=None)
+        .order_by('created_at')
+        .values_list('id', 'sender_id', 'sender__latitude', 'sender__longitude')[:batch_size]
+    )
+    busy = Order.objects.filter(isComplete=False, receiver__isnull=False).values('receiver_id')
+    drivers = list(
+        User.objects.filter(
+            roleKey=getattr(settings, 'DISPATCH_DRIVER_ROLE', 'driver'),
+            location_updated_at__gte=timezone.now() - max_age,
+        )
+        .exclude(latitude=None).exclude(longitude=None).exclude(id__in=busy)
+        .values_list('id', 'username', 'latitude', 'longitude')
+    )
+    if mode == 'auto':
+        optimal_cells = getattr(settings, 'DISPATCH_OPTIMAL_MAX_CELLS', 250 * 250)
+        mode = 'optimal' if len(queue) * len(drivers) <= optimal_cells else 'greedy'
+    if not queue or not drivers:
+        return DispatchResult(len(queue), len(drivers), 0, mode, time.perf_counter() - started)
+
+    order_points = np.array([(lat, lng) for _, _, lat, lng in queue])
+    driver_points = np.array([(lat, lng) for _, _, lat, lng in drivers])
+    assign = assign_optimal if mode == 'optimal' else assign_greedy
+    matches = {queue[row][0]: drivers[col] for row, col, _ in assign(order_points, driver_points, max_km)}
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Orders assigned or completed since the batch was read are skipped
+        still_queued = Order.objects.select_for_update(skip_locked=True).filter(
+            id__in=list(matches), receiver__isnull=True, isComplete=False
+        )
+        orders = list(still_queued.only('id', 'sender_id'))
+        for order in orders:
+            driver_id, driver_name, _, _ = matches[order.id]
+            order.receiver_id = driver_id
+            order.receiverName = driver_name
+            order.updated_at = now
+        Order.objects.bulk_update(orders, ['receiver', 'receiverName', 'updated_at'], batch_size=1000)
+
+        def notify():
+            for order in orders:
+                publish_to_users([order.sender_id, order.receiver_id], 'order.assigned', {
+                    'id': str(order.id), 'receiver': str(order.receiver_id), 'receiverName': order.receiverName,
+                })
+
+        transaction.on_commit(notify)
+
+    return DispatchResult(len(queue), len(drivers), len(orders), mode, time.perf_counter() - started)
@@ -0,0 +1,151 @@
+"""Distance and ETA estimates for many coordinate pairs at once.
+
+``estimate`` takes (n, 2) arrays of origins and destinations (or one of either
+against many of the other) and returns great-circle kilometres and driving
+seconds for every pair in one vectorized pass. Driving time follows a simple
+speed model: the straight-line distance is stretched by ETA_DETOUR_FACTOR to
+approximate the road distance, and covered at the speeds in ETA_SPEED_BANDS,
+slower for the first kilometres of a trip than for the rest.
+
+Coordinates are rounded to 1e-5 degrees (about a metre) before anything is
+computed, so repeated pairs can be answered from PairCache without changing
+the result. The cache is off unless ETA_CACHE_SIZE is set: a warm lookup costs
+about as much as recomputing a haversine (`manage.py bench_eta`), so it only
+pays off once the distance model gets more expensive.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_KM
+
+# Coordinates are rounded to 1 / COORDINATE_SCALE degrees before hashing and computing
+COORDINATE_SCALE = 1e5
+# (distance up to km, speed km/h); the last band has no upper bound
+DEFAULT_SPEED_BANDS = [[2.0, 15.0], [10.0, 25.0], [None, 40.0]]
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_FINAL = np.uint64(0xBF58476D1CE4E5B9)
+
+
+def haversine_km_many(lat1, lng1, lat2, lng2):
+    """Vectorized geo.haversine_km over broadcastable arrays of degrees."""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    half_dphi = (phi2 - phi1) / 2
+    half_dlambda = np.radians(np.subtract(lng2, lng1)) / 2
+    a = np.sin(half_dphi) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def speed_bands():
+    return getattr(settings, 'ETA_SPEED_BANDS', DEFAULT_SPEED_BANDS)
+
+
+def travel_seconds(km, bands=None, detour=None):
+    """Driving seconds for straight-line distances under the speed-band model."""
+    road_km = np.asarray(km, dtype=np.float64) * (
+        detour if detour is not None else getattr(settings, 'ETA_DETOUR_FACTOR', 1.3)
+    )
+    seconds = np.zeros_like(road_km)
+    lower = 0.0
+    for upper, speed in bands if bands is not None else speed_bands():
+        covered = road_km - lower if upper is None else np.clip(road_km, lower, upper) - lower
+        seconds += np.maximum(covered, 0.0) * (3600.0 / speed)
+        if upper is None:
+            break
+        lower = upper
+    return seconds
+
+
+def pair_keys(quantized):
+    """64-bit hashes of (n, 4) rows of rounded coordinates; never 0, which marks an empty slot."""
+    rows = quantized.astype(np.int64).view(np.uint64)
+    keys = rows[:, 0].copy()
+    for column in range(1, 4):
+        keys *= _MIX
+        keys ^= rows[:, column]
+    keys ^= keys >> np.uint64(31)
+    keys *= _FINAL
+    keys ^= keys >> np.uint64(29)
+    keys[keys == 0] = 1
+    return keys
+
+
+class PairCache:
+    """Direct-mapped cache of pair distances, looked up and filled with array operations.
+
+    ``size`` (rounded up to a power of two) slots each hold one pair's key and
+    distance; a new pair evicts whatever shared its slot. Keys are 64-bit
+    hashes of the rounded coordinates, so a false hit needs a hash collision.
+    """
+
+    def __init__(self, size=65536):
+        self.size = 1 << max(int(size) - 1, 1).bit_length()
+        self._mask = np.uint64(self.size - 1)
+        self._keys = np.zeros(self.size, dtype=np.uint64)
+        self._km = np.zeros(self.size)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, keys):
+        """(distances, found) for the keys; distances where not found are undefined."""
+        slots = (keys & self._mask).astype(np.intp)
+        with self._lock:
+            found = self._keys[slots] == keys
+            distances = self._km[slots]
+            hits = int(found.sum())
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(keys) - hits
+        return distances, found
+
+    def put(self, keys, distances):
+        slots = (keys & self._mask).astype(np.intp)
+        with self._lock:
+            self._keys[slots] = keys
+            self._km[slots] = distances
+
+    def clear(self):
+        with self._lock:
+            self._keys[:] = 0
+            self.stats = {'hits': 0, 'misses': 0}
+
+
+_pair_cache = None
+_pair_cache_lock = threading.Lock()
+
+
+def get_pair_cache():
+    """The process-wide PairCache, or None when ETA_CACHE_SIZE is 0."""
+    global _pair_cache
+    size = getattr(settings, 'ETA_CACHE_SIZE', 0)
+    if not size:
+        return None
+    if _pair_cache is None:
+        with _pair_cache_lock:
+            if _pair_cache is None:
+                _pair_cache = PairCache(size)
+    return _pair_cache
+
+
+def estimate(origins, destinations, cache=None):
+    """(km, seconds) arrays for (n, 2) or (1, 2) arrays of (lat, lng) origins and destinations."""
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    count = max(len(origins), len(destinations))
+    quantized = np.empty((count, 4))
+    quantized[:, :2] = np.rint(origins * COORDINATE_SCALE)
+    quantized[:, 2:] = np.rint(destinations * COORDINATE_SCALE)
+
+    if cache is None:
+        km = haversine_km_many(*(quantized / COORDINATE_SCALE).T)
+    else:
+        keys = pair_keys(quantized)
+        km, found = cache.get(keys)
+        missing = ~found
+        if missing.any():
+            computed = haversine_km_many(*(quantized[missing] / COORDINATE_SCALE).T)
+            km[missing] = computed
+            cache.put(keys[missing], computed)
+    return km, travel_seconds(km)
@@ -0,0 +1,61 @@
+import uuid
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def _uuid(params, name):
+    try:
+        return uuid.UUID(params[name])
+    except ValueError:
+        raise ValidationError({name: ['Must be a valid id.']})
+
+
+def _bool(params, name):
+    value = params[name].lower()
+    if value in ('true', '1'):
+        return True
+    if value in ('false', '0'):
+        return False
+    raise ValidationError({name: ['Must be true or false.']})
+
+
+def _datetime(params, name, end_of_day=False):
+    value = params[name]
+    try:
+        # Both return None when malformed, but raise for impossible dates such as February 30th
+        parsed = parse_datetime(value)
+        day = None if parsed is not None else parse_date(value)
+    except ValueError:
+        parsed = day = None
+    if parsed is None:
+        if day is None:
+            raise ValidationError({name: ['Must be an ISO 8601 date or datetime.']})
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_orders(queryset, params):
+    """Apply the order list filters in ``params`` (query params) to ``queryset``.
+
+    Every filter lines up with a composite index on ``orders``.
+    """
+    if params.get('sender'):
+        queryset = queryset.filter(sender_id=_uuid(params, 'sender'))
+    if params.get('receiver'):
+        queryset = queryset.filter(receiver_id=_uuid(params, 'receiver'))
+    if params.get('isComplete'):
+        queryset = queryset.filter(isComplete=_bool(params, 'isComplete'))
+    if params.get('createdAfter'):
+        queryset = queryset.filter(created_at__gte=_datetime(params, 'createdAfter'))
+    if params.get('createdBefore'):
+        queryset = queryset.filter(created_at__lte=_datetime(params, 'createdBefore', end_of_day=True))
+    if params.get('origin'):
+        queryset = queryset.filter(origin__startswith=params['origin'])
+    if params.get('destination'):
+        queryset = queryset.filter(destination__startswith=params['destination'])
+    return queryset
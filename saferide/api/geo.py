@@ -0,0 +1,149 @@
+import math
+import threading
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+# Grid cells are CELL_SIZE degrees square. A cell id is row * GRID_COLUMNS + col,
+# so neighbouring cells in the same row are consecutive integers and a whole
+# row band can be fetched with a single index range scan.
+CELL_SIZE = 0.02
+GRID_COLUMNS = int(math.ceil(360 / CELL_SIZE))
+GRID_ROWS = int(math.ceil(180 / CELL_SIZE))
+
+
+def _row(latitude):
+    return min(max(int(math.floor((latitude + 90) / CELL_SIZE)), 0), GRID_ROWS - 1)
+
+
+def _col(longitude):
+    return int(math.floor(((longitude + 180) % 360) / CELL_SIZE)) % GRID_COLUMNS
+
+
+def cell_for(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return _row(float(latitude)) * GRID_COLUMNS + _col(float(longitude))
+
+
+def valid_point(latitude, longitude):
+    """Whether the coordinates are in range; NaN never is, nor is infinity."""
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_ranges(latitude, longitude, radius_km):
+    """Return inclusive (first, last) cell id ranges covering the radius."""
+    lat_span = radius_km / KM_PER_DEGREE
+    row_min = _row(max(latitude - lat_span, -90.0))
+    row_max = _row(min(latitude + lat_span, 90.0))
+
+    cos_lat = math.cos(math.radians(min(abs(latitude) + lat_span, 90.0)))
+    if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        col_spans = [(0, GRID_COLUMNS - 1)]
+    else:
+        lng_span = radius_km / (KM_PER_DEGREE * cos_lat)
+        col_min = _col(longitude - lng_span)
+        col_max = _col(longitude + lng_span)
+        if col_min <= col_max:
+            col_spans = [(col_min, col_max)]
+        else:
+            # Crosses the antimeridian
+            col_spans = [(col_min, GRID_COLUMNS - 1), (0, col_max)]
+
+    ranges = []
+    for row in range(row_min, row_max + 1):
+        base = row * GRID_COLUMNS
+        for first, last in col_spans:
+            ranges.append((base + first, base + last))
+    return ranges
+
+
+class CellIndex:
+    """In-process grid index of user positions, keyed by cell id."""
+
+    def __init__(self):
+        self._cells = {}
+        self._positions = {}
+        self._roles = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._positions)
+
+    def update(self, user_id, latitude, longitude, role_key=None):
+        with self._lock:
+            self._roles[user_id] = role_key
+            self._place(user_id, latitude, longitude, role_key)
+
+    def move(self, user_id, latitude, longitude):
+        """Update a position, keeping the role recorded by update() or load()."""
+        with self._lock:
+            self._place(user_id, latitude, longitude, self._roles.get(user_id))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._discard(user_id)
+            self._roles.pop(user_id, None)
+
+    def _place(self, user_id, latitude, longitude, role_key):
+        self._discard(user_id)
+        cell = cell_for(latitude, longitude)
+        if cell is None:
+            return
+        self._cells.setdefault(cell, {})[user_id] = (float(latitude), float(longitude), role_key)
+        self._positions[user_id] = cell
+
+    def _discard(self, user_id):
+        cell = self._positions.pop(user_id, None)
+        if cell is None:
+            return
+        members = self._cells.get(cell)
+        if members is not None:
+            members.pop(user_id, None)
+            if not members:
+                del self._cells[cell]
+
+    def load(self, rows):
+        """Replace the index contents with (user_id, lat, lng, role_key) rows."""
+        with self._lock:
+            self._cells = {}
+            self._positions = {}
+            self._roles = {}
+            for user_id, latitude, longitude, role_key in rows:
+                self._roles[user_id] = role_key
+                self._place(user_id, latitude, longitude, role_key)
+            self.loaded = True
+
+    def nearby(self, latitude, longitude, radius_km, role_key=None, limit=None):
+        """Return [(distance_km, user_id)] within radius_km, nearest first."""
+        results = []
+        with self._lock:
+            cells = self._cells
+            for first, last in cell_ranges(latitude, longitude, radius_km):
+                for cell in range(first, last + 1):
+                    members = cells.get(cell)
+                    if not members:
+                        continue
+                    for user_id, (lat, lng, role) in members.items():
+                        if role_key is not None and role != role_key:
+                            continue
+                        distance = haversine_km(latitude, longitude, lat, lng)
+                        if distance <= radius_km:
+                            results.append((distance, user_id))
+        results.sort(key=lambda item: item[0])
+        if limit is not None:
+            results = results[:limit]
+        return results
+
+
+location_index = CellIndex()
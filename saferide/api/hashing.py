@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .metrics import timed
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+class PasswordHashingPool:
+    """Dedicated executor for deliberately slow password hashing.
+
+    At most ``workers`` hashes run at once and ``max_queue`` more may wait;
+    anything beyond that raises HashingOverloaded immediately instead of
+    queueing, so a login storm cannot take capacity from the rest of the API.
+    """
+
+    def __init__(self, workers=2, max_queue=16):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self.rejected = 0
+
+    def _submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingOverloaded()
+        future = self._executor.submit(func, *args)
+        # Release when the work finishes, even if the caller stopped waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, func, *args):
+        with timed('hashing'):
+            return await asyncio.wrap_future(self._submit(func, *args))
+
+    def call(self, func, *args):
+        with timed('hashing'):
+            return self._submit(func, *args).result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordHashingPool(
+                    workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', 2),
+                    max_queue=getattr(settings, 'PASSWORD_HASHING_MAX_QUEUE', 16),
+                )
+    return _pool
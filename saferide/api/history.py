@@ -0,0 +1,296 @@
+"""Location history: every accepted ping, stored as compact per-user chunks.
+
+Pings reach LocationHistoryBuffer through the LocationBuffer and are appended
+every LOCATION_HISTORY_FLUSH_INTERVAL seconds to one LocationChunk per user and
+LOCATION_HISTORY_WINDOW. A chunk holds its points as three delta-encoded int32
+arrays (milliseconds, microdegrees of latitude and longitude), zlib-compressed.
+Replaying an hour of pings reads one or two rows.
+
+``location_path`` decodes the chunks covering a time range and reduces the
+path to at most ``max_points`` with Douglas-Peucker.
+"""
+import logging
+import math
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .geo import EARTH_RADIUS_KM, valid_point
+from .models import LocationChunk, User
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# version, point count, first point as (ms, microdegrees lat, microdegrees lng)
+HEADER = struct.Struct('<BIqii')
+COORDINATE_SCALE = 1e6
+# Pings must fall inside datetime's range (year 9999) to be given a window
+MAX_TIMESTAMP = 253402300800
+
+
+def history_window():
+    return getattr(settings, 'LOCATION_HISTORY_WINDOW', 3600)
+
+
+def window_start(ts, window=None):
+    window = window or history_window()
+    return datetime.fromtimestamp(ts - ts % window, tz=dt_timezone.utc)
+
+
+def encode_points(ms, lat, lng):
+    """Pack int arrays of timestamps (ms) and coordinates (microdegrees), sorted by time."""
+    ms = np.asarray(ms, dtype=np.int64)
+    lat = np.asarray(lat, dtype=np.int64)
+    lng = np.asarray(lng, dtype=np.int64)
+    header = HEADER.pack(FORMAT_VERSION, len(ms), int(ms[0]), int(lat[0]), int(lng[0]))
+    deltas = np.concatenate((np.diff(ms), np.diff(lat), np.diff(lng))).astype('<i4')
+    return header + zlib.compress(deltas.tobytes())
+
+
+def decode_points(data):
+    """(ms, lat, lng) int64 arrays of a chunk."""
+    data = bytes(data)
+    version, count, ms0, lat0, lng0 = HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unsupported location chunk format {version}')
+    deltas = np.frombuffer(zlib.decompress(data[HEADER.size:]), dtype='<i4').astype(np.int64)
+    steps = count - 1
+    columns = []
+    for index, first in enumerate((ms0, lat0, lng0)):
+        column = np.empty(count, dtype=np.int64)
+        column[0] = first
+        np.cumsum(deltas[index * steps:(index + 1) * steps], out=column[1:])
+        column[1:] += first
+        columns.append(column)
+    return tuple(columns)
+
+
+def _merge(chunk, points):
+    """Chunk arrays plus new (ts, lat, lng) pings, sorted by time with duplicates dropped."""
+    ms = np.array([round(ts * 1000) for ts, _, _ in points], dtype=np.int64)
+    lat = np.array([round(lat * COORDINATE_SCALE) for _, lat, _ in points], dtype=np.int64)
+    lng = np.array([round(lng * COORDINATE_SCALE) for _, _, lng in points], dtype=np.int64)
+    if chunk is not None:
+        old_ms, old_lat, old_lng = decode_points(chunk.data)
+        ms = np.concatenate((old_ms, ms))
+        lat = np.concatenate((old_lat, lat))
+        lng = np.concatenate((old_lng, lng))
+    order = np.argsort(ms, kind='stable')
+    ms, lat, lng = ms[order], lat[order], lng[order]
+    keep = np.ones(len(ms), dtype=bool)
+    keep[1:] = ms[1:] != ms[:-1]
+    return ms[keep], lat[keep], lng[keep]
+
+
+def append_points(pings):
+    """Append {(user_id, window_start): [(ts, lat, lng), ...]} to the users' chunks."""
+    # Pings can name any id; the location buffer's bulk_update just skips unknown users
+    known = set(User.objects.filter(pk__in={user_id for user_id, _ in pings}).values_list('pk', flat=True))
+    pings = {key: points for key, points in pings.items() if key[0] in known}
+    if not pings:
+        return 0
+    with transaction.atomic():
+        keys = list(pings)
+        existing = {
+            (chunk.user_id, chunk.window_start): chunk
+            for chunk in LocationChunk.objects.select_for_update().filter(
+                user_id__in={user_id for user_id, _ in keys}, window_start__in={start for _, start in keys},
+            )
+        }
+        created = []
+        updated = []
+        for key, points in pings.items():
+            chunk = existing.get(key)
+            ms, lat, lng = _merge(chunk, points)
+            if chunk is None:
+                chunk = LocationChunk(user_id=key[0], window_start=key[1])
+                created.append(chunk)
+            else:
+                updated.append(chunk)
+            chunk.data = encode_points(ms, lat, lng)
+            chunk.point_count = len(ms)
+            chunk.started_at = datetime.fromtimestamp(ms[0] / 1000, tz=dt_timezone.utc)
+            chunk.ended_at = datetime.fromtimestamp(ms[-1] / 1000, tz=dt_timezone.utc)
+        LocationChunk.objects.bulk_create(created, batch_size=500)
+        LocationChunk.objects.bulk_update(updated, ['data', 'point_count', 'started_at', 'ended_at'], batch_size=500)
+    return len(created) + len(updated)
+
+
+class LocationHistoryBuffer:
+    """Collects accepted pings and appends them to LocationChunks every ``flush_interval`` seconds.
+
+    At most ``max_buffered`` points wait in memory; beyond that (the database
+    being unreachable) the oldest are dropped.
+    """
+
+    def __init__(self, flush_interval=30.0, max_buffered=200000, window=3600):
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.window = window
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self.stats = {'received': 0, 'dropped': 0, 'flushed': 0, 'flushes': 0}
+
+    def add(self, user_id, latitude, longitude, ts):
+        """Buffer a ping. Returns False when it was dropped as unencodable."""
+        ts, latitude, longitude = float(ts), float(latitude), float(longitude)
+        with self._lock:
+            self.stats['received'] += 1
+            # A flush containing one of these could never succeed, so it would be re-queued forever
+            if not (valid_point(latitude, longitude) and 0 <= ts < MAX_TIMESTAMP):
+                self.stats['dropped'] += 1
+                return False
+            self._pending.append((user_id, ts, latitude, longitude))
+            if len(self._pending) > self.max_buffered:
+                overflow = len(self._pending) - self.max_buffered
+                del self._pending[:overflow]
+                self.stats['dropped'] += overflow
+            self._ensure_timer()
+        return True
+
+    def flush(self):
+        """Write all buffered points. Returns the number of points written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            pings = {}
+            for user_id, ts, lat, lng in pending:
+                pings.setdefault((user_id, window_start(ts, self.window)), []).append((ts, lat, lng))
+            try:
+                try:
+                    append_points(pings)
+                except IntegrityError:
+                    # Another process created one of the chunks first; it exists now
+                    append_points(pings)
+            except Exception:
+                logger.exception("Location history flush failed, re-queueing %d points", len(pending))
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+            with self._lock:
+                self.stats['flushed'] += len(pending)
+                self.stats['flushes'] += 1
+            return len(pending)
+
+    def _ensure_timer(self):
+        if self._timer is None and self.flush_interval:
+            self._timer = threading.Thread(target=self._run_timer, name='location-history', daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                pass
+            finally:
+                close_old_connections()
+
+
+_history_buffer = None
+_history_buffer_lock = threading.Lock()
+
+
+def get_history_buffer():
+    global _history_buffer
+    if _history_buffer is None:
+        with _history_buffer_lock:
+            if _history_buffer is None:
+                _history_buffer = LocationHistoryBuffer(
+                    flush_interval=getattr(settings, 'LOCATION_HISTORY_FLUSH_INTERVAL', 30.0),
+                    max_buffered=getattr(settings, 'LOCATION_HISTORY_MAX_BUFFERED', 200000),
+                    window=history_window(),
+                )
+    return _history_buffer
+
+
+def _project(lat, lng):
+    """Equirectangular metres around the path's mean latitude; plenty for a trip."""
+    lat_rad = np.radians(lat)
+    scale = EARTH_RADIUS_KM * 1000
+    return scale * np.radians(lng) * math.cos(float(lat_rad.mean())), scale * lat_rad
+
+
+def douglas_peucker_ranks(x, y):
+    """Per-point Douglas-Peucker significance in the units of x and y.
+
+    Keeping the points whose rank exceeds a tolerance is exactly DP at that
+    tolerance, so the N most significant points are DP's N-point
+    simplification. Endpoints rank infinite.
+    """
+    count = len(x)
+    ranks = np.zeros(count)
+    if count:
+        ranks[0] = ranks[-1] = np.inf
+    stack = [(0, count - 1, np.inf)] if count > 2 else []
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(px * dy - py * dx) / length
+        split = int(np.argmax(distances))
+        # A point is only reachable through its parent's split
+        rank = min(float(distances[split]), parent)
+        index = first + 1 + split
+        ranks[index] = rank
+        stack.append((first, index, rank))
+        stack.append((index, last, rank))
+    return ranks
+
+
+def simplify(lat, lng, max_points=None, tolerance_m=None):
+    """Indices of the Douglas-Peucker simplification, in time order."""
+    count = len(lat)
+    if count <= 2:
+        return np.arange(count)
+    x, y = _project(lat, lng)
+    ranks = douglas_peucker_ranks(x, y)
+    keep = np.ones(count, dtype=bool) if tolerance_m is None else ranks > tolerance_m
+    if max_points is not None and keep.sum() > max_points:
+        keep[:] = False
+        keep[np.argsort(-ranks, kind='stable')[:max(max_points, 2)]] = True
+    return np.flatnonzero(keep)
+
+
+def location_path(user_id, start, end, max_points=500, tolerance_m=None):
+    """The user's pings between ``start`` and ``end`` as (points, total).
+
+    ``points`` is a list of (epoch seconds, lat, lng), simplified to at most
+    ``max_points``; ``total`` is the number of recorded pings in the range.
+    """
+    window = timedelta(seconds=history_window())
+    chunks = (
+        LocationChunk.objects.filter(
+            user_id=user_id, window_start__gt=start - window, window_start__lte=end,
+            ended_at__gte=start, started_at__lte=end,
+        )
+        .order_by('window_start').values_list('data', flat=True)
+    )
+    columns = [decode_points(data) for data in chunks]
+    if not columns:
+        return [], 0
+    ms, lat, lng = (np.concatenate(parts) for parts in zip(*columns))
+    selected = (ms >= start.timestamp() * 1000) & (ms <= end.timestamp() * 1000)
+    ms, lat, lng = ms[selected], lat[selected] / COORDINATE_SCALE, lng[selected] / COORDINATE_SCALE
+    indices = simplify(lat, lng, max_points, tolerance_m)
+    points = [(ms[i] / 1000, lat[i], lng[i]) for i in indices.tolist()]
+    return points, len(ms)
@@ -0,0 +1,515 @@
+"""In-process load test of every route in api/urls.py (`manage.py loadtest_api`).
+
+Each route has a Scenario that builds its requests from seeded fixtures. A
+run reports latency percentiles, throughput and DB queries per request, and
+checks them against the per-backend budgets in loadtest_budgets.json.
+"""
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.test import Client
+from django.urls import URLPattern, Resolver404, resolve, reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import urls as api_urls
+from .authentication import user_cache
+from .geo import cell_for
+from .models import Chat, ChatMember, Message, Order, User, direct_chat_key
+from .rollups import reconcile
+
+BUDGETS_PATH = Path(__file__).with_name('loadtest_budgets.json')
+EMAIL_DOMAIN = 'loadtest.saferide.local'
+PASSWORD = 'loadtest-password'
+# Kigali-sized metro area, roughly 40km x 40km
+CENTER = (-1.95, 30.06)
+SPREAD = 0.2
+PLACES = ['Kimironko', 'Remera', 'Nyamirambo', 'Kicukiro', 'Gikondo', 'Kacyiru', 'Nyarutarama', 'Kanombe']
+# Users that authenticate requests, one per route; scenarios never write to them
+TOKEN_USERS = 30
+# Messages per batch-messages request, spread over a few chats
+BATCH_MESSAGES = 20
+# Coordinate pairs per order-estimates request
+ESTIMATE_PAIRS = 200
+
+
+@dataclass
+class Fixtures:
+    users: list
+    chats: list  # (chat id, first member id, second member id)
+    token_chats: list  # (chat id, index in tokens of a member)
+    busy_chat: str
+    tokens: list
+    refresh: str
+    login_email: str
+    rng: random.Random
+
+
+@dataclass
+class Scenario:
+    """How to exercise one route.
+
+    ``build(fixtures, i, items)`` returns the path and JSON body of request
+    ``i``. Routes that consume a row per request (deletes) get ``prepare``,
+    which creates ``count`` rows up front and returns them as ``items``.
+    ``token(fixtures, i, items)``, when given, is the access token request
+    ``i`` authenticates with instead of the route's shared one.
+    """
+    method: str
+    build: object
+    expect: tuple = (200,)
+    authenticated: bool = True
+    prepare: object = None
+    token: object = None
+    # Caps requests for routes dominated by password hashing
+    max_requests: int = None
+
+
+@dataclass
+class RouteResult:
+    name: str
+    method: str
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+    exceptions: int = 0
+    exception: str = ''
+    seconds: float = 0.0
+    skipped: str = ''
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    def percentile(self, values, fraction):
+        values = sorted(values)
+        return values[max(0, math.ceil(fraction * len(values)) - 1)] if values else 0
+
+    def latency_ms(self, fraction):
+        return self.percentile(self.latencies, fraction) * 1000
+
+    @property
+    def throughput(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    @property
+    def mean_queries(self):
+        return sum(self.queries) / len(self.queries) if self.queries else 0.0
+
+    @property
+    def max_queries(self):
+        return max(self.queries, default=0)
+
+
+def _point(rng):
+    return CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD)
+
+
+def _email(name):
+    return f'{name}@{EMAIL_DOMAIN}'
+
+
+def _make_users(rng, count, prefix, password):
+    now = timezone.now()
+    users = []
+    for i in range(count):
+        lat, lng = _point(rng)
+        users.append(User(
+            email=_email(f'{prefix}{i}'), username=f'{prefix}{i}', password=password,
+            city=rng.choice(['Kigali', 'Musanze', 'Huye']), roleKey=rng.choice(['driver', 'rider']),
+            phone=f'+2507{rng.randrange(10 ** 8):08d}', latitude=lat, longitude=lng,
+            geocell=cell_for(lat, lng), location_updated_at=now,
+        ))
+    return User.objects.bulk_create(users, batch_size=2000)
+
+
+def _make_orders(rng, count, user_ids):
+    orders = []
+    for _ in range(count):
+        sender = rng.choice(user_ids)
+        receiver = rng.choice(user_ids) if rng.random() < 0.7 else None
+        orders.append(Order(
+            sender_id=sender, receiver_id=receiver, senderName='loadtest', receiverName=receiver and 'loadtest',
+            origin=f'{rng.choice(PLACES)}, Kigali', destination=f'{rng.choice(PLACES)}, Kigali',
+            isComplete=receiver is not None and rng.random() < 0.5,
+        ))
+    return Order.objects.bulk_create(orders, batch_size=2000)
+
+
+def seed(users, chats, messages, orders, seed=42):
+    """Insert the load-test dataset unless a previous run (--keepdb) left it."""
+    if User.objects.filter(email=_email('user0')).exists():
+        return False
+    rng = random.Random(seed)
+    user_ids = [user.id for user in _make_users(rng, users, 'user', make_password(PASSWORD))]
+
+    pairs = set()
+    while len(pairs) < min(chats, len(user_ids) * (len(user_ids) - 1) // 2):
+        first, second = rng.sample(user_ids, 2)
+        pairs.add(tuple(sorted([first, second], key=str)))
+    chat_rows = Chat.objects.bulk_create([
+        Chat(members=[str(first), str(second)], pair_key=direct_chat_key(first, second)) for first, second in pairs
+    ], batch_size=2000)
+    ChatMember.objects.bulk_create([
+        ChatMember(chat=chat, user_id=user_id, counterpart_id=other_id, unread_count=rng.randrange(5))
+        for chat in chat_rows
+        for user_id, other_id in (chat.members, chat.members[::-1])
+    ], batch_size=2000)
+
+    # A quarter of the messages go to one long conversation
+    busy = chat_rows[0]
+    rows = []
+    for i in range(messages):
+        chat = busy if i % 4 == 0 else rng.choice(chat_rows)
+        rows.append(Message(chat=chat, sender_id=rng.choice(chat.members), text=f'Load test message {i}'))
+        if len(rows) == 5000:
+            Message.objects.bulk_create(rows)
+            rows = []
+    Message.objects.bulk_create(rows)
+    latest = Message.objects.filter(chat_id=OuterRef('pk')).order_by('-created_at', '-id')
+    Chat.objects.update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_activity=Coalesce(Subquery(latest.values('created_at')[:1]), F('created_at')),
+    )
+    _make_orders(rng, orders, user_ids)
+    # bulk_create sends no signals, so the stats rollups are rebuilt from the tables
+    reconcile(full=True)
+    return True
+
+
+def load_fixtures(seed=42):
+    users = list(User.objects.filter(email__endswith='@' + EMAIL_DOMAIN, username__startswith='user')
+                 .order_by('created_at', 'id'))
+    chats = [
+        (str(chat_id), *members)
+        for chat_id, members in Chat.objects.filter(pair_key__isnull=False).values_list('id', 'members')[:5000]
+    ]
+    busy_chat = (
+        Message.objects.values('chat_id').annotate(total=Count('id')).order_by('-total')
+        .values_list('chat_id', flat=True).first()
+    )
+    token_index = {user.id: n for n, user in enumerate(users[:TOKEN_USERS])}
+    token_chats = [
+        (str(chat_id), token_index[user_id])
+        for chat_id, user_id in ChatMember.objects.filter(user_id__in=token_index)
+        .order_by('chat_id', 'user_id').values_list('chat_id', 'user_id')[:5000]
+    ]
+    login = User.objects.get(email=_email('user0'))
+    return Fixtures(
+        users=[str(user.id) for user in users],
+        chats=chats,
+        token_chats=token_chats,
+        busy_chat=str(busy_chat),
+        tokens=[str(RefreshToken.for_user(user).access_token) for user in users[:TOKEN_USERS]],
+        refresh=str(RefreshToken.for_user(login)),
+        login_email=login.email,
+        rng=random.Random(seed),
+    )
+
+
+def _user(fx, i):
+    return fx.users[i % len(fx.users)]
+
+
+def _target(fx, i):
+    # Users written to by a scenario; saving a user drops it from the principal
+    # cache, so these never include the users whose tokens authenticate requests
+    return fx.users[TOKEN_USERS + i % (len(fx.users) - TOKEN_USERS)]
+
+
+def _chat(fx, i):
+    return fx.chats[i % len(fx.chats)]
+
+
+def _token_chat(fx, i):
+    return fx.token_chats[i % len(fx.token_chats)]
+
+
+def _disposable_users(fx, count):
+    users = _make_users(fx.rng, count, f'disposable-{uuid.uuid4().hex[:8]}-', '!')
+    # For routes a user may only call on themselves
+    return [(str(user.id), str(RefreshToken.for_user(user).access_token)) for user in users]
+
+
+def _disposable_orders(fx, count):
+    return [str(order.id) for order in _make_orders(fx.rng, count, fx.users)]
+
+
+def _location(fx, i):
+    lat, lng = _point(fx.rng)
+    return {'latitude': lat, 'longitude': lng}
+
+
+SCENARIOS = {
+    'register': Scenario('POST', lambda fx, i, items: (reverse('register'), {
+        'username': f'new{i}', 'email': _email(f'new-{uuid.uuid4().hex}'), 'password': PASSWORD,
+        'roleKey': 'rider', 'city': 'Kigali',
+    }), expect=(201,), authenticated=False, max_requests=20),
+    'login': Scenario('POST', lambda fx, i, items: (reverse('login'), {
+        'email': fx.login_email, 'password': PASSWORD,
+    }), authenticated=False, max_requests=20),
+    'token_refresh': Scenario('POST', lambda fx, i, items: (reverse('token_refresh'), {
+        'refresh': fx.refresh,
+    }), authenticated=False),
+    'current-user': Scenario('GET', lambda fx, i, items: (reverse('current-user'), None)),
+    'get-users': Scenario('GET', lambda fx, i, items: (reverse('get-users') + '?limit=50', None)),
+    'search-users': Scenario('GET', lambda fx, i, items: (reverse('search-users') + '?q=loadtest', None)),
+    'nearby-users': Scenario('GET', lambda fx, i, items: (
+        reverse('nearby-users') + '?lat={}&lng={}&radius=3&roleKey=driver'.format(*_point(fx.rng)), None
+    )),
+    'batch-locations': Scenario('POST', lambda fx, i, items: (reverse('batch-locations'), {
+        'pings': [{'userId': _target(fx, i * 50 + j), **_location(fx, i)} for j in range(50)],
+    }), expect=(202,)),
+    'get-user': Scenario('GET', lambda fx, i, items: (reverse('get-user', kwargs={'user_id': _user(fx, i)}), None)),
+    # Users may only move themselves
+    'update-location': Scenario(
+        'PATCH', lambda fx, i, items: (reverse('update-location', kwargs={'user_id': items[i][0]}), _location(fx, i)),
+        prepare=_disposable_users, token=lambda fx, i, items: items[i][1],
+    ),
+    # Users may only read their own history
+    'location-history': Scenario('GET', lambda fx, i, items: (
+        reverse('location-history', kwargs={'user_id': _user(fx, i % len(fx.tokens))}) + '?points=200', None
+    ), token=lambda fx, i, items: fx.tokens[i % len(fx.tokens)]),
+    'update-user': Scenario('PATCH', lambda fx, i, items: (
+        reverse('update-user', kwargs={'user_id': _target(fx, i)}), {'city': fx.rng.choice(['Kigali', 'Huye'])}
+    )),
+    'update-password': Scenario('PATCH', lambda fx, i, items: (
+        reverse('update-password', kwargs={'user_id': _target(fx, i)}),
+        {'newPassword': PASSWORD},
+    ), max_requests=20),
+    'delete-user': Scenario(
+        'DELETE', lambda fx, i, items: (reverse('delete-user', kwargs={'user_id': items[i][0]}), None),
+        prepare=_disposable_users, token=lambda fx, i, items: items[i][1],
+    ),
+    'create-chat': Scenario('POST', lambda fx, i, items: (reverse('create-chat'), {
+        'senderId': _user(fx, i), 'receiverId': _user(fx, i * 7 + 1),
+    }), expect=(200, 201)),
+    'user-chats': Scenario('GET', lambda fx, i, items: (
+        reverse('user-chats', kwargs={'user_id': _chat(fx, i)[1]}), None
+    )),
+    # Users may only read their own inbox and mark their own chats read
+    'inbox': Scenario('GET', lambda fx, i, items: (
+        reverse('inbox', kwargs={'user_id': _user(fx, i % len(fx.tokens))}) + '?limit=20', None
+    ), token=lambda fx, i, items: fx.tokens[i % len(fx.tokens)]),
+    'mark-chat-read': Scenario('POST', lambda fx, i, items: (
+        reverse('mark-chat-read', kwargs={'chat_id': _token_chat(fx, i)[0]}), {}
+    ), token=lambda fx, i, items: fx.tokens[_token_chat(fx, i)[1]]),
+    'all-chats': Scenario('GET', lambda fx, i, items: (reverse('all-chats') + '?limit=50', None)),
+    'find-chat': Scenario('GET', lambda fx, i, items: (
+        reverse('find-chat', kwargs={'first_id': _chat(fx, i)[1], 'second_id': _chat(fx, i)[2]}), None
+    )),
+    'add-message': Scenario('POST', lambda fx, i, items: (reverse('add-message'), {
+        'chatId': _chat(fx, i)[0], 'senderId': _chat(fx, i)[1], 'text': f'Load test reply {i}',
+    })),
+    'batch-messages': Scenario('POST', lambda fx, i, items: (reverse('batch-messages'), {'messages': [
+        {'chatId': _chat(fx, i + j)[0], 'senderId': _chat(fx, i + j)[1 + j % 2], 'text': f'Load test replay {i}.{j}'}
+        for j in range(BATCH_MESSAGES)
+    ]})),
+    'search-messages': Scenario('GET', lambda fx, i, items: (
+        reverse('search-messages') + f'?q=message {i % 1000}', None
+    )),
+    'get-messages': Scenario('GET', lambda fx, i, items: (
+        reverse('get-messages', kwargs={'chat_id': fx.busy_chat}) + '?limit=50', None
+    )),
+    'create-order': Scenario('POST', lambda fx, i, items: (reverse('create-order'), {
+        'sender': _user(fx, i), 'senderName': 'loadtest',
+        'origin': f'{fx.rng.choice(PLACES)}, Kigali', 'destination': f'{fx.rng.choice(PLACES)}, Kigali',
+    }), expect=(201,)),
+    'all-orders': Scenario('GET', lambda fx, i, items: (
+        reverse('all-orders') + f'?limit=50&isComplete=false&sender={_user(fx, i)}', None
+    )),
+    'order-counts': Scenario('GET', lambda fx, i, items: (reverse('order-counts') + '?groupBy=sender', None)),
+    'order-estimates': Scenario('POST', lambda fx, i, items: (reverse('order-estimates'), {
+        'origins': [_point(fx.rng) for _ in range(ESTIMATE_PAIRS)],
+        'destinations': [_point(fx.rng) for _ in range(ESTIMATE_PAIRS)],
+    })),
+    'delete-order': Scenario(
+        'DELETE', lambda fx, i, items: (reverse('delete-order', kwargs={'id': items[i]}), None),
+        prepare=_disposable_orders,
+    ),
+    'stats': Scenario('GET', lambda fx, i, items: (reverse('stats') + '?hours=24', None)),
+}
+
+
+def route_names():
+    return [pattern.name for pattern in api_urls.urlpatterns if isinstance(pattern, URLPattern)]
+
+
+def shadowed_by(name, path, method):
+    """Name of the earlier route that swallows ``path``, if it does not reach ``name``.
+
+    A route sharing its path with an earlier one is reachable if the earlier
+    route's view handles ``method`` (and hands it on).
+    """
+    try:
+        match = resolve(path.split('?')[0])
+    except Resolver404:
+        return '(unresolvable)'
+    if match.url_name == name or hasattr(getattr(match.func, 'cls', None), method.lower()):
+        return None
+    return match.url_name
+
+
+def run_route(name, scenario, fixtures, requests, concurrency, warmup):
+    """Drive one route from ``concurrency`` threads, each with its own client and DB connection."""
+    result = RouteResult(name, scenario.method)
+    if scenario.max_requests is not None:
+        requests = min(requests, scenario.max_requests)
+        warmup = min(warmup, 2)
+    total = warmup + requests
+    items = scenario.prepare(fixtures, total) if scenario.prepare else None
+
+    path, _ = scenario.build(fixtures, 0, items)
+    owner = shadowed_by(name, path, scenario.method)
+    if owner:
+        result.skipped = f'path is handled by {owner!r}'
+        return result
+
+    # One user per route; its principal is primed below, so the measured
+    # requests never look it up
+    token = fixtures.tokens[list(SCENARIOS).index(name) % len(fixtures.tokens)]
+    counter = itertools.count(warmup)
+    lock = threading.Lock()
+
+    def send(client, i):
+        """Issue request ``i``; returns (seconds, queries, status code)."""
+        path, body = scenario.build(fixtures, i, items)
+        request_token = scenario.token(fixtures, i, items) if scenario.token else token
+        headers = {'Authorization': f'Bearer {request_token}'} if scenario.authenticated else {}
+        data = '' if body is None else json.dumps(body)
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            # Every alias, so reads routed to replicas are counted too
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count_query))
+            start = time.perf_counter()
+            response = client.generic(scenario.method, path, data, content_type='application/json', headers=headers)
+            return time.perf_counter() - start, queries[0], response.status_code
+
+    def attempt(client, i):
+        """send(), or None when the view raised; the test client re-raises view exceptions."""
+        try:
+            return send(client, i)
+        except Exception as e:
+            with lock:
+                result.exceptions += 1
+                result.exception = result.exception or f'{type(e).__name__}: {e}'
+            return None
+
+    def worker():
+        client = Client()
+        try:
+            while True:
+                with lock:
+                    i = next(counter)
+                if i >= total:
+                    return
+                outcome = attempt(client, i)
+                if outcome is None:
+                    continue
+                elapsed, queries, status_code = outcome
+                with lock:
+                    result.latencies.append(elapsed)
+                    result.queries.append(queries)
+                    if status_code not in scenario.expect:
+                        result.errors += 1
+        finally:
+            connections.close_all()
+
+    # Unmeasured warmup fills per-process caches (principal cache, translation
+    # cache) so the measured query counts are the steady state
+    client = Client()
+    for i in range(warmup):
+        attempt(client, i)
+    # Principals stay cached for the whole measured run, however long it takes:
+    # an entry expiring mid-run would add a lookup to one request. Routes
+    # authenticating as many users would otherwise count each user's first
+    # lookup, however short the warmup
+    ttl, user_cache.ttl = user_cache.ttl, math.inf
+    try:
+        for user in User.objects.filter(pk__in=fixtures.users[:TOKEN_USERS]):
+            user_cache.set(user)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, name=f'loadtest-{n}') for n in range(max(1, concurrency))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        user_cache.ttl = ttl
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _read_budgets(path):
+    if not path.exists():
+        return {}
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def load_budgets(path=BUDGETS_PATH):
+    """Budgets for the current database backend; query counts differ between backends."""
+    return _read_budgets(path).get(connection.vendor, {})
+
+
+def write_budgets(results, path=BUDGETS_PATH, latency_headroom=1.5):
+    """Budget the most queries any request made exactly and p95 latency with headroom."""
+    all_budgets = _read_budgets(path)
+    budgets = all_budgets.setdefault(connection.vendor, {})
+    for result in results:
+        if result.skipped or not result.requests:
+            continue
+        budgets[result.name] = {
+            'queries': result.max_queries,
+            'p95_ms': max(10, int(math.ceil(result.latency_ms(0.95) * latency_headroom / 5.0)) * 5),
+        }
+    with open(path, 'w') as handle:
+        json.dump(all_budgets, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+    return budgets
+
+
+def check_budgets(results, budgets, latency_scale=1.0):
+    """List of budget violations; an empty list means the run passed."""
+    violations = []
+    for result in results:
+        if result.skipped:
+            continue
+        budget = budgets.get(result.name)
+        if budget is None:
+            violations.append(f'{result.name}: no {connection.vendor} budget in {BUDGETS_PATH.name}')
+            continue
+        if result.exceptions:
+            violations.append(f'{result.name}: {result.exceptions} requests raised, e.g. {result.exception}')
+        if not result.requests:
+            violations.append(f'{result.name}: no request completed')
+        if result.errors:
+            violations.append(f'{result.name}: {result.errors}/{result.requests} unexpected status codes')
+        if result.max_queries > budget['queries']:
+            violations.append(
+                f"{result.name}: up to {result.max_queries} queries/request, budget {budget['queries']}"
+            )
+        if latency_scale and result.latency_ms(0.95) > budget['p95_ms'] * latency_scale:
+            violations.append(
+                f"{result.name}: p95 {result.latency_ms(0.95):.1f}ms, budget {budget['p95_ms'] * latency_scale:.0f}ms"
+            )
+    return violations
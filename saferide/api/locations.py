@@ -0,0 +1,229 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .authentication import user_cache
+from .geo import cell_for, cell_ranges, haversine_km, location_index, valid_point
+from .history import get_history_buffer
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FIELDS = ['latitude', 'longitude', 'geocell', 'location_updated_at']
+# Errors caused by the row being written rather than by the database
+BAD_ROW_ERRORS = (ValueError, TypeError, ValidationError, DataError, IntegrityError)
+
+
+def nearby_backend():
+    return getattr(settings, 'NEARBY_INDEX_BACKEND', 'db')
+
+
+def load_location_index():
+    rows = (
+        User.objects.values_list('id', 'latitude', 'longitude', 'roleKey')
+        .iterator(chunk_size=5000)
+    )
+    location_index.load(rows)
+
+
+def nearby_users(latitude, longitude, radius_km, role_key=None, limit=50):
+    """Return [(distance_km, user)] within radius_km of the point, nearest first.
+
+    Only the grid cells overlapping the radius are read, either through the
+    ``geocell`` index or the in-process ``location_index``.
+    """
+    if nearby_backend() == 'memory':
+        if not location_index.loaded:
+            load_location_index()
+        hits = location_index.nearby(latitude, longitude, radius_km, role_key=role_key, limit=limit)
+        users = User.objects.in_bulk([user_id for _, user_id in hits])
+        return [(distance, users[user_id]) for distance, user_id in hits if user_id in users]
+
+    cells = Q()
+    for first, last in cell_ranges(latitude, longitude, radius_km):
+        cells |= Q(geocell__range=(first, last))
+    queryset = User.objects.filter(cells)
+    if role_key is not None:
+        queryset = queryset.filter(roleKey=role_key)
+
+    results = []
+    for user in queryset:
+        distance = haversine_km(latitude, longitude, user.latitude, user.longitude)
+        if distance <= radius_km:
+            results.append((distance, user))
+    results.sort(key=lambda item: item[0])
+    return results[:limit]
+
+
+def valid_ping(latitude, longitude, ts=None):
+    """Whether a ping can be buffered: coordinates in range and, if given, a
+    timestamp close to the server clock.
+
+    Later pings older than the last accepted one are dropped as stale, so a
+    single far-future ``ts`` (e.g. milliseconds) would freeze the user's position.
+    """
+    if not valid_point(latitude, longitude):
+        return False
+    if ts is None:
+        return True
+    now = time.time()
+    max_age = getattr(settings, 'LOCATION_PING_MAX_AGE', 3600)
+    max_skew = getattr(settings, 'LOCATION_PING_MAX_SKEW', 60)
+    return now - max_age <= ts <= now + max_skew
+
+
+class LocationBuffer:
+    """Write-behind buffer for location pings.
+
+    Pings are coalesced to the latest one per user, pings that moved less than
+    ``min_distance_m`` from the last known position are dropped, and pending
+    positions are written with a single ``bulk_update`` once ``max_pending``
+    users are waiting or every ``flush_interval`` seconds. Writes happen on the
+    flush thread, which a full buffer wakes early, so the request that fills it
+    does not wait for them. Every accepted ping is also handed to ``history``,
+    when given, before coalescing.
+    """
+
+    def __init__(self, flush_interval=2.0, max_pending=500, min_distance_m=5.0, max_tracked=200000, history=None):
+        self.flush_interval = flush_interval
+        self.history = history
+        self.max_pending = max_pending
+        self.min_distance_m = min_distance_m
+        self.max_tracked = max_tracked
+        self._pending = {}
+        self._written = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._wake = threading.Event()
+        self.stats = {'received': 0, 'dropped': 0, 'flushed': 0, 'flushes': 0}
+
+    def add(self, user_id, latitude, longitude, ts=None):
+        """Queue a ping. Returns False when it was dropped as invalid, stale or sub-threshold."""
+        latitude = float(latitude)
+        longitude = float(longitude)
+        ts = time.time() if ts is None else float(ts)
+        with self._lock:
+            self.stats['received'] += 1
+            # A flush containing one of these could never succeed
+            if not valid_ping(latitude, longitude, ts):
+                self.stats['dropped'] += 1
+                return False
+            previous = self._pending.get(user_id) or self._written.get(user_id)
+            if previous is not None:
+                prev_lat, prev_lng, prev_ts = previous
+                if ts < prev_ts or haversine_km(prev_lat, prev_lng, latitude, longitude) * 1000 < self.min_distance_m:
+                    self.stats['dropped'] += 1
+                    return False
+            self._pending[user_id] = (latitude, longitude, ts)
+            should_flush = len(self._pending) >= self.max_pending
+            self._ensure_timer()
+        if self.history is not None:
+            self.history.add(user_id, latitude, longitude, ts)
+        if should_flush:
+            if self._timer is not None:
+                self._wake.set()
+                return True
+            try:
+                self.flush()
+            except Exception:
+                # Logged and re-queued by flush(); the ping itself was accepted
+                pass
+        return True
+
+    def flush(self):
+        """Write all pending positions. Returns the number of users written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            now = timezone.now()
+            users = [
+                User(id=user_id, latitude=lat, longitude=lng, geocell=cell_for(lat, lng), location_updated_at=now)
+                for user_id, (lat, lng, _) in pending.items()
+            ]
+            try:
+                try:
+                    User.objects.bulk_update(users, LOCATION_FIELDS, batch_size=1000)
+                except BAD_ROW_ERRORS:
+                    # One bad row fails the whole statement; write them singly to drop only that one
+                    for user in users:
+                        if not self._write_one(user):
+                            del pending[user.pk]
+            except Exception:
+                logger.exception("Location flush failed, re-queueing %d pings", len(pending))
+                with self._lock:
+                    for user_id, ping in pending.items():
+                        current = self._pending.get(user_id)
+                        if current is None or current[2] < ping[2]:
+                            self._pending[user_id] = ping
+                raise
+            with self._lock:
+                if len(self._written) + len(pending) > self.max_tracked:
+                    self._written.clear()
+                self._written.update(pending)
+                self.stats['flushed'] += len(pending)
+                self.stats['flushes'] += 1
+        # bulk_update sends no signals, so refresh the in-process views here
+        for user_id, (lat, lng, _) in pending.items():
+            user_cache.invalidate(user_id)
+            if location_index.loaded:
+                location_index.move(user_id, lat, lng)
+        return len(pending)
+
+    def _write_one(self, user):
+        """Write one position; False when the row itself is unwritable and was dropped."""
+        try:
+            with transaction.atomic():
+                User.objects.filter(pk=user.pk).update(**{field: getattr(user, field) for field in LOCATION_FIELDS})
+        except BAD_ROW_ERRORS:
+            logger.exception("Dropping unwritable location ping for user %s", user.pk)
+            with self._lock:
+                self.stats['dropped'] += 1
+            return False
+        return True
+
+    def _ensure_timer(self):
+        if self._timer is None and self.flush_interval:
+            self._timer = threading.Thread(target=self._run_timer, name='location-buffer', daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+            finally:
+                close_old_connections()
+
+
+_location_buffer = None
+_location_buffer_lock = threading.Lock()
+
+
+def get_location_buffer():
+    global _location_buffer
+    if _location_buffer is None:
+        with _location_buffer_lock:
+            if _location_buffer is None:
+                _location_buffer = LocationBuffer(
+                    flush_interval=getattr(settings, 'LOCATION_FLUSH_INTERVAL', 2.0),
+                    max_pending=getattr(settings, 'LOCATION_FLUSH_SIZE', 500),
+                    min_distance_m=getattr(settings, 'LOCATION_MIN_MOVE_METERS', 5.0),
+                    history=get_history_buffer() if getattr(settings, 'LOCATION_HISTORY_ENABLED', True) else None,
+                )
+                atexit.register(_location_buffer.flush)
+                if _location_buffer.history is not None:
+                    atexit.register(_location_buffer.history.flush)
+    return _location_buffer
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.archive import run_archive
+
+
+class Command(BaseCommand):
+    help = 'Move old messages into compressed per-chat archive segments, once or on an interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=float, default=None,
+                            help='Defaults to MESSAGE_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--segment-size', type=int, default=None)
+        parser.add_argument('--chat', action='append', dest='chats', help='Only this chat id (repeatable)')
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between rounds; 0 runs once')
+
+    def handle(self, *args, **options):
+        older_than = options['older_than_days']
+        older_than = timedelta(days=older_than) if older_than is not None else None
+        while True:
+            result = run_archive(older_than=older_than, segment_size=options['segment_size'], chat_ids=options['chats'])
+            self.stdout.write(
+                f'Archived {result.messages} messages from {result.chats} chats in {result.seconds:.1f}s'
+            )
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
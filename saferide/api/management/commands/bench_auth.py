@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.authentication import CachedJWTAuthentication, user_cache
+from api.models import User
+from api.views import GetCurrentUserView
+
+class DatabaseJWTAuthentication(JWTAuthentication):
+    """Uncached baseline: one users-table lookup per request."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_model = User
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare p50 latency and queries per request with and without the cached user principal, '
+        'on a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        old_name = database.settings_dict['NAME']
+        database.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        for alias in connections:
+            # Replicas read the seeded database, as under the test runner
+            if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                connections[alias].creation.set_as_test_mirror(database.settings_dict)
+        try:
+            self.run(options)
+        finally:
+            database.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        user = User.objects.create(
+            email='bench-auth@saferide.local', username='bench', city='Kigali', roleKey='rider'
+        )
+        token = str(RefreshToken.for_user(user).access_token)
+        factory = APIRequestFactory()
+
+        for label, authentication in (
+            ('JWTAuthentication (db)', DatabaseJWTAuthentication),
+            ('CachedJWTAuthentication', CachedJWTAuthentication),
+        ):
+            user_cache.clear()
+            view = GetCurrentUserView.as_view(authentication_classes=[authentication])
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(options['requests']):
+                    request = factory.get('/api/current-user/', HTTP_AUTHORIZATION=f'Bearer {token}')
+                    start = time.perf_counter()
+                    response = view(request)
+                    timings.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.data
+            timings.sort()
+            self.stdout.write(
+                f'{label:>24}: p50={statistics.median(timings) * 1000:.3f}ms '
+                f'p99={timings[int(len(timings) * 0.99) - 1] * 1000:.3f}ms '
+                f'queries/request={len(queries) / options["requests"]:.3f}'
+            )
@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.dispatch import assign_greedy, assign_optimal
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the dispatch assignment step on synthetic orders and drivers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--drivers', type=int, default=5000)
+        parser.add_argument('--optimal-size', type=int, default=250)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--max-km', type=float, default=10.0)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def points(self, rng, count):
+        # Kigali-sized metro area, roughly 40km x 40km
+        return np.column_stack((rng.uniform(-2.15, -1.75, count), rng.uniform(29.86, 30.26, count)))
+
+    def time_rounds(self, func, orders, drivers, max_km, rounds):
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            assignments = func(orders, drivers, max_km)
+            timings.append(time.perf_counter() - start)
+        return min(timings), assignments
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        max_km = options['max_km']
+
+        orders = self.points(rng, options['orders'])
+        drivers = self.points(rng, options['drivers'])
+        elapsed, assignments = self.time_rounds(assign_greedy, orders, drivers, max_km, options['rounds'])
+        self.stdout.write(
+            f"greedy  {options['orders']} x {options['drivers']}: {elapsed * 1000:.1f}ms/round "
+            f"({1 / elapsed:.1f} rounds/s), {len(assignments)} assigned, "
+            f"mean pickup {np.mean([km for _, _, km in assignments]):.2f}km"
+        )
+
+        size = options['optimal_size']
+        small_orders, small_drivers = orders[:size], drivers[:size]
+        for label, func in (('greedy ', assign_greedy), ('optimal', assign_optimal)):
+            elapsed, assignments = self.time_rounds(func, small_orders, small_drivers, max_km, options['rounds'])
+            self.stdout.write(
+                f"{label} {size} x {size}: {elapsed * 1000:.1f}ms/round, {len(assignments)} assigned, "
+                f"total pickup {sum(km for _, _, km in assignments):.1f}km"
+            )
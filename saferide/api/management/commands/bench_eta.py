@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.eta import PairCache, estimate, speed_bands
+from api.geo import haversine_km
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batch distance/ETA estimates against a per-pair Python loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=100000)
+        parser.add_argument('--loop-pairs', type=int, default=20000)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--cache-size', type=int, default=262144)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def points(self, rng, count):
+        # Kigali-sized metro area, roughly 40km x 40km
+        return np.column_stack((rng.uniform(-2.15, -1.75, count), rng.uniform(29.86, 30.26, count)))
+
+    def loop_estimate(self, origins, destinations):
+        """The same model, one pair at a time in plain Python."""
+        bands = speed_bands()
+        detour = getattr(settings, 'ETA_DETOUR_FACTOR', 1.3)
+        results = []
+        for (lat1, lng1), (lat2, lng2) in zip(origins, destinations):
+            km = haversine_km(lat1, lng1, lat2, lng2)
+            road_km = km * detour
+            seconds = 0.0
+            lower = 0.0
+            for upper, speed in bands:
+                top = road_km if upper is None else min(road_km, upper)
+                if top > lower:
+                    seconds += (top - lower) * 3600.0 / speed
+                if upper is None:
+                    break
+                lower = upper
+            results.append((km, seconds))
+        return results
+
+    def best_of(self, rounds, func):
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(
+            f'{label:<24} {count:>8} pairs {elapsed * 1000:>9.2f}ms {count / elapsed / 1e6:>8.2f}M pairs/s'
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        count = options['pairs']
+        origins = self.points(rng, count)
+        destinations = self.points(rng, count)
+
+        loop_count = min(options['loop_pairs'], count)
+        loop_origins = origins[:loop_count].tolist()
+        loop_destinations = destinations[:loop_count].tolist()
+        elapsed, expected = self.best_of(
+            1, lambda: self.loop_estimate(loop_origins, loop_destinations)
+        )
+        self.report('python loop', loop_count, elapsed)
+        loop_rate = loop_count / elapsed
+
+        elapsed, (km, seconds) = self.best_of(options['rounds'], lambda: estimate(origins, destinations))
+        self.report('vectorized', count, elapsed)
+        expected = np.array(expected)
+        # Estimates are computed from coordinates rounded to ~1m
+        self.stdout.write(
+            f'  {count / elapsed / loop_rate:.0f}x the loop; max difference '
+            f'{np.abs(km[:loop_count] - expected[:, 0]).max() * 1000:.2f}m, '
+            f'{np.abs(seconds[:loop_count] - expected[:, 1]).max():.2f}s'
+        )
+
+        elapsed, _ = self.best_of(options['rounds'], lambda: estimate(origins[:1], destinations))
+        self.report('one origin vs many', count, elapsed)
+
+        cache = PairCache(options['cache_size'])
+        elapsed, _ = self.best_of(1, lambda: estimate(origins, destinations, cache))
+        self.report('cached, cold', count, elapsed)
+        cache.stats = {'hits': 0, 'misses': 0}
+        elapsed, _ = self.best_of(options['rounds'], lambda: estimate(origins, destinations, cache))
+        lookups = cache.stats['hits'] + cache.stats['misses']
+        self.report('cached, repeated pairs', count, elapsed)
+        self.stdout.write(f"  hit rate {cache.stats['hits'] / lookups:.1%} with {cache.size} slots")
@@ -0,0 +1,91 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.geo import CellIndex, cell_for, haversine_km
+from api.locations import nearby_users
+from api.models import User
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database with users and benchmark nearby-user lookups: '
+        'full table scan vs. grid cell index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--radius', type=float, default=3.0)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        old_name = database.settings_dict['NAME']
+        database.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        for alias in connections:
+            # Replicas read the seeded database, as under the test runner
+            if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                connections[alias].creation.set_as_test_mirror(database.settings_dict)
+        try:
+            self.run(options)
+        finally:
+            database.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+        # Kigali-sized metro area, roughly 40km x 40km
+        center_lat, center_lng = -1.95, 30.06
+
+        def point():
+            return center_lat + rng.uniform(-0.2, 0.2), center_lng + rng.uniform(-0.2, 0.2)
+
+        self.stdout.write(f"Seeding {options['users']} users...")
+        password = make_password('bench-password')
+        users = []
+        for i in range(options['users']):
+            lat, lng = point()
+            users.append(User(
+                email=f'user{i}@bench-nearby.saferide.local', username=f'user{i}', password=password,
+                city='Kigali', roleKey=rng.choice(['driver', 'rider']),
+                latitude=lat, longitude=lng, geocell=cell_for(lat, lng),
+            ))
+        User.objects.bulk_create(users, batch_size=2000)
+        queries = [point() for _ in range(options['queries'])]
+
+        def full_scan(lat, lng):
+            hits = []
+            for user in User.objects.all():
+                if user.latitude is None or user.longitude is None:
+                    continue
+                if user.roleKey == 'driver' and haversine_km(lat, lng, user.latitude, user.longitude) <= radius:
+                    hits.append(user)
+            return hits
+
+        def indexed(lat, lng):
+            return nearby_users(lat, lng, radius, role_key='driver', limit=10 ** 9)
+
+        index = CellIndex()
+        index.load(User.objects.exclude(geocell=None).values_list('id', 'latitude', 'longitude', 'roleKey'))
+
+        def in_memory(lat, lng):
+            return index.nearby(lat, lng, radius, role_key='driver')
+
+        scan_queries = queries[:max(1, len(queries) // 10)]
+        for label, func, sample in (
+            ('full table scan', full_scan, scan_queries),
+            ('geocell db index', indexed, queries),
+            ('in-process cell index', in_memory, queries),
+        ):
+            start = time.perf_counter()
+            found = 0
+            for lat, lng in sample:
+                found += len(func(lat, lng))
+            elapsed = (time.perf_counter() - start) / len(sample)
+            self.stdout.write(
+                f'{label:>22}: {elapsed * 1000:9.2f} ms/query '
+                f'({found / len(sample):.0f} drivers within {radius}km on average)'
+            )
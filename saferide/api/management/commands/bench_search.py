@@ -0,0 +1,140 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import Chat, ChatMember, Message, User
+from api.search import search_messages, search_users
+
+SYLLABLES = ['ka', 'mi', 'ro', 'nye', 'za', 'bu', 'ki', 'ga', 'li', 'mu', 'sho', 'te', 'ra', 'ndi', 'we', 'yo']
+CITIES = ['Kigali', 'Huye', 'Musanze', 'Rubavu', 'Nyagatare', 'Rusizi', 'Muhanga', 'Karongi']
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway test database and benchmark indexed user and message search against icontains scans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--chats', type=int, default=5000)
+        parser.add_argument('--vocabulary', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=30)
+        parser.add_argument('--scan-queries', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def words(self, rng, count):
+        words = set()
+        while len(words) < count:
+            words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+        return sorted(words, key=lambda word: (len(word), word))
+
+    def seed(self, rng, vocabulary, options):
+        password = make_password('bench-password')
+        users = User.objects.bulk_create([
+            User(
+                email=f'{rng.choice(vocabulary)}.{i}@bench-search.saferide.local',
+                username=f'{rng.choice(vocabulary).title()} {rng.choice(vocabulary).title()}',
+                password=password, city=rng.choice(CITIES), roleKey=rng.choice(['driver', 'rider']),
+                phone=f'+2507{rng.randrange(10 ** 8):08d}',
+            )
+            for i in range(options['users'])
+        ], batch_size=2000)
+        chats = Chat.objects.bulk_create([
+            Chat(members=[str(users[2 * i % len(users)].pk), str(users[(2 * i + 1) % len(users)].pk)])
+            for i in range(options['chats'])
+        ], batch_size=2000)
+        ChatMember.objects.bulk_create([
+            ChatMember(chat=chat, user_id=member) for chat in chats for member in chat.members
+        ], batch_size=2000)
+
+        # Zipf-distributed words, so a few are in most messages and most in very few
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        started = time.perf_counter()
+        base = timezone.now() - timedelta(days=30)
+        batch = 10000
+        for start in range(0, options['messages'], batch):
+            Message.objects.bulk_create([
+                Message(
+                    chat=chats[i % len(chats)], sender=users[2 * (i % len(chats)) % len(users)],
+                    text=' '.join(rng.choices(vocabulary, weights, k=rng.randint(3, 15))),
+                    created_at=base + timedelta(seconds=i),
+                )
+                for i in range(start, min(start + batch, options['messages']))
+            ], batch_size=2000)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Seeded {options['messages']} messages in {elapsed:.1f}s "
+            f"({options['messages'] / elapsed:.0f}/s, search index maintained on insert)"
+        )
+        return chats
+
+    def measure(self, label, func, queries):
+        timings = []
+        found = 0
+        for query in queries:
+            start = time.perf_counter()
+            found += len(func(query))
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f'{label:<36} p50 {statistics.median(timings) * 1000:9.2f}ms  p95 {p95 * 1000:9.2f}ms  '
+            f'{found / len(queries):6.1f} hits/query'
+        )
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        old_name = database.settings_dict['NAME']
+        database.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        for alias in connections:
+            # Replicas read the seeded database, as under the test runner
+            if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                connections[alias].creation.set_as_test_mirror(database.settings_dict)
+        try:
+            self.run(options)
+        finally:
+            database.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        vocabulary = self.words(rng, options['vocabulary'])
+        self.stdout.write(f'Seeding on {connection.vendor}...')
+        chats = self.seed(rng, vocabulary, options)
+        count = options['queries']
+        scans = options['scan_queries']
+        common = vocabulary[:count]
+        rare = vocabulary[-count:]
+        prefixes = [word[:3] for word in rng.sample(vocabulary[100:], count)]
+        pairs = [f'{rng.choice(vocabulary[:200])} {rng.choice(vocabulary[:200])}' for _ in range(count)]
+        names = [rng.choice(vocabulary) for _ in range(count)]
+        chat_id = chats[0].pk
+        user_id = chats[0].members[0]
+
+        def message_scan(query):
+            return list(
+                Message.objects.filter(text__icontains=query).order_by('-created_at').values_list('id', flat=True)[:20]
+            )
+
+        def user_scan(query):
+            fields = Q(username__icontains=query) | Q(email__icontains=query)
+            fields |= Q(phone__icontains=query) | Q(city__icontains=query)
+            return list(User.objects.filter(fields).order_by('-created_at').values_list('id', flat=True)[:20])
+
+        for label, func, sample in (
+            ('messages, icontains scan', message_scan, rare[:scans]),
+            ('messages, rare word', search_messages, rare),
+            ('messages, common word', search_messages, common),
+            ('messages, prefix', search_messages, prefixes),
+            ('messages, two words', search_messages, pairs),
+            ('messages, common word in a chat', lambda query: search_messages(query, chat_id=chat_id), common),
+            ("messages, common word, user's chats", lambda query: search_messages(query, user_id=user_id), common),
+            ('users, icontains scan', user_scan, names[:scans]),
+            ('users, name', search_users, names),
+        ):
+            self.measure(label, func, sample)
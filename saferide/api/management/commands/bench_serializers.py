@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.renderers import JSONRenderer
+
+from api.fast_serializers import FastListSerializer
+from api.models import Chat, Message, Order, User
+from api.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from api.serializers import MessageSerializer, OrderSerializer
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and compare DRF serializers against the fast list path, '
+        'and JSON against orjson and MessagePack rendering.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def seed(self, rows):
+        user = User.objects.create(
+            email='bench-serializers@saferide.local', username='bench', city='Kigali', roleKey='rider'
+        )
+        chat = Chat.objects.create(members=[str(user.id)])
+        Message.objects.bulk_create(
+            [Message(chat=chat, sender=user, text=f'Bench message {i}') for i in range(rows)],
+            batch_size=1000,
+        )
+        Order.objects.bulk_create(
+            [Order(sender=user, senderName=user.username, origin=f'Origin {i}', destination=f'Destination {i}')
+             for i in range(rows)],
+            batch_size=1000,
+        )
+        return (
+            Message.objects.filter(chat=chat).order_by('created_at', 'pk'),
+            Order.objects.filter(sender=user).order_by('created_at', 'pk'),
+        )
+
+    def best_of(self, rounds, func):
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        old_name = database.settings_dict['NAME']
+        database.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        for alias in connections:
+            # Replicas read the seeded database, as under the test runner
+            if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                connections[alias].creation.set_as_test_mirror(database.settings_dict)
+        try:
+            self.run(options)
+        finally:
+            database.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rows, rounds = options['rows'], options['rounds']
+        messages, orders = self.seed(rows)
+
+        payloads = {}
+        for label, serializer_class, queryset in (
+            ('messages', MessageSerializer, messages),
+            ('orders', OrderSerializer, orders),
+        ):
+            fast = FastListSerializer(serializer_class)
+            drf_time, expected = self.best_of(rounds, lambda: serializer_class(list(queryset), many=True).data)
+            fast_time, data = self.best_of(rounds, lambda: fast.serialize(queryset))
+            # Related keys are UUID objects in DRF's output and strings here; compare rendered bodies
+            if JSONRenderer().render(expected) != JSONRenderer().render(data):
+                raise AssertionError(f'Fast {label} output differs from {serializer_class.__name__}')
+            payloads[label] = data
+            self.stdout.write(
+                f'{label:>8} x {len(data)}: ModelSerializer {drf_time * 1000:.1f}ms, '
+                f'fast path {fast_time * 1000:.1f}ms ({drf_time / fast_time:.1f}x), output identical'
+            )
+
+        renderers = [
+            ('json', JSONRenderer()),
+            ('orjson', FastJSONRenderer() if orjson is not None else None),
+            ('msgpack', MessagePackRenderer() if msgpack is not None else None),
+        ]
+        for label, data in payloads.items():
+            for name, renderer in renderers:
+                if renderer is None:
+                    self.stdout.write(f'{label:>8} {name:>8}: not installed')
+                    continue
+                elapsed, body = self.best_of(rounds, lambda: renderer.render(data))
+                self.stdout.write(f'{label:>8} {name:>8}: {elapsed * 1000:.1f}ms, {len(body) / 1024:.0f} KiB')
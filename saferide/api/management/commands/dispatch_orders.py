@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.dispatch import run_dispatch
+
+
+class Command(BaseCommand):
+    help = 'Assign queued orders to nearby available drivers, once or on an interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between rounds; 0 runs once')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--mode', choices=['auto', 'greedy', 'optimal'], default='auto')
+
+    def handle(self, *args, **options):
+        while True:
+            result = run_dispatch(batch_size=options['batch_size'], mode=options['mode'])
+            self.stdout.write(
+                f'{result.mode}: assigned {result.assigned} of {result.orders} orders '
+                f'to {result.drivers} drivers in {result.seconds * 1000:.1f}ms'
+            )
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,116 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import loadtest
+from api.locations import get_location_buffer
+from api.rollups import get_rollup_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and drive every route in api/urls.py, reporting '
+        'latency percentiles, throughput and queries per request against loadtest_budgets.json.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--chats', type=int, default=1000)
+        parser.add_argument('--messages', type=int, default=50000)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per route')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per route')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--routes', nargs='*', help='Only these route names')
+        parser.add_argument('--latency-scale', type=float, default=1.0,
+                            help='Multiply latency budgets by this (0 disables latency checks)')
+        parser.add_argument('--write-budgets', action='store_true',
+                            help='Record this run as the new budgets instead of checking')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the seeded test database')
+
+    def handle(self, *args, **options):
+        if not options['write_budgets'] and not loadtest.load_budgets():
+            raise CommandError(
+                f'{loadtest.BUDGETS_PATH.name} has no budgets for {connection.vendor}; '
+                f'record them on a reference machine with --write-budgets'
+            )
+        settings_dict = connection.settings_dict
+        if connection.vendor == 'sqlite':
+            if not settings_dict['TEST'].get('NAME'):
+                # Worker threads need a shared on-disk database, not per-connection memory
+                settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'saferide_loadtest.sqlite3')
+            # Workers and the background flush threads write concurrently. A deferred
+            # transaction that later writes fails at once with "database is locked";
+            # an immediate one waits its turn for up to the timeout
+            settings_dict['OPTIONS'].setdefault('transaction_mode', 'IMMEDIATE')
+            settings_dict['OPTIONS'].setdefault('timeout', 30)
+        old_name = settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        for alias in connections:
+            # Replicas read the seeded database, as under the test runner
+            if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                connections[alias].creation.set_as_test_mirror(settings_dict)
+        # The test client sends Host: testserver, which ALLOWED_HOSTS only accepts under the test environment
+        setup_test_environment()
+        try:
+            self.run(options)
+        finally:
+            teardown_test_environment()
+            buffer = get_location_buffer()
+            buffer.flush()
+            if buffer.history is not None:
+                buffer.history.flush()
+            get_rollup_buffer().flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def run(self, options):
+        if loadtest.seed(options['users'], options['chats'], options['messages'], options['orders']):
+            self.stdout.write(
+                f"Seeded {options['users']} users, {options['chats']} chats, "
+                f"{options['messages']} messages, {options['orders']} orders ({connection.vendor})"
+            )
+        fixtures = loadtest.load_fixtures()
+
+        names = loadtest.route_names()
+        if options['routes']:
+            unknown = set(options['routes']) - set(names)
+            if unknown:
+                raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+            names = [name for name in names if name in options['routes']]
+
+        missing = [name for name in names if name not in loadtest.SCENARIOS]
+        results = []
+        self.stdout.write(
+            f"{'route':<16} {'method':<6} {'reqs':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'req/s':>8} {'q/req':>6} {'q max':>5}"
+        )
+        for name in names:
+            if name in missing:
+                continue
+            result = loadtest.run_route(
+                name, loadtest.SCENARIOS[name], fixtures,
+                options['requests'], options['concurrency'], options['warmup'],
+            )
+            results.append(result)
+            if result.skipped:
+                self.stdout.write(f'{name:<16} {result.method:<6} skipped: {result.skipped}')
+                continue
+            self.stdout.write(
+                f'{name:<16} {result.method:<6} {result.requests:>5} {result.errors + result.exceptions:>4} '
+                f'{result.latency_ms(0.5):>8.2f} {result.latency_ms(0.95):>8.2f} {result.latency_ms(0.99):>8.2f} '
+                f'{result.throughput:>8.1f} {result.mean_queries:>6.2f} {result.max_queries:>5}'
+            )
+
+        if options['write_budgets']:
+            loadtest.write_budgets(results)
+            self.stdout.write(f'Wrote {loadtest.BUDGETS_PATH}')
+            return
+
+        violations = [f'{name}: no load-test scenario' for name in missing]
+        violations += loadtest.check_budgets(results, loadtest.load_budgets(), options['latency_scale'])
+        if violations:
+            raise CommandError('Budget check failed:\n  ' + '\n  '.join(violations))
+        self.stdout.write(self.style.SUCCESS('All routes within budget'))
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import User
+from api.realtime import get_fanout, publish_to_users, websocket_application
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database with users, open many in-process WebSocket connections '
+        'against the realtime endpoint and measure memory per connection and publish-to-delivery latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=10000)
+        parser.add_argument('--events', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--connect-timeout', type=float, default=120.0,
+                            help='Seconds to wait for every connection to be accepted')
+
+    def handle(self, *args, **options):
+        database = connections[DEFAULT_DB_ALIAS]
+        old_name = database.settings_dict['NAME']
+        database.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        for alias in connections:
+            # Replicas read the seeded database, as under the test runner
+            if connections[alias].settings_dict['TEST'].get('MIRROR') == DEFAULT_DB_ALIAS:
+                connections[alias].creation.set_as_test_mirror(database.settings_dict)
+        try:
+            # Connections authenticate against the users table, so every token needs a real user
+            users = [
+                User(email=f'user{i}@loadtest.saferide.local', username=f'ws-user{i}', password=make_password(None),
+                     city='Kigali', roleKey='rider')
+                for i in range(options['connections'])
+            ]
+            User.objects.bulk_create(users, batch_size=2000)
+            asyncio.run(self.run_and_disconnect(options, users))
+        finally:
+            database.creation.destroy_test_db(old_name, verbosity=0)
+
+    async def run_and_disconnect(self, options, users):
+        try:
+            await self.run(options, users)
+        finally:
+            # Tokens were checked on sync_to_async's thread, whose connection
+            # would keep the test database from being dropped
+            await sync_to_async(connections.close_all)()
+
+    async def run(self, options, users):
+        rng = random.Random(options['seed'])
+        count = len(users)
+        user_ids = [str(user.pk) for user in users]
+        latencies = []
+        accepted = rejected = 0
+        delivered = asyncio.Event()
+        remaining = [options['events']]
+
+        def connection(user):
+            token = AccessToken.for_user(user)
+            scope = {'type': 'websocket', 'path': '/ws/events', 'query_string': f'token={token}'.encode()}
+            inbox = asyncio.Queue()
+            inbox.put_nowait({'type': 'websocket.connect'})
+
+            async def send(message):
+                nonlocal accepted, rejected
+                if message['type'] == 'websocket.accept':
+                    accepted += 1
+                elif message['type'] == 'websocket.close':
+                    rejected += 1
+                elif message['type'] == 'websocket.send':
+                    sent_at = json.loads(message['text'])['data']['sent_at']
+                    latencies.append(time.perf_counter() - sent_at)
+                    remaining[0] -= 1
+                    if remaining[0] == 0:
+                        delivered.set()
+
+            return inbox, asyncio.ensure_future(websocket_application(scope, inbox.get, send))
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        connections = [connection(user) for user in users]
+        deadline = start + options['connect_timeout']
+        while accepted < count and not rejected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        if accepted < count:
+            tracemalloc.stop()
+            message = f'{accepted} of {count} connections accepted, {rejected} refused'
+            if not rejected:
+                message += f" after {options['connect_timeout']:g}s"
+            await self.close(connections)
+            raise CommandError(message)
+        connect_time = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+        self.stdout.write(
+            f'{count} connections open in {connect_time:.2f}s, '
+            f'{memory / count / 1024:.1f} KiB/connection, '
+            f'{get_fanout().subscriber_count()} subscriptions'
+        )
+
+        # Publish from a worker thread, as a sync Django view would
+        loop = asyncio.get_running_loop()
+        targets = [rng.choice(user_ids) for _ in range(options['events'])]
+
+        def publish_all():
+            for user_id in targets:
+                publish_to_users([user_id], 'message.created', {'sent_at': time.perf_counter()})
+
+        start = time.perf_counter()
+        await loop.run_in_executor(None, publish_all)
+        await asyncio.wait_for(delivered.wait(), timeout=120)
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        self.stdout.write(
+            f'{len(latencies)} events delivered in {elapsed:.2f}s '
+            f'({len(latencies) / elapsed:.0f} events/s), latency '
+            f'p50={statistics.median(latencies) * 1000:.2f}ms '
+            f'p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms'
+        )
+
+        await self.close(connections)
+
+    async def close(self, connections):
+        for inbox, _ in connections:
+            inbox.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.gather(*(task for _, task in connections))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.purge import run_purge
+
+
+class Command(BaseCommand):
+    help = "Remove soft-deleted users' orders, messages and other rows in batches, once or on an interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Defaults to USER_PURGE_BATCH_SIZE')
+        parser.add_argument('--user', action='append', dest='users', help='Only this user id (repeatable)')
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between rounds; 0 runs once')
+
+    def handle(self, *args, **options):
+        while True:
+            result = run_purge(batch_size=options['batch_size'], user_ids=options['users'])
+            self.stdout.write(f'Purged {result.rows} rows of {result.users} deleted users in {result.seconds:.1f}s')
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.rollups import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stats rollups from the orders, messages and users tables, once or on an interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=None, help='Defaults to ROLLUP_RECONCILE_HOURS')
+        parser.add_argument('--all', action='store_true', dest='full', help='Recompute every hour of history')
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between rounds; 0 runs once')
+
+    def handle(self, *args, **options):
+        while True:
+            result = reconcile(hours=options['hours'], full=options['full'])
+            since = 'all history' if result.since is None else f'{result.since:%Y-%m-%d %H:00} UTC'
+            self.stdout.write(f'Rebuilt {result.rows} rollups since {since} in {result.seconds:.1f}s')
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Message
+from api.translation import get_translation_pool
+
+
+class Command(BaseCommand):
+    help = 'Translate messages left pending, e.g. after a worker restart.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry failed translations')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            Message.objects.filter(translation_status=Message.TRANSLATION_FAILED).update(
+                translation_status=Message.TRANSLATION_PENDING
+            )
+
+        pool = get_translation_pool()
+        translated = 0
+        seen = 0
+        while True:
+            # process() moves every message it sees to done or failed
+            batch = list(
+                Message.objects.filter(translation_status=Message.TRANSLATION_PENDING)
+                .order_by('created_at').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            translated += pool.process(batch)
+            seen += len(batch)
+        self.stdout.write(f'Translated {translated} of {seen} pending messages')
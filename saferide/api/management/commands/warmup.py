@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.startup import cold_start, import_profile, warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the startup warmup and report each step, profile the imports of a cold start, '
+        'or check a fresh process starts within COLD_START_MAX_SECONDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, nargs='?', const=25, default=None, metavar='N',
+                            help='List the N slowest packages and modules a fresh process imports')
+        parser.add_argument('--check', action='store_true',
+                            help='Fail if a fresh process takes longer than COLD_START_MAX_SECONDS')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes to time for --check; best counts')
+        parser.add_argument('--max-seconds', type=float, default=None, help='Defaults to COLD_START_MAX_SECONDS')
+
+    def report_steps(self, steps, errors):
+        for name, seconds in steps.items():
+            self.stdout.write(f'  {name:<16} {seconds * 1000:>8.1f}ms')
+        for name, error in errors.items():
+            self.stdout.write(self.style.ERROR(f'  {name:<16} failed: {error}'))
+
+    def profile(self, count):
+        modules = import_profile()
+        packages = defaultdict(float)
+        for name, own, _, _ in modules:
+            packages[name.split('.')[0]] += own
+        self.stdout.write(f'{len(modules)} modules, {sum(packages.values()) * 1000:.0f}ms importing')
+        self.stdout.write('Slowest packages (own import time of all their modules):')
+        for name, seconds in sorted(packages.items(), key=lambda item: -item[1])[:count]:
+            self.stdout.write(f'  {name:<40} {seconds * 1000:>8.1f}ms')
+        self.stdout.write('Slowest modules (including what they import):')
+        # Only modules the project imports directly or one level down, so parents and children are not listed twice
+        top = [module for module in modules if module[3] <= 1]
+        for name, _, cumulative, _ in sorted(top, key=lambda module: -module[2])[:count]:
+            self.stdout.write(f'  {name:<40} {cumulative * 1000:>8.1f}ms')
+
+    def check_cold_start(self, runs, limit):
+        timings = []
+        for _ in range(max(1, runs)):
+            elapsed, report = cold_start()
+            if report['errors']:
+                self.report_steps(report['steps'], report['errors'])
+                raise CommandError('Warmup failed in a fresh process')
+            timings.append((elapsed, report))
+        elapsed, report = min(timings, key=lambda timing: timing[0])
+        self.stdout.write(f"Cold start {elapsed:.2f}s (Django setup {report['setup'] * 1000:.1f}ms, then):")
+        self.report_steps(report['steps'], {})
+        if elapsed > limit:
+            raise CommandError(f'Cold start took {elapsed:.2f}s, budget {limit:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Cold start within {limit:.2f}s'))
+
+    def handle(self, *args, **options):
+        if options['profile'] is not None:
+            self.profile(options['profile'])
+        if options['check']:
+            limit = options['max_seconds']
+            if limit is None:
+                limit = getattr(settings, 'COLD_START_MAX_SECONDS', 3.0)
+            self.check_cold_start(options['runs'], limit)
+        if options['profile'] is None and not options['check']:
+            warmup.run()
+            self.stdout.write('Warmed up:' if warmup.ready else 'Warmup incomplete:')
+            self.report_steps(warmup.timings, warmup.errors)
+            if not warmup.ready:
+                raise CommandError('Warmup failed')
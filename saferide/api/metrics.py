@@ -0,0 +1,254 @@
+"""Per-request performance instrumentation.
+
+RequestMetricsMiddleware times every request into per-view latency
+histograms. Sampled requests (METRICS_SAMPLE_RATE) are also broken down into
+database, serialization, external-call and password-hashing time, reported in
+a ``Server-Timing`` header and in their own histograms. Everything is exposed
+in the Prometheus text format by ``metrics_view``, together with the
+translation cache's hit and miss counters.
+
+Code attributes time to the current request with ``with timed('serialize'):``;
+outside a sampled request that is a no-op. Histograms are per process.
+"""
+import bisect
+import contextvars
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+BREAKDOWN = ('db', 'serialize', 'external', 'hashing')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Time spent per BREAKDOWN kind during one request."""
+    __slots__ = ('db', 'serialize', 'external', 'hashing', 'db_queries', 'active')
+
+    def __init__(self):
+        self.db = self.serialize = self.external = self.hashing = 0.0
+        self.db_queries = 0
+        self.active = set()
+
+    def server_timing(self, total):
+        parts = [f'db;dur={self.db * 1000:.1f};desc="{self.db_queries} queries"']
+        for kind in BREAKDOWN[1:]:
+            value = getattr(self, kind)
+            if value:
+                parts.append(f'{kind};dur={value * 1000:.1f}')
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+class timed:
+    """Context manager adding the enclosed time to the current request's ``kind``.
+
+    Nested blocks of the same kind count once, so serializers that call each
+    other are not double counted.
+    """
+    __slots__ = ('kind', 'timings', 'start')
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __enter__(self):
+        timings = _current.get()
+        if timings is None or self.kind in timings.active:
+            self.timings = None
+        else:
+            timings.active.add(self.kind)
+            self.timings = timings
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            setattr(self.timings, self.kind, getattr(self.timings, self.kind) + time.perf_counter() - self.start)
+            self.timings.active.discard(self.kind)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper installed on every connection (see api.signals)."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.db_queries += 1
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+
+    def observe(self, label_values, value):
+        # Callers hold the registry lock
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total) in sorted(self._series.items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = Histogram(
+            'saferide_request_duration_seconds', 'Request latency by view.', LATENCY_BUCKETS, ('view', 'method')
+        )
+        self.breakdown = {
+            kind: Histogram(
+                f'saferide_request_{kind}_seconds', f'Per-request {kind} time by view (sampled requests).',
+                LATENCY_BUCKETS, ('view', 'method')
+            )
+            for kind in BREAKDOWN
+        }
+        self.queries = Histogram(
+            'saferide_request_db_queries', 'Database queries per request by view (sampled requests).',
+            QUERY_BUCKETS, ('view', 'method')
+        )
+
+    def observe(self, view, method, status_code, elapsed, timings=None):
+        labels = (view, method)
+        with self._lock:
+            key = (view, method, str(status_code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe(labels, elapsed)
+            if timings is not None:
+                for kind, histogram in self.breakdown.items():
+                    histogram.observe(labels, getattr(timings, kind))
+                self.queries.observe(labels, timings.db_queries)
+
+    def render(self):
+        with self._lock:
+            lines = ['# HELP saferide_requests_total Requests by view, method and status.',
+                     '# TYPE saferide_requests_total counter']
+            for (view, method, status_code), count in sorted(self.requests.items()):
+                lines.append(
+                    f'saferide_requests_total{{view="{_escape(view)}",method="{method}",status="{status_code}"}} {count}'
+                )
+            for histogram in (self.latency, *self.breakdown.values(), self.queries):
+                lines.extend(histogram.render())
+        lines.extend(_translation_cache_lines())
+        return '\n'.join(lines) + '\n'
+
+
+def _translation_cache_lines():
+    # api.translation imports this module for `timed`
+    from .translation import translation_cache_stats
+
+    stats = translation_cache_stats()
+    return [
+        '# HELP saferide_translation_cache_hits_total Translations served from the cache, by tier.',
+        '# TYPE saferide_translation_cache_hits_total counter',
+        f'saferide_translation_cache_hits_total{{tier="memory"}} {stats["hits"]}',
+        f'saferide_translation_cache_hits_total{{tier="db"}} {stats["db_hits"]}',
+        '# HELP saferide_translation_cache_misses_total Translations sent to the translation backend.',
+        '# TYPE saferide_translation_cache_misses_total counter',
+        f'saferide_translation_cache_misses_total {stats["misses"]}',
+    ]
+
+
+registry = MetricsRegistry()
+
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.view_name
+
+
+class RequestMetricsMiddleware:
+    # Async-capable, so under ASGI async views are not pushed through a thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', True)
+
+    def _start(self):
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        return RequestTimings() if sampled else None
+
+    def _finish(self, request, response, timings, elapsed):
+        registry.observe(_view_label(request), request.method, response.status_code, elapsed, timings)
+        if timings is not None and self.server_timing:
+            response['Server-Timing'] = timings.server_timing(elapsed)
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = self._start()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = self._start()
+        # Sync code below runs through sync_to_async, which carries this context over
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires ``Authorization: Bearer <METRICS_TOKEN>`` when set."""
+    expected = getattr(settings, 'METRICS_TOKEN', None)
+    if expected:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not constant_time_compare(supplied, expected):
+            return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
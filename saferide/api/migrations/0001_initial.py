@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:18
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chat',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('members', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'chats',
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=60)),
+                ('email', models.EmailField(max_length=200, unique=True)),
+                ('password', models.CharField(max_length=1024)),
+                ('city', models.CharField(max_length=60)),
+                ('roleKey', models.CharField(max_length=60)),
+                ('phone', models.CharField(blank=True, max_length=60, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'users',
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('senderName', models.CharField(max_length=255)),
+                ('receiverName', models.CharField(blank=True, max_length=255, null=True)),
+                ('origin', models.CharField(max_length=255)),
+                ('destination', models.CharField(max_length=255)),
+                ('isComplete', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_orders', to='api.user')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_orders', to='api.user')),
+            ],
+            options={
+                'db_table': 'orders',
+            },
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='api.chat')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.user')),
+            ],
+            options={
+                'db_table': 'messages',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:18
+
+from django.db import migrations, models
+
+from api.geo import cell_for
+
+
+def backfill_geocell(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    users = list(
+        User.objects.exclude(latitude=None).exclude(longitude=None).only('id', 'latitude', 'longitude')
+    )
+    for user in users:
+        user.geocell = cell_for(user.latitude, user.longitude)
+    User.objects.bulk_update(users, ['geocell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='geocell',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['geocell', 'roleKey'], name='users_geocell_role_idx'),
+        ),
+        migrations.RunPython(backfill_geocell, migrations.RunPython.noop),
+    ]
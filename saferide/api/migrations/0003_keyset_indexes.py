@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_user_geocell'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['created_at', 'id'], name='chats_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'created_at', 'id'], name='messages_chat_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='orders_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='users_created_id_idx'),
+        ),
+    ]
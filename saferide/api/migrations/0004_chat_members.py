@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='pair_key',
+            field=models.CharField(blank=True, editable=False, max_length=73, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='ChatMember',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='api.chat')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_memberships', to='api.user')),
+            ],
+            options={
+                'db_table': 'chat_members',
+                'constraints': [models.UniqueConstraint(fields=('user', 'chat'), name='chat_members_user_chat_uniq')],
+            },
+        ),
+    ]
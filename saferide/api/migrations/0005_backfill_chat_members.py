@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:22
+
+import uuid
+
+from django.db import migrations
+
+
+def _user_ids(members):
+    ids = []
+    for member in members if isinstance(members, list) else []:
+        try:
+            ids.append(str(uuid.UUID(str(member))))
+        except ValueError:
+            continue
+    return ids
+
+
+def backfill_chat_members(apps, schema_editor):
+    Chat = apps.get_model('api', 'Chat')
+    ChatMember = apps.get_model('api', 'ChatMember')
+    User = apps.get_model('api', 'User')
+
+    known_users = {str(pk) for pk in User.objects.values_list('id', flat=True)}
+    seen_pairs = set()
+    memberships = []
+    keyed_chats = []
+    for chat in Chat.objects.order_by('created_at', 'id').iterator(chunk_size=2000):
+        member_ids = _user_ids(chat.members)
+        for user_id in dict.fromkeys(member_ids):
+            if user_id in known_users:
+                memberships.append(ChatMember(chat_id=chat.id, user_id=user_id))
+        if len(member_ids) == 2:
+            # Later duplicates of the same pair keep no key; the oldest chat wins
+            key = ':'.join(sorted(member_ids))
+            if key not in seen_pairs:
+                seen_pairs.add(key)
+                chat.pair_key = key
+                keyed_chats.append(chat)
+    ChatMember.objects.bulk_create(memberships, batch_size=2000, ignore_conflicts=True)
+    Chat.objects.bulk_update(keyed_chats, ['pair_key'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_chat_members'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_chat_members, migrations.RunPython.noop),
+    ]
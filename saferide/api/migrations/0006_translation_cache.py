@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_backfill_chat_members'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('target_language', models.CharField(max_length=16)),
+                ('translated_text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'translation_cache',
+                'constraints': [models.UniqueConstraint(fields=('text_hash', 'target_language'), name='translation_cache_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_translation_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='target_language',
+            field=models.CharField(default='en', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='translated_text',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='translation_status',
+            field=models.CharField(choices=[('not_required', 'Not required'), ('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='not_required', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('translation_status', 'pending')), fields=['created_at'], name='messages_tr_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_message_translation_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['sender', 'isComplete', 'created_at', 'id'], name='orders_sender_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['receiver', 'isComplete', 'created_at', 'id'], name='orders_receiver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['isComplete', 'created_at', 'id'], name='orders_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['origin'], name='orders_origin_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['destination'], name='orders_destination_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
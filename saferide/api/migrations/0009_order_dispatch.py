@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_order_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='location_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='receiver',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_orders', to='api.user'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('isComplete', False), ('receiver__isnull', True)), fields=['created_at'], name='orders_dispatch_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['roleKey', 'location_updated_at'], name='users_role_located_idx'),
+        ),
+    ]
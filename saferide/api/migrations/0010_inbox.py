@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_inbox(apps, schema_editor):
+    Chat = apps.get_model('api', 'Chat')
+    ChatMember = apps.get_model('api', 'ChatMember')
+    Message = apps.get_model('api', 'Message')
+
+    latest = Message.objects.filter(chat_id=OuterRef('pk')).order_by('-created_at', '-id')
+    Chat.objects.update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_activity=Coalesce(Subquery(latest.values('created_at')[:1]), F('created_at')),
+    )
+    # Existing history counts as read; only 1:1 chats have a counterpart
+    other = ChatMember.objects.filter(chat_id=OuterRef('chat_id')).exclude(user_id=OuterRef('user_id'))
+    ChatMember.objects.filter(chat__pair_key__isnull=False).update(
+        counterpart=Subquery(other.values('user_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_order_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='counterpart',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.user'),
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('first_at', models.DateTimeField()),
+                ('last_at', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='api.chat')),
+            ],
+            options={
+                'db_table': 'message_archives',
+                'indexes': [models.Index(fields=['chat', 'first_at'], name='msg_archives_chat_first_idx')],
+            },
+        ),
+    ]
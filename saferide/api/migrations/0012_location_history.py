@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_message_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationChunk',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('window_start', models.DateTimeField()),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_chunks', to='api.user')),
+            ],
+            options={
+                'db_table': 'location_chunks',
+                'constraints': [models.UniqueConstraint(fields=('user', 'window_start'), name='location_chunks_user_win_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+from django.db import migrations
+
+from api.search import POSTGRES_DROP_INDEXES, POSTGRES_INDEXES, drop_sqlite_index, install_sqlite_index
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        for statement in POSTGRES_INDEXES:
+            schema_editor.execute(statement)
+    elif connection.vendor == 'sqlite':
+        install_sqlite_index(connection)
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        for statement in POSTGRES_DROP_INDEXES:
+            schema_editor.execute(statement)
+    elif connection.vendor == 'sqlite':
+        drop_sqlite_index(connection)
+
+
+class Migration(migrations.Migration):
+    # Postgres builds the indexes CONCURRENTLY, which cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0012_location_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
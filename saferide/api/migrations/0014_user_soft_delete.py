@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='UserPurge',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('user_id', models.UUIDField(unique=True)),
+                ('stage', models.CharField(max_length=16)),
+                ('position', models.BigIntegerField(default=0)),
+                ('removed', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'user_purges',
+                'indexes': [models.Index(condition=models.Q(('finished_at', None)), fields=['id'], name='user_purges_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_user_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rollup',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('metric', models.CharField(max_length=32)),
+                ('dimension', models.CharField(blank=True, default='', max_length=60)),
+                ('bucket', models.DateTimeField()),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'rollups',
+                'indexes': [models.Index(fields=['metric', 'bucket'], name='rollups_metric_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('metric', 'dimension', 'bucket'), name='rollups_metric_dim_bucket_uniq')],
+            },
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.hashers import make_password, check_password
+from django.utils import timezone
 import uuid
 
+from .geo import cell_for
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -18,6 +21,11 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', True)
         return self.create_user(email, password, **extra_fields)
 
+class ActiveUserManager(UserManager):
+    """Users that have not been soft-deleted (see api.purge)."""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at=None)
+
 class User(AbstractBaseUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     username = models.CharField(max_length=60)
@@ -28,13 +36,18 @@ class User(AbstractBaseUser):
     phone = models.CharField(max_length=60, blank=True, null=True)
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+    geocell = models.BigIntegerField(blank=True, null=True, editable=False)
+    location_updated_at = models.DateTimeField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set by soft_delete_user; the row is removed once api.purge has removed its dependents
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'city', 'roleKey']
     
-    objects = UserManager()
+    objects = ActiveUserManager()
+    all_objects = UserManager()
     
     def set_password(self, raw_password):
         self.password = make_password(raw_password)
@@ -42,33 +55,185 @@ class User(AbstractBaseUser):
     def check_password(self, raw_password):
         return check_password(raw_password, self.password)
     
+    def save(self, *args, **kwargs):
+        self.geocell = cell_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ({'latitude', 'longitude'} & set(update_fields)):
+            kwargs['update_fields'] = set(update_fields) | {'geocell'}
+        super().save(*args, **kwargs)
+    
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['geocell', 'roleKey'], name='users_geocell_role_idx'),
+            models.Index(fields=['created_at', 'id'], name='users_created_id_idx'),
+            models.Index(fields=['roleKey', 'location_updated_at'], name='users_role_located_idx'),
+        ]
+
+def direct_chat_key(first_id, second_id):
+    return ':'.join(sorted([str(first_id), str(second_id)]))
+
+class ChatManager(models.Manager):
+    def for_user(self, user_id):
+        return self.filter(memberships__user_id=user_id)
+    
+    def find_direct(self, first_id, second_id):
+        return self.filter(pair_key=direct_chat_key(first_id, second_id)).first()
+    
+    def get_or_create_direct(self, first_id, second_id):
+        key = direct_chat_key(first_id, second_id)
+        chat = self.filter(pair_key=key).first()
+        if chat:
+            return chat, False
+        try:
+            with transaction.atomic():
+                chat = self.create(members=[str(first_id), str(second_id)], pair_key=key)
+                ChatMember.objects.bulk_create([
+                    ChatMember(chat=chat, user_id=first_id, counterpart_id=second_id),
+                    ChatMember(chat=chat, user_id=second_id, counterpart_id=first_id),
+                ])
+            return chat, True
+        except IntegrityError:
+            # Lost a race with a concurrent create of the same pair
+            return self.get(pair_key=key), False
+    
+    def record_message(self, message):
+        """Update the inbox summary for a new message: last message and others' unread counts."""
+        self.record_messages([message])
+    
+    def record_messages(self, messages):
+        """record_message for many new messages, in two updates however many chats they span.
+
+        Messages spanning several chats must be recorded inside a transaction.
+        """
+        latest = {}
+        totals = {}
+        sent = {}
+        for message in messages:
+            current = latest.get(message.chat_id)
+            if current is None or (message.created_at, message.pk) > (current.created_at, current.pk):
+                latest[message.chat_id] = message
+            totals[message.chat_id] = totals.get(message.chat_id, 0) + 1
+            key = (message.chat_id, message.sender_id)
+            sent[key] = sent.get(key, 0) + 1
+        
+        if len(latest) > 1 and connections[self.db].features.has_select_for_update:
+            # Each UPDATE locks rows in its own scan order, so concurrent batches
+            # over the same chats could deadlock without taking them in key order
+            list(self.select_for_update().filter(pk__in=list(latest)).order_by('pk').values_list('pk', flat=True))
+        
+        # Guarded so a slower, older message cannot overwrite a newer one
+        activity = models.Case(*[
+            models.When(pk=chat_id, then=models.Value(message.created_at)) for chat_id, message in latest.items()
+        ])
+        self.filter(pk__in=list(latest), last_activity__lte=activity).update(
+            last_message=models.Case(*[
+                models.When(pk=chat_id, then=models.Value(message.pk)) for chat_id, message in latest.items()
+            ]),
+            last_activity=activity,
+        )
+        # Members gain every message except their own
+        ChatMember.objects.filter(chat_id__in=list(totals)).update(unread_count=models.F('unread_count') + models.Case(
+            *[models.When(chat_id=chat_id, user_id=sender_id, then=totals[chat_id] - count)
+              for (chat_id, sender_id), count in sent.items()],
+            *[models.When(chat_id=chat_id, then=total) for chat_id, total in totals.items()],
+        ))
 
 class Chat(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     members = models.JSONField()  # Store as list of user IDs
+    pair_key = models.CharField(max_length=73, unique=True, blank=True, null=True, editable=False)  # 1:1 chats only
+    # Denormalized for the inbox; maintained by AddMessageView
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, blank=True, null=True, editable=False, related_name='+'
+    )
+    last_activity = models.DateTimeField(default=timezone.now, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ChatManager()
+    
     class Meta:
         db_table = 'chats'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='chats_created_id_idx'),
+        ]
+
+class ChatMember(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_memberships')
+    # The other member of a 1:1 chat, so the inbox needs no second membership lookup
+    counterpart = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+'
+    )
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'chat_members'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'chat'], name='chat_members_user_chat_uniq'),
+        ]
 
 class Message(models.Model):
+    TRANSLATION_NOT_REQUIRED = 'not_required'
+    TRANSLATION_PENDING = 'pending'
+    TRANSLATION_DONE = 'done'
+    TRANSLATION_FAILED = 'failed'
+    TRANSLATION_STATUS_CHOICES = [
+        (TRANSLATION_NOT_REQUIRED, 'Not required'),
+        (TRANSLATION_PENDING, 'Pending'),
+        (TRANSLATION_DONE, 'Done'),
+        (TRANSLATION_FAILED, 'Failed'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
+    target_language = models.CharField(max_length=16, default='en')
+    translated_text = models.TextField(blank=True, null=True)
+    translation_status = models.CharField(
+        max_length=16, choices=TRANSLATION_STATUS_CHOICES, default=TRANSLATION_NOT_REQUIRED
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'messages'
+        indexes = [
+            models.Index(fields=['chat', 'created_at', 'id'], name='messages_chat_created_id_idx'),
+            models.Index(
+                fields=['created_at'], name='messages_tr_pending_idx',
+                condition=models.Q(translation_status='pending'),
+            ),
+        ]
+
+class MessageArchive(models.Model):
+    """A compressed run of a chat's oldest messages, moved out of `messages` (api.archive)."""
+    id = models.BigAutoField(primary_key=True)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='archives')
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'message_archives'
+        indexes = [
+            models.Index(fields=['chat', 'first_at'], name='msg_archives_chat_first_idx'),
+        ]
 
 class Order(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_orders')
-    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_orders')
+    receiver = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='received_orders', blank=True, null=True
+    )  # Unassigned until a driver is dispatched
     senderName = models.CharField(max_length=255)
     receiverName = models.CharField(max_length=255, blank=True, null=True)
     origin = models.CharField(max_length=255)
@@ -78,4 +243,84 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        db_table = 'orders'
\ No newline at end of file
+        db_table = 'orders'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='orders_created_id_idx'),
+            models.Index(fields=['sender', 'isComplete', 'created_at', 'id'], name='orders_sender_status_idx'),
+            models.Index(fields=['receiver', 'isComplete', 'created_at', 'id'], name='orders_receiver_status_idx'),
+            models.Index(fields=['isComplete', 'created_at', 'id'], name='orders_status_created_idx'),
+            # Pattern opclasses let Postgres use these for startswith (LIKE 'x%')
+            models.Index(fields=['origin'], name='orders_origin_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(
+                fields=['destination'], name='orders_destination_prefix_idx', opclasses=['varchar_pattern_ops']
+            ),
+            models.Index(
+                fields=['created_at'], name='orders_dispatch_queue_idx',
+                condition=models.Q(receiver__isnull=True, isComplete=False),
+            ),
+        ]
+
+class LocationChunk(models.Model):
+    """One user's location pings for one LOCATION_HISTORY_WINDOW, delta-encoded (api.history)."""
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='location_chunks')
+    window_start = models.DateTimeField()
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'location_chunks'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'window_start'], name='location_chunks_user_win_uniq'),
+        ]
+
+class UserPurge(models.Model):
+    """Progress of removing a soft-deleted user's data (api.purge); kept once finished."""
+    id = models.BigAutoField(primary_key=True)
+    user_id = models.UUIDField(unique=True)  # Not a ForeignKey: the user row goes before this does
+    stage = models.CharField(max_length=16)
+    # Archive segments are scanned in id order; the last one scanned
+    position = models.BigIntegerField(default=0)
+    removed = models.JSONField(default=dict)  # Rows removed so far, per stage
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'user_purges'
+        indexes = [
+            models.Index(fields=['id'], name='user_purges_pending_idx', condition=models.Q(finished_at=None)),
+        ]
+
+class Rollup(models.Model):
+    """One pre-aggregated counter: a metric for a dimension (a city, or '') in an hour (api.rollups)."""
+    id = models.BigAutoField(primary_key=True)
+    metric = models.CharField(max_length=32)
+    dimension = models.CharField(max_length=60, default='', blank=True)
+    bucket = models.DateTimeField()  # Start of the UTC hour; TOTAL_BUCKET for running totals
+    value = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'dimension', 'bucket'], name='rollups_metric_dim_bucket_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'bucket'], name='rollups_metric_bucket_idx'),
+        ]
+
+class TranslationCacheEntry(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    text_hash = models.CharField(max_length=64)  # sha256 of the source text
+    target_language = models.CharField(max_length=16)
+    translated_text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'translation_cache'
+        constraints = [
+            models.UniqueConstraint(fields=['text_hash', 'target_language'], name='translation_cache_key_uniq'),
+        ]
@@ -0,0 +1,190 @@
+import base64
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, pk_type=uuid.UUID):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(value), pk_type(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise NotFound('Invalid cursor')
+
+
+def encode_score_cursor(score, pk):
+    raw = f'{score!r}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_score_cursor(cursor, pk_type=uuid.UUID):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return float(score), pk_type(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise NotFound('Invalid cursor')
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination on (created_at, id).
+
+    ``?after=<cursor>`` returns rows newer than the cursor, ``?before=<cursor>``
+    rows older than it, so every page is a range scan on the matching
+    (created_at, id) index regardless of depth. Results are in ascending
+    order unless ``newest_first``. Subclasses may key on another datetime
+    ``cursor_field``.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'limit'
+    start_from_latest = False
+    cursor_field = 'created_at'
+    pk_type = uuid.UUID
+    newest_first = False
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_page_size(request)
+        after = request.query_params.get('after')
+        before = request.query_params.get('before')
+        self.after_cursor = after
+        self.before_cursor = before
+
+        field = self.cursor_field
+        bound = None
+        if before:
+            bound = value, pk = decode_cursor(before, self.pk_type)
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+            descending = True
+        elif after:
+            bound = value, pk = decode_cursor(after, self.pk_type)
+            queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            descending = False
+        else:
+            descending = self.start_from_latest
+
+        rows = self.fetch(queryset, bound, descending, limit + 1)
+        if descending:
+            self.has_previous = len(rows) > limit
+            self.has_next = bool(before)
+            rows = rows[:limit]
+            rows.reverse()
+        else:
+            self.has_next = len(rows) > limit
+            self.has_previous = bool(after)
+            rows = rows[:limit]
+
+        if rows:
+            self.before_cursor = encode_cursor(*self.cursor_values(rows[0]))
+            self.after_cursor = encode_cursor(*self.cursor_values(rows[-1]))
+        if self.newest_first:
+            rows.reverse()
+        return rows
+
+    def fetch(self, queryset, bound, descending, count):
+        """Up to ``count`` rows past the ``bound`` cursor (value, pk), nearest first.
+
+        ``queryset`` is already filtered to the far side of ``bound``.
+        """
+        field = self.cursor_field
+        ordering = (f'-{field}', '-pk') if descending else (field, 'pk')
+        return list(queryset.order_by(*ordering)[:count])
+
+    def cursor_values(self, row):
+        # Rows are model instances, or dicts on the .values() fast path
+        if isinstance(row, dict):
+            return row[self.cursor_field], row['id']
+        return getattr(row, self.cursor_field), row.pk
+
+    def _link(self, param, cursor):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'before' if param == 'after' else 'after')
+        return replace_query_param(url, param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link('after', self.after_cursor) if self.has_next else None,
+            'previous': self._link('before', self.before_cursor) if self.has_previous else None,
+            'before': self.before_cursor,
+            'after': self.after_cursor,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'before': {'type': 'string', 'nullable': True},
+                'after': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class LatestFirstKeysetPagination(KeysetPagination):
+    """Starts from the newest page, for chat history and infinite scroll."""
+    start_from_latest = True
+
+
+class InboxPagination(LatestFirstKeysetPagination):
+    """Chat memberships, most recently active chat first."""
+    cursor_field = 'chat__last_activity'
+    pk_type = int
+    newest_first = True
+
+    def cursor_values(self, row):
+        return row.chat.last_activity, row.pk
+
+
+class RankedPagination(BasePagination):
+    """Keyset pagination over ranked search hits, best first.
+
+    ``paginate(request, search)`` calls ``search(after, count)``, which returns
+    up to ``count`` (id, score) hits ordered by (score desc, id) past the
+    ``after`` (score, id) bound; ``?after=<cursor>`` continues from a page.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    pk_type = uuid.UUID
+
+    get_page_size = KeysetPagination.get_page_size
+
+    def paginate(self, request, search):
+        self.request = request
+        limit = self.get_page_size(request)
+        after = request.query_params.get('after')
+        hits = search(decode_score_cursor(after, self.pk_type) if after else None, limit + 1)
+        self.has_next = len(hits) > limit
+        hits = hits[:limit]
+        self.after_cursor = encode_score_cursor(hits[-1][1], hits[-1][0]) if hits else None
+        return hits
+
+    def get_paginated_response(self, data):
+        url = self.request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'after', self.after_cursor) if self.has_next else None,
+            'after': self.after_cursor,
+            'results': data,
+        })
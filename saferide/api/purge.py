@@ -0,0 +1,151 @@
+"""Deleting users without one huge cascading transaction.
+
+``soft_delete_user`` only marks the user deleted and queues a UserPurge, so
+the DELETE request returns at once. From then on the user is gone from every
+query through ``User.objects`` (and so from login, token auth, listings,
+search, nearby and dispatch). Their email is released right away so it can be
+registered again.
+
+``run_purge`` (`manage.py purge_users`) then removes what the user left
+behind in batches of USER_PURGE_BATCH_SIZE rows, one short transaction each:
+orders they sent or received, messages they sent, their messages inside
+archived segments of their chats (api.archive), their chat memberships, their
+location history, and finally the user row itself. Every batch records its
+progress on the UserPurge in the same transaction, so a purge interrupted at
+any point resumes where it stopped. Until it reaches them, a deleted user's
+orders and messages stay visible to the other party, as they were before.
+"""
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import decode_segment, encode_segment
+from .models import Chat, ChatMember, LocationChunk, Message, MessageArchive, Order, User, UserPurge
+
+STAGES = ['orders', 'messages', 'archives', 'memberships', 'counterparts', 'locations', 'user']
+# Segments hold up to MESSAGE_ARCHIVE_SEGMENT_SIZE messages, so they are scanned a few at a time
+SEGMENT_BATCH_SIZE = 20
+DELETED_EMAIL_DOMAIN = 'deleted.invalid'
+
+
+def purge_batch_size():
+    return getattr(settings, 'USER_PURGE_BATCH_SIZE', 1000)
+
+
+def soft_delete_user(user):
+    """Hide ``user`` from every query and queue the removal of their data."""
+    with transaction.atomic():
+        user.deleted_at = timezone.now()
+        user.email = f'{user.pk.hex}@{DELETED_EMAIL_DOMAIN}'
+        user.save(update_fields=['deleted_at', 'email', 'updated_at'])
+        UserPurge.objects.create(user_id=user.pk, stage=STAGES[0])
+
+
+def _delete_batch(queryset, batch_size):
+    """Delete up to ``batch_size`` rows of ``queryset``; (done, rows deleted)."""
+    ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+    if ids:
+        queryset.model.objects.filter(pk__in=ids).delete()
+    return len(ids) < batch_size, len(ids)
+
+
+def _purge_archives(purge, batch_size):
+    """Drop the user's messages from the next few archive segments of their chats."""
+    segments = list(
+        MessageArchive.objects.filter(chat__memberships__user_id=purge.user_id, pk__gt=purge.position)
+        .order_by('pk').values_list('pk', 'chat_id')[:SEGMENT_BATCH_SIZE]
+    )
+    if not segments:
+        return True, 0
+    # The archiver rewrites a chat's segments under its chat row lock; take the same locks
+    list(Chat.objects.select_for_update().filter(pk__in={chat_id for _, chat_id in segments}).order_by('pk'))
+
+    removed = 0
+    for segment in MessageArchive.objects.filter(pk__in=[pk for pk, _ in segments]):
+        rows = decode_segment(segment.data, segment.chat_id)
+        kept = [row for row in rows if row['sender_id'] != purge.user_id]
+        if len(kept) == len(rows):
+            continue
+        removed += len(rows) - len(kept)
+        if not kept:
+            segment.delete()
+            continue
+        segment.data = encode_segment(kept)
+        segment.first_at = kept[0]['created_at']
+        segment.last_at = kept[-1]['created_at']
+        segment.message_count = len(kept)
+        segment.save(update_fields=['data', 'first_at', 'last_at', 'message_count', 'updated_at'])
+    purge.position = segments[-1][0]
+    return len(segments) < SEGMENT_BATCH_SIZE, removed
+
+
+def _purge_counterparts(purge, batch_size):
+    ids = list(ChatMember.objects.filter(counterpart_id=purge.user_id).values_list('pk', flat=True)[:batch_size])
+    ChatMember.objects.filter(pk__in=ids).update(counterpart=None)
+    return len(ids) < batch_size, len(ids)
+
+
+def _purge_user(purge, batch_size):
+    # Anything created since its stage ran goes with the user
+    User.all_objects.filter(pk=purge.user_id).delete()
+    return True, 1
+
+
+PURGERS = {
+    'orders': lambda purge, size: _delete_batch(
+        Order.objects.filter(Q(sender_id=purge.user_id) | Q(receiver_id=purge.user_id)), size
+    ),
+    'messages': lambda purge, size: _delete_batch(Message.objects.filter(sender_id=purge.user_id), size),
+    'archives': _purge_archives,
+    'memberships': lambda purge, size: _delete_batch(ChatMember.objects.filter(user_id=purge.user_id), size),
+    'counterparts': _purge_counterparts,
+    'locations': lambda purge, size: _delete_batch(LocationChunk.objects.filter(user_id=purge.user_id), size),
+    'user': _purge_user,
+}
+
+
+def purge_step(purge_id, batch_size):
+    """Run one batch of a purge; the rows it removed, or None once the purge is finished."""
+    with transaction.atomic():
+        purge = UserPurge.objects.select_for_update().filter(pk=purge_id, finished_at=None).first()
+        if purge is None:
+            return None
+        done, removed = PURGERS[purge.stage](purge, batch_size)
+        if removed:
+            purge.removed[purge.stage] = purge.removed.get(purge.stage, 0) + removed
+        if done:
+            index = STAGES.index(purge.stage) + 1
+            if index < len(STAGES):
+                purge.stage = STAGES[index]
+            else:
+                purge.finished_at = timezone.now()
+        purge.save(update_fields=['stage', 'position', 'removed', 'updated_at', 'finished_at'])
+        return removed
+
+
+@dataclass
+class PurgeResult:
+    users: int
+    rows: int
+    seconds: float
+
+
+def run_purge(batch_size=None, user_ids=None):
+    """Finish every pending purge, oldest first."""
+    started = time.perf_counter()
+    batch_size = batch_size or purge_batch_size()
+    pending = UserPurge.objects.filter(finished_at=None)
+    if user_ids:
+        pending = pending.filter(user_id__in=user_ids)
+    users = rows = 0
+    for purge_id in list(pending.order_by('pk').values_list('pk', flat=True)):
+        removed = purge_step(purge_id, batch_size)
+        while removed is not None:
+            rows += removed
+            removed = purge_step(purge_id, batch_size)
+        users += 1
+    return PurgeResult(users, rows, time.perf_counter() - started)
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """One connection's inbox. Events are delivered onto ``queue`` in ``loop``."""
+
+    def __init__(self, loop=None, max_queue=100):
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, event):
+        # Runs on the subscriber's loop; a slow client loses its oldest events
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class BaseFanout:
+    """Routes published events to the subscriptions of a group.
+
+    ``publish`` may be called from any thread (e.g. a sync view or signal);
+    ``subscribe``/``unsubscribe`` are called from the connection's event loop.
+    """
+
+    def subscribe(self, group, subscription):
+        raise NotImplementedError
+
+    def unsubscribe(self, group, subscription):
+        raise NotImplementedError
+
+    def publish(self, group, event):
+        raise NotImplementedError
+
+
+class InMemoryFanout(BaseFanout):
+    """Single-process fan-out, for single-node deployments and tests."""
+
+    def __init__(self):
+        self._groups = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, group, subscription):
+        with self._lock:
+            self._groups[group].add(subscription)
+
+    def unsubscribe(self, group, subscription):
+        with self._lock:
+            members = self._groups.get(group)
+            if members is not None:
+                members.discard(subscription)
+                if not members:
+                    del self._groups[group]
+
+    def publish(self, group, event):
+        with self._lock:
+            subscriptions = list(self._groups.get(group, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Loop already closed; the connection is going away
+                self.unsubscribe(group, subscription)
+        return len(subscriptions)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(members) for members in self._groups.values())
+
+
+_fanout = None
+_fanout_lock = threading.Lock()
+
+
+def get_fanout():
+    global _fanout
+    if _fanout is None:
+        with _fanout_lock:
+            if _fanout is None:
+                backend = getattr(settings, 'REALTIME_FANOUT_BACKEND', 'api.realtime.InMemoryFanout')
+                _fanout = import_string(backend)()
+    return _fanout
+
+
+def publish_to_users(user_ids, event_type, data):
+    fanout = get_fanout()
+    event = {'type': event_type, 'data': data}
+    for user_id in set(str(user_id) for user_id in user_ids if user_id is not None):
+        fanout.publish(user_group(user_id), event)
+
+
+def authenticate_token(raw_token):
+    """Return the id of the user a valid simplejwt access token belongs to, else None.
+
+    The user is resolved as for API requests, so soft-deleted users are refused.
+    """
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from .authentication import CachedJWTAuthentication
+
+    if not raw_token:
+        return None
+    try:
+        return CachedJWTAuthentication().get_user(AccessToken(raw_token)).pk
+    except (TokenError, AuthenticationFailed):
+        return None
+
+
+def _token_from_scope(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode().split()
+            if len(parts) == 2 and parts[0].lower() == 'bearer':
+                return parts[1]
+    return None
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI WebSocket endpoint pushing chat and order events to one user.
+
+    Authenticate with ``?token=<access token>`` or an ``Authorization: Bearer``
+    header. Client frames are ignored apart from ``ping``, answered with ``pong``.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    user_id = await sync_to_async(authenticate_token)(_token_from_scope(scope))
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+
+    await send({'type': 'websocket.accept'})
+    fanout = get_fanout()
+    group = user_group(user_id)
+    subscription = Subscription()
+    fanout.subscribe(group, subscription)
+
+    receive_task = asyncio.ensure_future(receive())
+    event_task = asyncio.ensure_future(subscription.queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receive_task, event_task}, return_when=asyncio.FIRST_COMPLETED)
+            if event_task in done:
+                payload = json.dumps(event_task.result(), cls=JSONEncoder)
+                await send({'type': 'websocket.send', 'text': payload})
+                event_task = asyncio.ensure_future(subscription.queue.get())
+            if receive_task in done:
+                message = receive_task.result()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message.get('text') == 'ping':
+                    await send({'type': 'websocket.send', 'text': 'pong'})
+                receive_task = asyncio.ensure_future(receive())
+    finally:
+        fanout.unsubscribe(group, subscription)
+        receive_task.cancel()
+        event_task.cancel()
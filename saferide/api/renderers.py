@@ -0,0 +1,75 @@
+"""Response renderers and request parsers beyond DRF's defaults.
+
+orjson and msgpack are optional: without orjson FastJSONRenderer falls back to
+DRF's JSONRenderer, and without msgpack the MessagePack renderer and parser
+are left out of content negotiation.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Same fallback conversions as DRF's JSON output (Decimal, UUID, lazy strings, ...)
+_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson; indented output still goes through DRF."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            with timed('serialize'):
+                return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        with timed('serialize'):
+            return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with timed('serialize'):
+            return msgpack.packb(data, default=_default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/x-msgpack'
+    available = msgpack is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """Skips renderers and parsers whose optional dependency is not installed."""
+
+    def select_parser(self, request, parsers):
+        return super().select_parser(request, [parser for parser in parsers if getattr(parser, 'available', True)])
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [renderer for renderer in renderers if getattr(renderer, 'available', True)]
+        return super().select_renderer(request, renderers, format_suffix)
@@ -0,0 +1,304 @@
+"""Pre-aggregated operational counters, kept current as rows are written.
+
+Metrics, each a Rollup row per (dimension, UTC hour):
+
+- ``orders_created`` and ``orders_completed``: per city of the sender and hour
+  the order was created, how many orders were placed and how many of those
+  are complete now. Deleting an order takes it out again.
+- ``messages``: messages sent per hour, whatever the chat. Messages moved
+  into the archive (api.archive) still count.
+- ``drivers``: per city, one running total (bucket TOTAL_BUCKET) of users
+  with DISPATCH_DRIVER_ROLE that are not soft-deleted.
+
+Signals feed every committed change to the process's RollupBuffer, which
+folds the deltas together and adds them to the table in one upsert every
+ROLLUP_FLUSH_INTERVAL seconds. Writes therefore cost no queries, and busy
+counters like the current hour's messages are not updated row by row under
+contention. Bulk writes (bulk_create, update) send no signals, and a crash
+loses the deltas still buffered. ``reconcile`` (`manage.py reconcile_rollups`)
+recomputes the last ROLLUP_RECONCILE_HOURS (or all history) from the tables.
+Writes still buffered when it runs can leave the current hour off by that
+much until the next reconcile.
+
+``read_stats`` reads only the rollups for the requested hours, so GET
+stats/ costs the same however large orders and messages grow.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .archive import decode_segment
+from .models import Message, MessageArchive, Order, Rollup, User
+
+logger = logging.getLogger(__name__)
+
+ORDERS_CREATED = 'orders_created'
+ORDERS_COMPLETED = 'orders_completed'
+MESSAGES = 'messages'
+DRIVERS = 'drivers'
+HOURLY_METRICS = [ORDERS_CREATED, ORDERS_COMPLETED, MESSAGES]
+# The bucket of metrics kept as a single running total rather than per hour
+TOTAL_BUCKET = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+SENDER_BATCH_SIZE = 1000
+
+
+def hour_of(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def driver_role():
+    return getattr(settings, 'DISPATCH_DRIVER_ROLE', 'driver')
+
+
+def apply_deltas(deltas):
+    """Add {(metric, dimension, bucket): delta} to the rollups, creating missing rows."""
+    connection = connections[router.db_for_write(Rollup)]
+    rows = [
+        (metric, dimension, connection.ops.adapt_datetimefield_value(bucket), delta)
+        for (metric, dimension, bucket), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return 0
+    # ON CONFLICT ... DO UPDATE is the same on Postgres and SQLite, and atomic on both
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO rollups (metric, dimension, bucket, value) VALUES (%s, %s, %s, %s) '
+            'ON CONFLICT (metric, dimension, bucket) DO UPDATE SET value = rollups.value + excluded.value',
+            rows,
+        )
+    return len(rows)
+
+
+class RollupBuffer:
+    """Per-process deltas waiting to be added to the rollups every ``flush_interval`` seconds.
+
+    Order deltas are keyed by sender and resolved to the sender's city when
+    flushed, so recording them needs no query. After a failed flush the timer
+    waits twice as long before the next one, up to ``max_backoff`` seconds.
+    """
+
+    def __init__(self, flush_interval=5.0, max_backoff=300.0):
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._pending = defaultdict(int)
+        self._by_sender = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self.stats = {'recorded': 0, 'flushed': 0, 'flushes': 0}
+
+    def add(self, metric, dimension, bucket, delta=1):
+        with self._lock:
+            self._pending[(metric, dimension, bucket)] += delta
+            self.stats['recorded'] += 1
+            self._ensure_timer()
+
+    def add_for_sender(self, metric, sender_id, bucket, delta=1):
+        with self._lock:
+            self._by_sender[(metric, sender_id, bucket)] += delta
+            self.stats['recorded'] += 1
+            self._ensure_timer()
+
+    def flush(self):
+        """Add everything pending to the rollups. Returns the number of counters changed."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(int)
+                by_sender, self._by_sender = self._by_sender, defaultdict(int)
+            if not pending and not by_sender:
+                return 0
+            try:
+                deltas = defaultdict(int, pending)
+                senders = list({sender_id for _, sender_id, _ in by_sender})
+                cities = {}
+                for start in range(0, len(senders), SENDER_BATCH_SIZE):
+                    cities.update(
+                        User.all_objects.filter(pk__in=senders[start:start + SENDER_BATCH_SIZE])
+                        .values_list('id', 'city')
+                    )
+                # Senders purged since are left to reconcile
+                for (metric, sender_id, bucket), delta in by_sender.items():
+                    if sender_id in cities:
+                        deltas[(metric, cities[sender_id], bucket)] += delta
+                changed = apply_deltas(deltas)
+            except Exception:
+                logger.exception("Rollup flush failed, re-queueing %d deltas", len(pending) + len(by_sender))
+                with self._lock:
+                    for key, delta in pending.items():
+                        self._pending[key] += delta
+                    for key, delta in by_sender.items():
+                        self._by_sender[key] += delta
+                raise
+            with self._lock:
+                self.stats['flushed'] += changed
+                self.stats['flushes'] += 1
+            return changed
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._by_sender.clear()
+
+    def _ensure_timer(self):
+        if self._timer is None and self.flush_interval:
+            self._timer = threading.Thread(target=self._run_timer, name='rollups', daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        delay = self.flush_interval
+        while True:
+            time.sleep(delay)
+            try:
+                self.flush()
+            except Exception:
+                # Logged by flush(); wait longer each time while the database is unavailable
+                delay = min(delay * 2, max(self.max_backoff, self.flush_interval))
+            else:
+                delay = self.flush_interval
+            finally:
+                close_old_connections()
+
+
+_rollup_buffer = None
+_rollup_buffer_lock = threading.Lock()
+
+
+def get_rollup_buffer():
+    global _rollup_buffer
+    if _rollup_buffer is None:
+        with _rollup_buffer_lock:
+            if _rollup_buffer is None:
+                _rollup_buffer = RollupBuffer(flush_interval=getattr(settings, 'ROLLUP_FLUSH_INTERVAL', 5.0))
+                atexit.register(_rollup_buffer.flush)
+    return _rollup_buffer
+
+
+def rollups_enabled():
+    return getattr(settings, 'ROLLUPS_ENABLED', True)
+
+
+def count_order(order, created=0, completed=0):
+    """Count an order in (1) or out (-1) of its creation hour's totals once the transaction commits."""
+    bucket = hour_of(order.created_at)
+    buffer = get_rollup_buffer()
+
+    def record():
+        if created:
+            buffer.add_for_sender(ORDERS_CREATED, order.sender_id, bucket, created)
+        if completed:
+            buffer.add_for_sender(ORDERS_COMPLETED, order.sender_id, bucket, completed)
+
+    transaction.on_commit(record)
+
+
+def count_messages(messages):
+    counts = defaultdict(int)
+    for message in messages:
+        counts[hour_of(message.created_at)] += 1
+    buffer = get_rollup_buffer()
+
+    def record():
+        for bucket, count in counts.items():
+            buffer.add(MESSAGES, '', bucket, count)
+
+    transaction.on_commit(record)
+
+
+def count_driver(city, delta):
+    buffer = get_rollup_buffer()
+    transaction.on_commit(lambda: buffer.add(DRIVERS, city, TOTAL_BUCKET, delta))
+
+
+def reconcile_hours():
+    return getattr(settings, 'ROLLUP_RECONCILE_HOURS', 48)
+
+
+@dataclass
+class ReconcileResult:
+    since: datetime
+    rows: int
+    seconds: float
+
+
+def _message_counts(since):
+    """Messages per hour from ``since`` on, in the table and in archive segments."""
+    counts = defaultdict(int)
+    messages = Message.objects.all() if since is None else Message.objects.filter(created_at__gte=since)
+    hourly = messages.annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc)).values('hour')
+    for row in hourly.annotate(count=Count('id')).order_by():
+        counts[row['hour']] += row['count']
+    segments = MessageArchive.objects.all() if since is None else MessageArchive.objects.filter(last_at__gte=since)
+    for data, chat_id in segments.values_list('data', 'chat_id').iterator(chunk_size=100):
+        for row in decode_segment(data, chat_id):
+            if since is None or row['created_at'] >= since:
+                counts[hour_of(row['created_at'])] += 1
+    return counts
+
+
+def reconcile(hours=None, full=False):
+    """Recompute the hourly metrics for the last ``hours`` (all of them when ``full``) and every running total."""
+    started = time.perf_counter()
+    get_rollup_buffer().flush()
+    since = None if full else hour_of(timezone.now() - timedelta(hours=hours or reconcile_hours()))
+
+    rows = []
+    orders = Order.objects.all() if since is None else Order.objects.filter(created_at__gte=since)
+    hourly = orders.annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc)).values('hour', 'sender__city')
+    for row in hourly.annotate(created=Count('id'), completed=Count('id', filter=Q(isComplete=True))).order_by():
+        city = row['sender__city']
+        rows.append(Rollup(metric=ORDERS_CREATED, dimension=city, bucket=row['hour'], value=row['created']))
+        if row['completed']:
+            rows.append(Rollup(metric=ORDERS_COMPLETED, dimension=city, bucket=row['hour'], value=row['completed']))
+    for bucket, count in _message_counts(since).items():
+        rows.append(Rollup(metric=MESSAGES, dimension='', bucket=bucket, value=count))
+    drivers = User.objects.filter(roleKey=driver_role()).values('city').annotate(count=Count('id')).order_by()
+    for row in drivers:
+        rows.append(Rollup(metric=DRIVERS, dimension=row['city'], bucket=TOTAL_BUCKET, value=row['count']))
+
+    with transaction.atomic():
+        stale = Rollup.objects.filter(metric__in=HOURLY_METRICS)
+        if since is not None:
+            stale = stale.filter(bucket__gte=since)
+        stale.delete()
+        Rollup.objects.filter(metric=DRIVERS).delete()
+        Rollup.objects.bulk_create(rows, batch_size=1000)
+    return ReconcileResult(since, len(rows), time.perf_counter() - started)
+
+
+def read_stats(since, city=None):
+    """Hourly orders and messages from ``since`` on, and drivers, optionally for one city."""
+    rollups = Rollup.objects.filter(Q(metric__in=HOURLY_METRICS, bucket__gte=hour_of(since)) | Q(metric=DRIVERS))
+    if city is not None:
+        # Messages have no city, so they are never filtered out
+        rollups = rollups.filter(dimension__in=[city, ''])
+
+    orders = {}
+    messages = []
+    drivers = []
+    for metric, dimension, bucket, value in rollups.values_list('metric', 'dimension', 'bucket', 'value'):
+        if metric == DRIVERS:
+            if value:
+                drivers.append({'city': dimension, 'count': value})
+        elif metric == MESSAGES:
+            messages.append({'hour': bucket, 'count': value})
+        else:
+            row = orders.setdefault(
+                (bucket, dimension), {'hour': bucket, 'city': dimension, 'created': 0, 'completed': 0}
+            )
+            row['created' if metric == ORDERS_CREATED else 'completed'] = value
+    return {
+        'orders': sorted(orders.values(), key=lambda row: (row['hour'], row['city'])),
+        'messages': sorted(messages, key=lambda row: row['hour']),
+        'drivers': sorted(drivers, key=lambda row: (-row['count'], row['city'])),
+    }
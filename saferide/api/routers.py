@@ -0,0 +1,246 @@
+"""Read-replica routing.
+
+Writes, and every query of a non-GET request, go to the primary. Reads made
+while serving GET/HEAD/OPTIONS go to one replica per request, chosen among
+those in DATABASE_REPLICAS whose replication lag is under
+DATABASE_REPLICA_MAX_LAG. Queries outside a request (worker pools, management
+commands) stay on the primary.
+
+Reads stay consistent with the user's own writes. After a successful write
+request, ReplicaRoutingMiddleware stores the time in the DATABASE_STICKY_CACHE_ALIAS
+cache. For a while after that, the user's reads only go to a replica whose
+measured lag is shorter than the time since that write. Replicas whose lag
+cannot be measured (anything but Postgres) must wait DATABASE_STICKY_SECONDS.
+Until then the reads go to the primary.
+"""
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# DatabaseCache entries, which include the sticky write times themselves
+PRIMARY_ONLY_APPS = ('django_cache',)
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+# 0 when the replica has replayed everything it received, so an idle
+# primary does not make an up-to-date replica look stale
+POSTGRES_LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _sticky_seconds():
+    return getattr(settings, 'DATABASE_STICKY_SECONDS', 5.0)
+
+
+def _sticky_cache_alias():
+    return getattr(settings, 'DATABASE_STICKY_CACHE_ALIAS', 'default')
+
+
+def _sticky_cache():
+    return caches[_sticky_cache_alias()]
+
+
+def _write_key(user_id):
+    return f'db-write:{user_id}'
+
+
+class RoutingState:
+    """Routing decisions for one request."""
+    __slots__ = ('primary', 'user_id', 'last_write', 'sticky_checked', 'alias')
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.user_id = None
+        self.last_write = None
+        self.sticky_checked = False
+        self.alias = None
+
+
+class ReplicaMonitor:
+    """Per-process view of replica lag, refreshed at most every ``interval`` seconds.
+
+    A replica that cannot be reached counts as infinitely lagged until the
+    next check. Lag is None where it cannot be measured.
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._lag = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def lag(self, alias):
+        now = time.monotonic()
+        if now - self._checked.get(alias, float('-inf')) >= self.interval and self._lock.acquire(blocking=False):
+            # Other threads keep using the previous value while one refreshes
+            try:
+                self._lag[alias] = self.measure(alias)
+                self._checked[alias] = now
+            finally:
+                self._lock.release()
+        return self._lag.get(alias)
+
+    def measure(self, alias):
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except Exception:
+            return float('inf')
+        return 0.0 if lag is None else float(lag)
+
+    def reset(self):
+        with self._lock:
+            self._lag.clear()
+            self._checked.clear()
+
+
+replica_monitor = ReplicaMonitor(interval=getattr(settings, 'DATABASE_REPLICA_CHECK_INTERVAL', 5.0))
+
+
+def note_user(user_id):
+    """Tell the router whose request this is (called once the user is authenticated).
+
+    Safe to call from async code: the sticky cache may be a database, so the
+    user's last write is looked up by the next routed read, which runs sync.
+    """
+    state = _state.get()
+    if state is not None and state.user_id is None:
+        state.user_id = user_id
+
+
+def record_write(user_id):
+    """Keep the user's reads read-your-writes for the next few seconds."""
+    timeout = max(_sticky_seconds(), getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 10.0))
+    _sticky_cache().set(_write_key(user_id), time.time(), int(timeout) + 1)
+
+
+@contextmanager
+def use_primary():
+    """Send every read in the block to the primary."""
+    state = _state.get()
+    if state is None or state.primary:
+        yield
+        return
+    state.primary = True
+    try:
+        yield
+    finally:
+        state.primary = False
+
+
+def _choose_replica(last_write):
+    max_lag = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 10.0)
+    since_write = None if last_write is None else time.time() - last_write
+    candidates = []
+    for alias in replica_aliases():
+        lag = replica_monitor.lag(alias)
+        if lag is not None and lag > max_lag:
+            continue
+        if since_write is not None:
+            # Only a replica known to have replayed past the user's last write
+            if lag is None and since_write < _sticky_seconds():
+                continue
+            if lag is not None and lag >= since_write:
+                continue
+        candidates.append(alias)
+    return random.choice(candidates) if candidates else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.primary or not replica_aliases() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        if state.user_id is not None and not state.sticky_checked:
+            state.sticky_checked = True
+            state.last_write = _sticky_cache().get(_write_key(state.user_id))
+            if state.last_write is not None:
+                # Reads made before authentication may have picked a lagging replica
+                state.alias = None
+        if state.alias is None:
+            # One replica per request, so its reads see a single snapshot
+            state.alias = _choose_replica(state.last_write)
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    # Async-capable, so under ASGI async views are not pushed through a thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if replica_aliases() and isinstance(_sticky_cache(), (LocMemCache, DummyCache)):
+            # Each process would only see its own writes, so reads after a write could miss it
+            raise ImproperlyConfigured(
+                f'DATABASE_STICKY_CACHE_ALIAS {_sticky_cache_alias()!r} is not shared between processes; '
+                f'configure a shared cache or leave DATABASE_REPLICAS empty'
+            )
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _wrote(self, state, response):
+        return state.primary and state.user_id is not None and response.status_code < 400 and replica_aliases()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RoutingState(primary=request.method not in SAFE_METHODS)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if self._wrote(state, response):
+            record_write(state.user_id)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState(primary=request.method not in SAFE_METHODS)
+        # Sync code below runs through sync_to_async, which carries this context over
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if self._wrote(state, response):
+            # The sticky cache may be a network round trip
+            await sync_to_async(record_write)(state.user_id)
+        return response
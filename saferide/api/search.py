@@ -0,0 +1,207 @@
+"""Ranked, indexed search over users and message text.
+
+On Postgres, users are matched with pg_trgm against one trigram-indexed
+document of username, email, phone and city. Every query word must occur in
+it as a substring, or the whole query must be similar enough to some part of
+it, which tolerates typos. Results are ranked by word_similarity. Messages use a
+GIN full-text index over to_tsvector('simple', text): no stemming, since
+messages come in many languages. Every word must match, the last one as a
+prefix, and results are ranked by ts_rank_cd. Only the newest
+SEARCH_MESSAGE_CANDIDATES matches are ranked, so a word found in half of
+all messages costs no more to search than a rarer one.
+
+On SQLite (development, load tests) the same searches run against FTS5 tables
+kept in sync by triggers: a trigram tokenizer for users, unicode61 for
+messages, both ranked by bm25. The messages table also indexes chat_id as a
+token, so a chat's or user's messages are found by intersecting doclists. Django rebuilds a table to alter it on SQLite,
+which drops its triggers, so migrations that do so must call
+``install_sqlite_index`` again.
+
+Hits come back as (id, score) with higher scores better, ordered by
+(score desc, id) so they can be paged with a keyset cursor. Postgres ranks are
+real, so they are cast to double precision for the score a cursor carries to
+compare equal to its row. Archived messages (api.archive) are not searched, and
+soft-deleted users (api.purge) are not found.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import ChatMember, Message, User
+
+# pg_trgm and FTS5's trigram tokenizer cannot match anything shorter; also
+# the shortest prefix searched as one, which FTS5 keeps a prefix index for
+MIN_WORD_LENGTH = 3
+MAX_QUERY_WORDS = 8
+
+_WORD = re.compile(r'\w+')
+
+USER_DOCUMENT = (
+    "lower(users.username || ' ' || users.email || ' ' || coalesce(users.phone, '') || ' ' || users.city)"
+)
+MESSAGE_DOCUMENT = "to_tsvector('simple', messages.text)"
+
+POSTGRES_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS users_search_trgm_idx ON users USING gin (({USER_DOCUMENT}) gin_trgm_ops)',
+    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_text_fts_idx ON messages USING gin (({MESSAGE_DOCUMENT}))',
+]
+POSTGRES_DROP_INDEXES = [
+    'DROP INDEX CONCURRENTLY IF EXISTS users_search_trgm_idx',
+    'DROP INDEX CONCURRENTLY IF EXISTS messages_text_fts_idx',
+]
+
+# (table, FTS5 columns, options); the FTS tables index the real ones by rowid
+SQLITE_INDEXES = [
+    ('users', ['username', 'email', 'phone', 'city'], "tokenize='trigram'"),
+    ('messages', ['text', 'chat_id'], f"tokenize='unicode61 remove_diacritics 2', prefix='{MIN_WORD_LENGTH}'"),
+]
+
+
+def _sqlite_statements(table, columns, options):
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old});"
+    insert = f'INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new});'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{table}', content_rowid='rowid', {options})",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END',
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def install_sqlite_index(connection):
+    """Create the FTS5 tables and triggers if missing and reindex every row."""
+    with connection.cursor() as cursor:
+        for table, columns, options in SQLITE_INDEXES:
+            for statement in _sqlite_statements(table, columns, options):
+                cursor.execute(statement)
+
+
+def drop_sqlite_index(connection):
+    with connection.cursor() as cursor:
+        for table, _, _ in SQLITE_INDEXES:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+            for event in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{event}')
+
+
+def query_words(query):
+    return [word.lower() for word in _WORD.findall(query)][:MAX_QUERY_WORDS]
+
+
+def user_query_words(query):
+    """The words of a user search that the trigram indexes can match."""
+    return [word for word in query_words(query) if len(word) >= MIN_WORD_LENGTH]
+
+
+def _like(word):
+    return '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _fts5_phrase(word):
+    return '"' + word.replace('"', '""') + '"'
+
+
+def _ranked(connection, model, matches, params, after, limit):
+    """Run ``matches`` (SELECT id, score ...) past the ``after`` (score, id) cursor."""
+    sql = f'SELECT id, score FROM ({matches}) hits'
+    params = list(params)
+    if after is not None:
+        score, pk = after
+        sql += ' WHERE score < %s OR (score = %s AND id > %s)'
+        params += [score, score, model._meta.pk.get_db_prep_value(pk, connection)]
+    sql += ' ORDER BY score DESC, id LIMIT %s'
+    params.append(limit)
+    to_python = model._meta.pk.to_python
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(to_python(pk), float(score)) for pk, score in cursor.fetchall()]
+
+
+def search_users(query, limit=20, after=None):
+    """[(user id, score)] matching ``query``, best first, past the ``after`` cursor."""
+    words = user_query_words(query)
+    if not words:
+        return []
+    connection = connections[router.db_for_read(User)]
+    if connection.vendor == 'postgresql':
+        phrase = ' '.join(words)
+        substrings = ' AND '.join(f'{USER_DOCUMENT} LIKE %s' for _ in words)
+        matches = (
+            f'SELECT users.id, word_similarity(%s, {USER_DOCUMENT})::float8 AS score FROM users '
+            f'WHERE (({substrings}) OR %s <%% {USER_DOCUMENT}) AND users.deleted_at IS NULL'
+        )
+        params = [phrase, *map(_like, words), phrase]
+    else:
+        matches = (
+            'SELECT users.id, -bm25(users_fts) AS score FROM users_fts '
+            'JOIN users ON users.rowid = users_fts.rowid WHERE users_fts MATCH %s AND users.deleted_at IS NULL'
+        )
+        params = [' '.join(map(_fts5_phrase, words))]
+    return _ranked(connection, User, matches, params, after, limit)
+
+
+def message_candidates():
+    return getattr(settings, 'SEARCH_MESSAGE_CANDIDATES', 5000)
+
+
+def search_messages(query, limit=20, after=None, chat_id=None, user_id=None):
+    """[(message id, score)] whose text matches ``query``, best first.
+
+    Optionally limited to one chat, or to the chats ``user_id`` belongs to.
+    """
+    words = query_words(query)
+    if not words:
+        return []
+    prefix = len(words[-1]) >= MIN_WORD_LENGTH
+    connection = connections[router.db_for_read(Message)]
+    if connection.vendor == 'postgresql':
+        # Words hold only \w characters, so they need no tsquery escaping
+        terms = ' & '.join(words[:-1] + [words[-1] + (':*' if prefix else '')])
+        params = [terms]
+        conditions = f'{MESSAGE_DOCUMENT} @@ query'
+        if chat_id is not None:
+            conditions += ' AND messages.chat_id = %s'
+            params.append(Message._meta.get_field('chat').get_db_prep_value(chat_id, connection))
+        if user_id is not None:
+            conditions += ' AND messages.chat_id IN (SELECT chat_id FROM chat_members WHERE user_id = %s)'
+            params.append(User._meta.pk.get_db_prep_value(user_id, connection))
+        matches = (
+            f"SELECT messages.id, ts_rank_cd({MESSAGE_DOCUMENT}, query)::float8 AS score "
+            f"FROM to_tsquery('simple', %s) query, LATERAL ("
+            f"SELECT messages.id, messages.text FROM messages WHERE {conditions} "
+            f"ORDER BY messages.created_at DESC LIMIT %s) messages"
+        )
+        params.append(message_candidates())
+    else:
+        phrases = [_fts5_phrase(word) for word in words]
+        if prefix:
+            phrases[-1] += '*'
+        expression = f"text : ({' '.join(phrases)})"
+        if chat_id is not None or user_id is not None:
+            if user_id is None:
+                chat_ids = [chat_id]
+            else:
+                chats = ChatMember.objects.using(connection.alias).filter(user_id=user_id)
+                if chat_id is not None:
+                    chats = chats.filter(chat_id=chat_id)
+                chat_ids = list(chats.values_list('chat_id', flat=True))
+                if not chat_ids:
+                    return []
+            expression = f"chat_id : ({' OR '.join(_fts5_phrase(chat.hex) for chat in chat_ids)}) AND {expression}"
+        # The chat_id column only narrows the match; it carries no weight in the rank
+        matches = (
+            'SELECT messages.id, score FROM ('
+            'SELECT rowid, -bm25(messages_fts, 1.0, 0.0) AS score FROM messages_fts '
+            'WHERE messages_fts MATCH %s ORDER BY rowid DESC LIMIT %s'
+            ') candidates JOIN messages ON messages.rowid = candidates.rowid'
+        )
+        params = [expression, message_candidates()]
+    return _ranked(connection, Message, matches, params, after, limit)
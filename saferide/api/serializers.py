@@ -1,10 +1,17 @@
 from rest_framework import serializers
-from .models import User, Chat, Message, Order
-from django.contrib.auth import authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
-import re
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .metrics import timed
+from .models import User, Chat, ChatMember, Message, Order
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+    # Attributes representation time to the request's Server-Timing breakdown
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'city', 'roleKey', 'phone', 'latitude', 'longitude', 'created_at']
@@ -42,41 +49,57 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         return user
 
 class UserLoginSerializer(serializers.Serializer):
+    # Credentials are checked in AsyncLoginUserView on the password hashing pool
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
-    
-    def validate(self, data):
-        email = data.get('email')
-        password = data.get('password')
-        
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            raise serializers.ValidationError('Invalid email or password')
-        
-        if not user.check_password(password):
-            raise serializers.ValidationError('Invalid email or password')
-        
-        refresh = RefreshToken.for_user(user)
-        data['user'] = user
-        data['refresh'] = str(refresh)
-        data['access'] = str(refresh.access_token)
-        return data
 
-class ChatSerializer(serializers.ModelSerializer):
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    # simplejwt resolves the token's user through get_user_model(), which is not api.User
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(jwt_settings.USER_ID_CLAIM)
+        user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).first() if user_id else None
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        return {'access': str(refresh.access_token)}
+
+class ChatSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Chat
         fields = ['id', 'members', 'created_at', 'updated_at']
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = ['id', 'chat', 'sender', 'text', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'chat', 'sender', 'text', 'target_language', 'translated_text',
+                  'translation_status', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'translated_text', 'translation_status', 'created_at', 'updated_at']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'sender', 'receiver', 'senderName', 'receiverName', 
                   'origin', 'destination', 'isComplete', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+class InboxUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'city', 'roleKey']
+
+class InboxMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'text', 'target_language', 'translated_text', 'translation_status', 'created_at']
+
+class InboxSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    chat = serializers.UUIDField(source='chat_id')
+    members = serializers.JSONField(source='chat.members')
+    last_activity = serializers.DateTimeField(source='chat.last_activity')
+    last_message = InboxMessageSerializer(source='chat.last_message', allow_null=True)
+    counterpart = InboxUserSerializer(allow_null=True)
+    
+    class Meta:
+        model = ChatMember
+        fields = ['chat', 'members', 'last_activity', 'last_message', 'counterpart', 'unread_count', 'last_read_at']
+        read_only_fields = fields
@@ -0,0 +1,160 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .conditional import invalidate_resource
+from .geo import location_index
+from .metrics import instrument_connection
+from .models import Chat, ChatMember, Message, Order, User
+from .realtime import publish_to_users
+from .rollups import count_driver, count_messages, count_order, driver_role, rollups_enabled
+from .serializers import MessageSerializer, OrderSerializer
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def index_user_location(sender, instance, **kwargs):
+    if instance.deleted_at is not None:
+        location_index.remove(instance.pk)
+    elif location_index.loaded:
+        location_index.update(instance.pk, instance.latitude, instance.longitude, instance.roleKey)
+
+
+@receiver(post_delete, sender=User)
+def unindex_user_location(sender, instance, **kwargs):
+    location_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    def push():
+        members = ChatMember.objects.filter(chat_id=instance.chat_id).values_list('user_id', flat=True)
+        publish_to_users(members, 'message.created', MessageSerializer(instance).data)
+
+    transaction.on_commit(push)
+
+
+@receiver(post_save, sender=Order)
+def push_new_order(sender, instance, created, **kwargs):
+    if not created:
+        return
+    data = OrderSerializer(instance).data
+    transaction.on_commit(
+        lambda: publish_to_users([instance.sender_id, instance.receiver_id], 'order.created', data)
+    )
+
+
+@receiver(post_delete, sender=Order)
+def push_deleted_order(sender, instance, **kwargs):
+    data = {'id': str(instance.pk)}
+    transaction.on_commit(
+        lambda: publish_to_users([instance.sender_id, instance.receiver_id], 'order.deleted', data)
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_responses(sender, instance, **kwargs):
+    invalidate_resource('user', instance.pk)
+
+
+@receiver(post_save, sender=Chat)
+@receiver(post_delete, sender=Chat)
+def invalidate_chat_responses(sender, instance, **kwargs):
+    for user_id in instance.members if isinstance(instance.members, list) else []:
+        invalidate_resource('user-chats', user_id)
+
+
+@receiver(post_save, sender=ChatMember)
+@receiver(post_delete, sender=ChatMember)
+def invalidate_membership_responses(sender, instance, **kwargs):
+    invalidate_resource('user-chats', instance.user_id)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_message_responses(sender, instance, **kwargs):
+    invalidate_resource('messages', instance.chat_id)
+
+
+# Rollups (api.rollups) need a row's state before the write. Only fields
+# loaded with the instance are read, so deferred fields are never fetched.
+_UNKNOWN = object()
+
+
+def _driver_city(values):
+    """The city a user counts towards as a driver, None if they do not count."""
+    if values.get('roleKey') == driver_role() and values.get('deleted_at') is None:
+        return values.get('city')
+    return None
+
+
+@receiver(post_init, sender=User)
+def remember_driver_city(sender, instance, **kwargs):
+    loaded = instance.__dict__
+    known = all(name in loaded for name in ('roleKey', 'city', 'deleted_at'))
+    instance._rollup_driver_city = _driver_city(loaded) if known else _UNKNOWN
+
+
+@receiver(post_save, sender=User)
+def roll_up_driver(sender, instance, created, **kwargs):
+    if not rollups_enabled():
+        return
+    before = None if created else instance._rollup_driver_city
+    after = _driver_city(instance.__dict__)
+    instance._rollup_driver_city = after
+    if before is _UNKNOWN or before == after:
+        return
+    if before is not None:
+        count_driver(before, -1)
+    if after is not None:
+        count_driver(after, 1)
+
+
+@receiver(post_delete, sender=User)
+def unroll_driver(sender, instance, **kwargs):
+    if rollups_enabled() and instance._rollup_driver_city not in (None, _UNKNOWN):
+        count_driver(instance._rollup_driver_city, -1)
+
+
+@receiver(post_init, sender=Order)
+def remember_order_completion(sender, instance, **kwargs):
+    instance._rollup_complete = instance.__dict__.get('isComplete')
+
+
+@receiver(post_save, sender=Order)
+def roll_up_order(sender, instance, created, **kwargs):
+    if not rollups_enabled():
+        return
+    before, instance._rollup_complete = instance._rollup_complete, instance.isComplete
+    if created:
+        count_order(instance, created=1, completed=int(instance.isComplete))
+    elif before is not None and before != instance.isComplete:
+        count_order(instance, completed=1 if instance.isComplete else -1)
+
+
+@receiver(post_delete, sender=Order)
+def unroll_order(sender, instance, **kwargs):
+    if rollups_enabled():
+        count_order(instance, created=-1, completed=-int(instance.isComplete))
+
+
+@receiver(post_save, sender=Message)
+def roll_up_message(sender, instance, created, **kwargs):
+    if created and rollups_enabled():
+        count_messages([instance])
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
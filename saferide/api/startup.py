@@ -0,0 +1,209 @@
+"""Cold-start work done before a new process takes traffic.
+
+Left alone, the first requests a process serves import the URLconf and every
+view module behind it (numpy, DRF, simplejwt), compile the URL patterns, load
+DRF's configured classes and the translation catalogs, and connect to the
+database. ``warmup`` runs those steps up front: saferide.wsgi and saferide.asgi
+call ``warm_up_on_startup`` once the application is built, and GET /ready
+reports 200 only once every step has succeeded, so a platform health check
+holds traffic back until then. The Google translation SDK is not preloaded;
+api.translation imports it on the first translation.
+
+Database connections any step opens are closed again once the steps have run,
+so they are never shared with processes forked afterwards; the databases step
+only checks the databases can be reached and loads the driver. ``manage.py warmup`` profiles imports and checks
+a fresh process's cold start against COLD_START_MAX_SECONDS.
+"""
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import JsonResponse
+from django.urls import get_resolver
+from django.utils import translation
+
+logger = logging.getLogger(__name__)
+
+# DRF settings naming classes it imports on first use
+REST_FRAMEWORK_CLASSES = [
+    'DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_RENDERER_CLASSES',
+    'DEFAULT_PARSER_CLASSES', 'DEFAULT_CONTENT_NEGOTIATION_CLASS', 'DEFAULT_PAGINATION_CLASS',
+    'EXCEPTION_HANDLER',
+]
+
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def _urls():
+    resolver = get_resolver()
+    # Populating the reverse lookup imports every view and compiles every pattern
+    resolver.reverse_dict
+
+
+def _rest_framework():
+    from rest_framework.settings import api_settings
+    for name in REST_FRAMEWORK_CLASSES:
+        getattr(api_settings, name)
+
+
+def _serializers():
+    from rest_framework.serializers import Serializer
+
+    from . import serializers
+    for value in vars(serializers).values():
+        if isinstance(value, type) and issubclass(value, Serializer) and value.__module__ == serializers.__name__:
+            value().fields
+
+
+def _jwt():
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from .authentication import CachedJWTAuthentication
+    CachedJWTAuthentication()
+    token = AccessToken()
+    token[api_settings.USER_ID_CLAIM] = str(uuid.uuid4())
+    # Signing and verifying once loads the JWT algorithm backends
+    AccessToken(str(token))
+
+
+def _translations():
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('Not found.')
+
+
+def _databases():
+    from .routers import replica_aliases, replica_monitor
+    connections[DEFAULT_DB_ALIAS].ensure_connection()
+    # An unreachable replica is only skipped by the router, so it does not hold back readiness
+    for alias in replica_aliases():
+        replica_monitor.lag(alias)
+
+
+def _location_index():
+    from .geo import location_index
+    from .locations import load_location_index, nearby_backend
+    if nearby_backend() == 'memory' and not location_index.loaded:
+        load_location_index()
+
+
+STEPS = [
+    ('urls', _urls),
+    ('rest_framework', _rest_framework),
+    ('serializers', _serializers),
+    ('jwt', _jwt),
+    ('translations', _translations),
+    ('databases', _databases),
+    ('location_index', _location_index),
+]
+
+
+class Warmup:
+    """Runs each of STEPS once per process; failed steps are retried on the next run."""
+
+    def __init__(self, steps=STEPS):
+        self.steps = steps
+        self.timings = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return len(self.timings) == len(self.steps)
+
+    def run(self):
+        with self._lock:
+            try:
+                for name, step in self.steps:
+                    if name in self.timings:
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        step()
+                    except Exception as e:
+                        logger.exception("Warmup step %s failed", name)
+                        self.errors[name] = str(e)
+                    else:
+                        self.timings[name] = time.perf_counter() - started
+                        self.errors.pop(name, None)
+            finally:
+                # Whichever step opened them, never leave connections for forked processes to inherit
+                connections.close_all()
+        return self.ready
+
+
+warmup = Warmup()
+
+
+def warm_up_on_startup():
+    if getattr(settings, 'STARTUP_WARMUP', True):
+        # ASGI servers may import the application inside a running event loop,
+        # where Django refuses database access; a thread of its own has none
+        thread = threading.Thread(target=warmup.run, name='warmup')
+        thread.start()
+        thread.join()
+
+
+def ready_view(request):
+    """Readiness check: 200 once this process has warmed up, 503 (and a retry) until then."""
+    ready = warmup.ready or warmup.run()
+    return JsonResponse(
+        {
+            'ready': ready,
+            'steps': {name: round(seconds * 1000, 1) for name, seconds in warmup.timings.items()},
+            'failed': sorted(warmup.errors),
+        },
+        status=200 if ready else 503,
+    )
+
+
+# Run in a fresh interpreter, so nothing is imported or warm already
+_COLD_START = """
+import json, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+loaded = time.perf_counter()
+from api.startup import warmup
+warmup.run()
+print(json.dumps({'setup': loaded - started, 'steps': warmup.timings, 'errors': warmup.errors}))
+"""
+
+
+def _run_fresh(*options):
+    env = dict(os.environ)
+    # None while override_settings is active; the inherited variable still names the module
+    if settings.SETTINGS_MODULE:
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, *options, '-c', _COLD_START], env=env, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - started, json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def cold_start():
+    """(wall seconds, {'setup', 'steps', 'errors'}) for a fresh interpreter to start up and warm up."""
+    elapsed, report, _ = _run_fresh()
+    return elapsed, report
+
+
+def import_profile():
+    """[(module, self seconds, cumulative seconds, depth)] imported by a fresh process's cold start."""
+    _, _, stderr = _run_fresh('-X', 'importtime')
+    modules = []
+    for line in stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append((name, int(own) / 1e6, int(cumulative) / 1e6, len(indent) // 2))
+    return modules
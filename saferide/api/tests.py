@@ -1,3 +1,1397 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import permutations
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import DataError, DatabaseError
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .archive import COLUMNS as ARCHIVE_COLUMNS, decode_segment, encode_segment, run_archive
+from .authentication import CachedJWTAuthentication, UserPrincipalCache, user_cache
+from .conditional import conditional_response, invalidate_resource
+from .dispatch import GREEDY_CANDIDATES, assign_greedy, assign_optimal, distance_matrix_km, run_dispatch
+from .eta import DEFAULT_SPEED_BANDS, PairCache, estimate, haversine_km_many, travel_seconds
+from .fast_serializers import FastListSerializer
+from .geo import GRID_COLUMNS, CellIndex, cell_for, cell_ranges, haversine_km
+from .hashing import HashingOverloaded, PasswordHashingPool
+from .history import LocationHistoryBuffer, decode_points, encode_points, location_path, simplify
+from .loadtest import RouteResult, check_budgets
+from .locations import LocationBuffer, nearby_users
+from .metrics import RequestMetricsMiddleware, registry, timed
+from .models import (
+    Chat, ChatMember, LocationChunk, Message, MessageArchive, Order, Rollup, TranslationCacheEntry, User, UserPurge
+)
+from .pagination import decode_cursor, encode_cursor
+from .purge import purge_step, run_purge, soft_delete_user
+from .realtime import InMemoryFanout, Subscription, authenticate_token, user_group, websocket_application
+from .rollups import DRIVERS, TOTAL_BUCKET, RollupBuffer, get_rollup_buffer, hour_of, reconcile
+from .routers import ReplicaRouter, ReplicaRoutingMiddleware, note_user, replica_monitor
+from .serializers import ChatSerializer, MessageSerializer, OrderSerializer, UserSerializer
+from .startup import Warmup, cold_start, ready_view
+from .translation import FakeTranslator, TranslationService, TranslationWorkerPool
+
+
+# No rollup flush thread racing the test transactions. Whatever the shared
+# buffer still holds is dropped at the end, as its atexit flush would run
+# after the test database is gone.
+_rollup_settings = override_settings(ROLLUP_FLUSH_INTERVAL=0)
+
+
+def setUpModule():
+    _rollup_settings.enable()
+
+
+def tearDownModule():
+    get_rollup_buffer().clear()
+    _rollup_settings.disable()
+
+
+def make_user(name, **fields):
+    fields.setdefault('city', 'Kigali')
+    fields.setdefault('roleKey', 'rider')
+    return User.objects.create_user(f'{name}@example.com', 'password', username=name, **fields)
+
+
+def make_chat(first, second):
+    chat, _ = Chat.objects.get_or_create_direct(first.pk, second.pk)
+    return chat
+
+
+def make_order(sender, **fields):
+    fields.setdefault('senderName', sender.username)
+    fields.setdefault('origin', 'a')
+    fields.setdefault('destination', 'b')
+    return Order.objects.create(sender=sender, **fields)
+
+
+def backdate(instance, created_at):
+    type(instance).objects.filter(pk=instance.pk).update(created_at=created_at)
+
+
+def walk_pages(test, url, params, link):
+    """Follow ``link`` ('next' or 'previous') to the end; the ids on each page."""
+    pages = []
+    response = test.client.get(url, params)
+    while True:
+        test.assertEqual(response.status_code, 200)
+        pages.append([row['id'] for row in response.data['results']])
+        if response.data[link] is None:
+            return pages
+        response = test.client.get(response.data[link])
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        self.user = make_user('tester')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class ChatTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = make_user('other')
+        self.chat = make_chat(self.user, self.other)
+
+
+class NearbyUsersTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.close = make_user('close', roleKey='driver', latitude=-1.950, longitude=30.060)
+        self.farther = make_user('farther', roleKey='driver', latitude=-1.970, longitude=30.080)
+        self.rider = make_user('rider', latitude=-1.951, longitude=30.061)
+        make_user('distant', roleKey='driver', latitude=-2.500, longitude=30.500)
+
+    def test_cell_ranges_cover_the_radius(self):
+        ranges = cell_ranges(-1.95, 30.06, 5)
+        for lat, lng in [(-1.95, 30.06), (-1.99, 30.10), (-1.91, 30.02)]:
+            cell = cell_for(lat, lng)
+            self.assertTrue(any(first <= cell <= last for first, last in ranges))
+
+    def test_cell_ranges_split_at_the_antimeridian(self):
+        ranges = cell_ranges(0, 179.99, 5)
+        columns = {cell % GRID_COLUMNS for first, last in ranges for cell in (first, last)}
+        self.assertIn(0, columns)
+        self.assertIn(GRID_COLUMNS - 1, columns)
+
+    def test_index_finds_neighbours_across_the_antimeridian(self):
+        index = CellIndex()
+        index.update('east', 0, 179.99)
+        index.update('west', 0, -179.99)
+        self.assertEqual([user_id for _, user_id in index.nearby(0, 179.995, 5)], ['east', 'west'])
+
+    def test_index_move_keeps_the_role(self):
+        index = CellIndex()
+        index.update('driver', 0, 0, role_key='driver')
+        index.move('driver', 0.01, 0.01)
+        self.assertEqual(len(index.nearby(0, 0, 5, role_key='driver')), 1)
+        index.remove('driver')
+        self.assertEqual(index.nearby(0, 0, 5), [])
+
+    def test_backends_agree(self):
+        results = {}
+        for backend in ['db', 'memory']:
+            with override_settings(NEARBY_INDEX_BACKEND=backend), \
+                    mock.patch('api.locations.location_index', CellIndex()):
+                hits = nearby_users(-1.95, 30.06, 5, role_key='driver')
+            results[backend] = [user.pk for _, user in hits]
+        self.assertEqual(results['db'], [self.close.pk, self.farther.pk])
+        self.assertEqual(results['memory'], results['db'])
+
+    def test_view_returns_nearest_first(self):
+        response = self.client.get(
+            reverse('nearby-users'), {'lat': -1.95, 'lng': 30.06, 'radius': 5, 'roleKey': 'driver'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data], [str(self.close.pk), str(self.farther.pk)])
+        self.assertLessEqual(response.data[0]['distance_km'], response.data[1]['distance_km'])
+
+    def test_view_rejects_bad_parameters(self):
+        for params in [{'lat': -1.95}, {'lat': 'x', 'lng': 30}, {'lat': 91, 'lng': 30}]:
+            self.assertEqual(self.client.get(reverse('nearby-users'), params).status_code, 400)
+        for radius in [0, -1, 'nan', 'inf']:
+            response = self.client.get(reverse('nearby-users'), {'lat': 0, 'lng': 0, 'radius': radius})
+            self.assertEqual(response.status_code, 400, radius)
+
+
+class LocationBufferTests(TestCase):
+    def setUp(self):
+        self.user = make_user('driver', roleKey='driver')
+        self.buffer = LocationBuffer(flush_interval=0, min_distance_m=5.0)
+        self.now = time.time()
+
+    def test_coalesces_to_latest_ping(self):
+        self.buffer.add(self.user.pk, -1.95, 30.06, ts=self.now - 2)
+        self.buffer.add(self.user.pk, -1.96, 30.07, ts=self.now - 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.latitude, self.user.longitude), (-1.96, 30.07))
+
+    def test_drops_stale_and_sub_threshold_pings(self):
+        self.assertTrue(self.buffer.add(self.user.pk, -1.95, 30.06, ts=self.now - 10))
+        self.assertFalse(self.buffer.add(self.user.pk, -1.90, 30.00, ts=self.now - 15))
+        self.assertFalse(self.buffer.add(self.user.pk, -1.95001, 30.06, ts=self.now - 9))
+
+    def test_failed_flush_requeues_the_batch(self):
+        other = make_user('other')
+        self.buffer.add(self.user.pk, -1.95, 30.06, ts=self.now - 2)
+        self.buffer.add(other.pk, -1.97, 30.08, ts=self.now - 2)
+        with mock.patch.object(User.objects, 'bulk_update', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.flush(), 2)
+
+    def test_unwritable_ping_does_not_drop_the_others(self):
+        other = make_user('other')
+        self.buffer.add(self.user.pk, -1.95, 30.06, ts=self.now - 2)
+        self.buffer.add(other.pk, -1.97, 30.08, ts=self.now - 2)
+        update = QuerySet.update
+
+        def fail_for_one_row(queryset, **fields):
+            if fields['latitude'] == -1.95:
+                raise DataError
+            return update(queryset, **fields)
+
+        with mock.patch.object(User.objects, 'bulk_update', side_effect=DataError), \
+                mock.patch.object(QuerySet, 'update', fail_for_one_row):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.stats['dropped'], 1)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.user.refresh_from_db()
+        other.refresh_from_db()
+        self.assertIsNone(self.user.latitude)
+        self.assertEqual((other.latitude, other.longitude), (-1.97, 30.08))
+
+    def test_invalid_ping_is_dropped_on_arrival(self):
+        self.assertFalse(self.buffer.add(self.user.pk, float('nan'), 30.06, ts=self.now - 2))
+        self.assertEqual(self.buffer.stats['dropped'], 1)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_timestamps_far_from_the_server_clock_are_dropped(self):
+        # Milliseconds, as Date.now() gives, would otherwise make every later ping stale
+        self.assertFalse(self.buffer.add(self.user.pk, -1.95, 30.06, ts=self.now * 1000))
+        self.assertFalse(self.buffer.add(self.user.pk, -1.95, 30.06, ts=self.now - 86400))
+        self.assertTrue(self.buffer.add(self.user.pk, -1.96, 30.07))
+        self.assertEqual(self.buffer.stats['dropped'], 2)
+
+    def test_full_buffer_is_written_on_the_flush_thread(self):
+        buffer = LocationBuffer(flush_interval=60, max_pending=2)
+        flushed = threading.Event()
+        threads = []
+
+        def flush():
+            threads.append(threading.current_thread().name)
+            flushed.set()
+            return 0
+
+        with mock.patch.object(buffer, 'flush', side_effect=flush):
+            buffer.add(self.user.pk, -1.95, 30.06)
+            buffer.add(uuid.uuid4(), -1.97, 30.08)
+            self.assertTrue(flushed.wait(5))
+        # Nothing left for the thread to write into later tests
+        buffer._pending.clear()
+        self.assertEqual(threads, ['location-buffer'])
+
+
+class LocationViewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = LocationBuffer(flush_interval=0)
+        patcher = mock.patch('api.views.get_location_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rejects_non_finite_and_out_of_range_coordinates(self):
+        url = reverse('update-location', kwargs={'user_id': self.user.pk})
+        for latitude, longitude in [('nan', 30), ('inf', 30), (-1.9, '-inf'), (91, 30), (-1.9, 181)]:
+            response = self.client.patch(url, {'latitude': latitude, 'longitude': longitude}, format='json')
+            self.assertEqual(response.status_code, 400, (latitude, longitude))
+        for ts in ['nan', time.time() * 1000]:
+            response = self.client.patch(url, {'latitude': -1.9, 'longitude': 30, 'ts': ts}, format='json')
+            self.assertEqual(response.status_code, 400, ts)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_only_the_user_can_move_themselves(self):
+        other = make_user('other')
+        body = {'latitude': -1.9, 'longitude': 30}
+        response = self.client.patch(reverse('update-location', kwargs={'user_id': other.pk}), body, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.patch(reverse('update-location', kwargs={'user_id': uuid.uuid4()}), body, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_batch_rejects_invalid_pings_and_keeps_the_rest(self):
+        pings = [
+            {'userId': str(self.user.pk), 'latitude': 'nan', 'longitude': 30},
+            {'userId': str(self.user.pk), 'latitude': -1.9, 'longitude': 30.1},
+            {'userId': str(self.user.pk), 'latitude': 'inf', 'longitude': 30},
+        ]
+        response = self.client.post(reverse('batch-locations'), {'pings': pings}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'accepted': 1, 'dropped': 0, 'rejected': [0, 2]})
+        self.assertEqual(self.buffer.flush(), 1)
+
+
+class LocationHistoryTests(TestCase):
+    def setUp(self):
+        self.user = make_user('driver', roleKey='driver')
+        self.buffer = LocationHistoryBuffer(flush_interval=0)
+
+    def test_encode_decode_round_trip(self):
+        ms = [1_700_000_000_000, 1_700_000_001_000, 1_700_000_003_500]
+        lat = [-1_950_000, -1_950_120, -1_949_000]
+        lng = [30_060_000, 30_061_000, 30_059_999]
+        for column, expected in zip(decode_points(encode_points(ms, lat, lng)), (ms, lat, lng)):
+            self.assertEqual(column.tolist(), expected)
+
+    def test_simplify_keeps_endpoints_and_corners(self):
+        # An L-shaped path: straight north, then straight east
+        lat = np.array([0.0, 0.001, 0.002, 0.003, 0.003, 0.003, 0.003])
+        lng = np.array([0.0, 0.0, 0.0, 0.0, 0.001, 0.002, 0.003])
+        self.assertEqual(simplify(lat, lng, tolerance_m=1).tolist(), [0, 3, 6])
+        self.assertEqual(simplify(lat, lng, max_points=3).tolist(), [0, 3, 6])
+        self.assertEqual(len(simplify(lat, lng)), 7)
+
+    def test_flush_and_replay(self):
+        start = 1_700_000_000
+        for offset in range(5):
+            self.buffer.add(self.user.pk, -1.95 + offset * 0.001, 30.06, start + offset)
+        self.buffer.add(self.user.pk, -1.95, 30.06, start)
+        self.assertEqual(self.buffer.flush(), 6)
+        points, total = location_path(
+            self.user.pk,
+            datetime.fromtimestamp(start, tz=dt_timezone.utc),
+            datetime.fromtimestamp(start + 10, tz=dt_timezone.utc),
+            tolerance_m=1,
+        )
+        self.assertEqual(total, 5)
+        self.assertEqual([point[0] for point in points], [start, start + 4])
+
+    def test_unencodable_pings_are_dropped_not_requeued(self):
+        start = 1_700_000_000
+        self.assertFalse(self.buffer.add(self.user.pk, float('nan'), 30.06, start))
+        self.assertFalse(self.buffer.add(self.user.pk, -1.95, float('inf'), start))
+        self.assertFalse(self.buffer.add(self.user.pk, -1.95, 30.06, float('inf')))
+        self.assertTrue(self.buffer.add(self.user.pk, -1.95, 30.06, start))
+        self.assertEqual(self.buffer.stats['dropped'], 3)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.flush(), 0)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        base = timezone.now()
+        for i in range(7):
+            # Three rows share a timestamp, so pages have to break ties on id
+            backdate(make_order(self.user, origin=f'o{i}'), base + timedelta(seconds=min(i, 3)))
+        self.expected = [
+            str(pk) for pk in Order.objects.order_by('created_at', 'pk').values_list('pk', flat=True)
+        ]
+
+    def test_pages_forward_without_gaps_or_repeats(self):
+        pages = walk_pages(self, reverse('all-orders'), {'limit': 3}, 'next')
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+
+    def test_pages_backward_from_a_cursor(self):
+        last = self.client.get(reverse('all-orders'), {'limit': 5}).data['after']
+        pages = walk_pages(self, reverse('all-orders'), {'limit': 2, 'before': last}, 'previous')
+        self.assertEqual([pk for page in reversed(pages) for pk in page], self.expected[:4])
+
+    def test_after_the_last_row_is_empty(self):
+        last = self.client.get(reverse('all-orders'), {'limit': 10}).data['after']
+        response = self.client.get(reverse('all-orders'), {'after': last})
+        self.assertEqual(response.data['results'], [])
+        self.assertIsNone(response.data['next'])
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.client.get(reverse('all-orders'), {'limit': 0}).data['results']), 1)
+        self.assertEqual(len(self.client.get(reverse('all-orders'), {'limit': 'x'}).data['results']), 7)
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ['garbage', encode_cursor(timezone.now(), 'not-a-uuid')]:
+            self.assertEqual(self.client.get(reverse('all-orders'), {'after': cursor}).status_code, 404)
+
+    def test_cursor_round_trip(self):
+        value, pk = timezone.now(), uuid.uuid4()
+        self.assertEqual(decode_cursor(encode_cursor(value, pk)), (value, pk))
+
+
+class RealtimeTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fanout = InMemoryFanout()
+        patcher = mock.patch('api.realtime._fanout', self.fanout)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        return mock.patch.object(self.fanout, 'publish', wraps=self.fanout.publish)
+
+    def test_new_message_is_pushed_to_every_member_on_commit(self):
+        with self.published() as publish, self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(chat=self.chat, sender=self.user, text='hello')
+            publish.assert_not_called()
+        groups = {call.args[0] for call in publish.call_args_list}
+        self.assertEqual(groups, {user_group(self.user.pk), user_group(self.other.pk)})
+        self.assertEqual(publish.call_args.args[1]['type'], 'message.created')
+        self.assertEqual(publish.call_args.args[1]['data']['text'], 'hello')
+
+    def test_order_events_reach_sender_and_receiver(self):
+        with self.published() as publish, self.captureOnCommitCallbacks(execute=True):
+            make_order(self.user, receiver=self.other).delete()
+        events = [(call.args[0], call.args[1]['type']) for call in publish.call_args_list]
+        self.assertEqual(sorted(events), sorted([
+            (user_group(self.user.pk), 'order.created'), (user_group(self.other.pk), 'order.created'),
+            (user_group(self.user.pk), 'order.deleted'), (user_group(self.other.pk), 'order.deleted'),
+        ]))
+
+    async def test_slow_subscriber_loses_its_oldest_events(self):
+        subscription = Subscription(max_queue=2)
+        for i in range(3):
+            subscription.offer(i)
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual([subscription.queue.get_nowait() for _ in range(2)], [1, 2])
+
+    async def connect(self, query_string):
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        await incoming.put({'type': 'websocket.connect'})
+        scope = {'type': 'websocket', 'query_string': query_string.encode(), 'headers': []}
+        task = asyncio.ensure_future(websocket_application(scope, incoming.get, outgoing.put))
+        return task, incoming, outgoing
+
+    async def test_websocket_delivers_events_and_answers_pings(self):
+        token = str(AccessToken.for_user(self.user))
+        task, incoming, outgoing = await self.connect(f'token={token}')
+        self.assertEqual((await outgoing.get())['type'], 'websocket.accept')
+
+        self.assertEqual(self.fanout.publish(user_group(self.user.pk), {'type': 'order.created'}), 1)
+        self.assertEqual(json.loads((await outgoing.get())['text']), {'type': 'order.created'})
+        await incoming.put({'type': 'websocket.receive', 'text': 'ping'})
+        self.assertEqual((await outgoing.get())['text'], 'pong')
+
+        await incoming.put({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(self.fanout.subscriber_count(), 0)
+
+    async def test_websocket_refuses_a_bad_token(self):
+        task, _, outgoing = await self.connect('token=nope')
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(await outgoing.get(), {'type': 'websocket.close', 'code': 4401})
+
+
+class DirectChatTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = make_user('other')
+
+    def create_chat(self, sender, receiver):
+        return self.client.post(
+            reverse('create-chat'), {'senderId': str(sender.pk), 'receiverId': str(receiver.pk)}, format='json'
+        )
+
+    def test_one_chat_per_pair_with_a_membership_each(self):
+        first = self.create_chat(self.user, self.other)
+        second = self.create_chat(self.other, self.user)
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(first.data['id'], second.data['id'])
+        memberships = ChatMember.objects.filter(chat_id=first.data['id'])
+        self.assertEqual(
+            set(memberships.values_list('user_id', 'counterpart_id')),
+            {(self.user.pk, self.other.pk), (self.other.pk, self.user.pk)},
+        )
+        chats = Chat.objects.for_user(self.other.pk).values_list('pk', flat=True)
+        self.assertEqual([str(pk) for pk in chats], [str(first.data['id'])])
+
+    def test_rejects_a_chat_with_oneself(self):
+        response = self.create_chat(self.user, self.user)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Chat.objects.exists())
+
+
+class OrderFilterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = make_user('other')
+        for origin, complete in [('Kimihurura', False), ('Kimironko', True), ('Nyamirambo', False)]:
+            make_order(self.user, origin=origin, destination='Remera', isComplete=complete)
+        make_order(self.other, origin='Kimihurura', destination='Remera')
+
+    def test_filters_combine(self):
+        response = self.client.get(
+            reverse('all-orders'), {'sender': str(self.user.pk), 'origin': 'Kimi', 'isComplete': 'false'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['origin'] for order in response.data['results']], ['Kimihurura'])
+
+    def test_counts(self):
+        response = self.client.get(reverse('order-counts'))
+        self.assertEqual(response.data, {'open': 3, 'complete': 1, 'total': 4})
+        response = self.client.get(reverse('order-counts'), {'groupBy': 'sender', 'isComplete': 'false'})
+        totals = {str(row['user']): row['total'] for row in response.data}
+        self.assertEqual(totals, {str(self.user.pk): 2, str(self.other.pk): 1})
+
+    def test_invalid_filters_are_400(self):
+        for params in [
+            {'createdAfter': '2024-02-30'}, {'createdAfter': '2024-02-10T25:00'},
+            {'createdBefore': 'yesterday'}, {'sender': 'nobody'}, {'isComplete': 'maybe'},
+        ]:
+            for name in ('all-orders', 'order-counts'):
+                response = self.client.get(reverse(name), params)
+                self.assertEqual(response.status_code, 400, (name, params))
+                self.assertIn(next(iter(params)), response.data)
+
+
+class TranslationServiceTests(TestCase):
+    def setUp(self):
+        self.backend = FakeTranslator()
+
+    def test_cache_is_bounded_and_keyed_by_language(self):
+        service = TranslationService(self.backend, cache_size=2)
+        for text in ['a', 'b', 'c']:
+            service.translate(text, 'fr')
+        self.assertEqual(service.stats()['size'], 2)
+        self.assertEqual(service.translate('a', 'fr'), '[fr] a')
+        self.assertEqual(service.translate('a', 'rw'), '[rw] a')
+        self.assertEqual(self.backend.calls, 5)
+
+    def test_persistent_tier_is_shared_between_services(self):
+        TranslationService(self.backend, persistent=True).translate('hi', 'fr')
+        fresh = TranslationService(FakeTranslator(), persistent=True)
+        self.assertEqual(fresh.translate_many(['hi', 'hi'], 'fr'), ['[fr] hi', '[fr] hi'])
+        self.assertEqual(fresh.backend.calls, 0)
+        self.assertEqual(fresh.stats()['db_hits'], 2)
+        self.assertEqual(TranslationCacheEntry.objects.count(), 1)
+
+    def test_backend_errors_fall_back_to_the_original_text(self):
+        service = TranslationService(self.backend)
+        with mock.patch.object(self.backend, 'translate', side_effect=RuntimeError('quota')):
+            with self.assertLogs('api.translation', 'ERROR'):
+                self.assertEqual(service.translate('hi', 'fr'), 'hi')
+            with self.assertRaises(RuntimeError):
+                service.translate_many(['hi'], 'fr', fallback=False)
+        self.assertEqual(service.stats()['errors'], 2)
+        self.assertEqual(service.translate('hi', 'fr'), '[fr] hi')
+
+
+class TranslationTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = FakeTranslator()
+        self.service = TranslationService(self.backend)
+
+    def test_translates_each_text_once(self):
+        self.assertEqual(self.service.translate_many(['hi', 'bye', 'hi'], 'fr'), ['[fr] hi', '[fr] bye', '[fr] hi'])
+        self.assertEqual(self.service.translate('hi', 'fr'), '[fr] hi')
+        self.assertEqual(self.backend.calls, 1)
+        self.assertEqual(self.service.stats()['hits'], 1)
+
+    def test_pool_translates_pending_messages_by_language(self):
+        messages = [
+            Message.objects.create(chat=self.chat, sender=self.user, text=text, target_language=language,
+                                   translation_status=Message.TRANSLATION_PENDING)
+            for text, language in [('one', 'fr'), ('two', 'rw'), ('three', 'fr')]
+        ]
+        pool = TranslationWorkerPool(self.service)
+        self.assertEqual(pool.process([message.pk for message in messages]), 3)
+        self.assertEqual(self.backend.calls, 2)
+        message = Message.objects.get(pk=messages[1].pk)
+        self.assertEqual((message.translated_text, message.translation_status), ('[rw] two', Message.TRANSLATION_DONE))
+
+    def test_add_message_queues_translation(self):
+        with mock.patch('api.views.get_translation_pool') as get_pool, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('add-message'), {
+                'chatId': str(self.chat.pk), 'senderId': str(self.user.pk), 'text': 'bonjour', 'senderLanguage': 'fr',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['translation_status'], Message.TRANSLATION_PENDING)
+        get_pool.return_value.submit.assert_called_once_with(uuid.UUID(response.data['id']))
+
+    def test_add_message_rejects_invalid_languages(self):
+        for language in ['x' * 17, 'fr; drop', '', 7]:
+            response = self.client.post(reverse('add-message'), {
+                'chatId': str(self.chat.pk), 'senderId': str(self.user.pk), 'text': 'hi', 'senderLanguage': language,
+            }, format='json')
+            self.assertEqual(response.status_code, 400, language)
+        self.assertFalse(Message.objects.exists())
+
+
+class DispatchTests(TestCase):
+    def points(self, rng, count):
+        return np.column_stack((rng.uniform(-2.0, -1.9, count), rng.uniform(30.0, 30.1, count)))
+
+    def total(self, distances, pairs):
+        return sum(distances[row, col] for row, col in pairs)
+
+    def test_optimal_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        for orders, drivers in [(5, 6), (6, 4), (5, 5)]:
+            order_points, driver_points = self.points(rng, orders), self.points(rng, drivers)
+            distances = distance_matrix_km(order_points, driver_points)
+            result = assign_optimal(order_points, driver_points)
+            self.assertEqual(len(result), min(orders, drivers))
+            self.assertEqual(len({col for _, col, _ in result}), len(result))
+            if orders <= drivers:
+                best = min(self.total(distances, enumerate(cols)) for cols in permutations(range(drivers), orders))
+            else:
+                best = min(self.total(distances, ((row, col) for col, row in enumerate(rows)))
+                           for rows in permutations(range(orders), drivers))
+            self.assertAlmostEqual(sum(km for _, _, km in result), best, places=6)
+
+    def test_optimal_beats_greedy_where_nearest_first_is_wrong(self):
+        # Greedy gives the shared nearby driver to order 1 and strands order 0
+        order_points = np.array([(0.0, 0.0), (0.0, 0.01)])
+        driver_points = np.array([(0.0, 0.009), (0.0, 0.03)])
+        greedy = assign_greedy(order_points, driver_points)
+        optimal = assign_optimal(order_points, driver_points)
+        self.assertEqual(sorted((row, col) for row, col, _ in greedy), [(0, 1), (1, 0)])
+        self.assertEqual(sorted((row, col) for row, col, _ in optimal), [(0, 0), (1, 1)])
+        self.assertLess(sum(km for _, _, km in optimal), sum(km for _, _, km in greedy))
+
+    def test_greedy_retries_orders_whose_candidates_were_taken(self):
+        rng = np.random.default_rng(3)
+        order_points = np.tile([(-1.95, 30.06)], (GREEDY_CANDIDATES + 4, 1))
+        driver_points = self.points(rng, 2 * GREEDY_CANDIDATES)
+        result = assign_greedy(order_points, driver_points)
+        self.assertEqual(len(result), GREEDY_CANDIDATES + 4)
+        self.assertEqual(len({col for _, col, _ in result}), len(result))
+        distances = [km for _, _, km in result]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_max_distance_is_respected(self):
+        order_points = np.array([(0.0, 0.0), (10.0, 10.0)])
+        driver_points = np.array([(0.0, 0.01), (0.0, 0.02)])
+        for assign in (assign_greedy, assign_optimal):
+            result = assign(order_points, driver_points, max_km=5)
+            self.assertEqual([(row, col) for row, col, _ in result], [(0, 0)], assign.__name__)
+
+    def test_run_dispatch_assigns_free_fresh_drivers(self):
+        now = timezone.now()
+        free = make_user('free', roleKey='driver', latitude=-1.95, longitude=30.06, location_updated_at=now)
+        busy = make_user('busy', roleKey='driver', latitude=-1.95, longitude=30.06, location_updated_at=now)
+        make_user('stale', roleKey='driver', latitude=-1.95, longitude=30.06,
+                  location_updated_at=now - timedelta(hours=1))
+        rider = make_user('rider', latitude=-1.951, longitude=30.061)
+        make_order(rider, receiver=busy)
+        queued = [make_order(rider) for _ in range(2)]
+
+        with mock.patch('api.dispatch.publish_to_users') as publish, self.captureOnCommitCallbacks(execute=True):
+            result = run_dispatch(mode='auto')
+        self.assertEqual((result.orders, result.drivers, result.assigned, result.mode), (2, 1, 1, 'optimal'))
+        self.assertEqual(
+            [order.receiver_id for order in Order.objects.filter(pk__in=[order.pk for order in queued])
+             .order_by('created_at')],
+            [free.pk, None],
+        )
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args.args[1], 'order.assigned')
+
+
+class FastSerializerTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        make_user('located', roleKey='driver', latitude=-1.95, longitude=30.06)
+        Message.objects.create(chat=self.chat, sender=self.user, text='hello')
+        make_order(self.user)
+        make_order(self.user, receiver=self.other, receiverName='other', isComplete=True)
+
+    def test_output_matches_the_model_serializer(self):
+        for serializer_class, model in [
+            (UserSerializer, User), (ChatSerializer, Chat), (MessageSerializer, Message), (OrderSerializer, Order),
+        ]:
+            queryset = model.objects.order_by('created_at', 'pk')
+            fast = FastListSerializer(serializer_class).serialize(queryset)
+            slow = serializer_class(queryset, many=True).data
+            self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(slow), model.__name__)
+
+    def test_list_views_use_the_fast_path(self):
+        with mock.patch.object(OrderSerializer, 'to_representation') as slow:
+            response = self.client.get(reverse('all-orders'))
+        self.assertEqual(len(response.data['results']), 2)
+        slow.assert_not_called()
+
+
+class ConditionalGetTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.message = Message.objects.create(chat=self.chat, sender=self.user, text='hello')
+        self.url = reverse('get-messages', args=[self.chat.pk])
+        cache.clear()
+
+    def revalidate(self, url, etag, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_current_etag_gets_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        response = self.revalidate(self.url, first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(self.revalidate(self.url, '*').status_code, 304)
+
+    def test_each_page_has_its_own_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.revalidate(self.url, etag, limit=1).status_code, 200)
+
+    def test_new_and_deleted_rows_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Message.objects.create(chat=self.chat, sender=self.other, text='hi')
+        response = self.revalidate(self.url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+        # Deleting the older message leaves max(updated_at) unchanged
+        etag = response['ETag']
+        Message.objects.filter(pk=self.message.pk).delete()
+        self.assertEqual(self.revalidate(self.url, etag).status_code, 200)
+
+    def test_location_pings_change_the_user_etag(self):
+        url = reverse('get-user', args=[self.other.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        User.objects.filter(pk=self.other.pk).update(latitude=-1.9, longitude=30.1)
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_response_cache_is_dropped_on_invalidation(self):
+        build = mock.Mock(return_value={'value': 1})
+        request = RequestFactory().get('/resource/')
+        for _ in range(2):
+            response = conditional_response(request, ('thing', 1), 'v1', None, build)
+        self.assertEqual((response.data, build.call_count), ({'value': 1}, 1))
+        invalidate_resource('thing', 1)
+        conditional_response(request, ('thing', 1), 'v1', None, build)
+        self.assertEqual(build.call_count, 2)
+
+
+class PrincipalCacheTests(TestCase):
+    def setUp(self):
+        self.user = make_user('tester')
+        self.token = AccessToken.for_user(self.user)
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def test_second_lookup_skips_the_database(self):
+        auth = CachedJWTAuthentication()
+        self.assertEqual(auth.get_user(self.token).pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = auth.get_user(self.token)
+        user.username = 'changed'
+        self.assertEqual(auth.get_user(self.token).username, 'tester')
+
+    def test_saving_the_user_invalidates_the_entry(self):
+        auth = CachedJWTAuthentication()
+        auth.get_user(self.token)
+        User.objects.get(pk=self.user.pk).save()
+        with self.assertNumQueries(1):
+            auth.get_user(self.token)
+
+    def test_cached_inactive_user_is_refused(self):
+        self.user.is_active = False
+        user_cache.set(self.user)
+        with self.assertRaises(AuthenticationFailed):
+            CachedJWTAuthentication().get_user(self.token)
+
+    def test_entries_expire_and_are_bounded(self):
+        principals = UserPrincipalCache(ttl=30, max_size=1)
+        other = make_user('other')
+        principals.set(self.user)
+        principals.set(other)
+        self.assertIsNone(principals.get(self.user.pk))
+        self.assertEqual(principals.get(other.pk).pk, other.pk)
+        with mock.patch('api.authentication.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertIsNone(principals.get(other.pk))
+
+
+class AsyncAuthTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, **fields):
+        data = {'username': 'rider', 'email': 'rider@example.com', 'password': 'secret1', 'roleKey': 'rider',
+                'city': 'Kigali'}
+        data.update(fields)
+        return self.client.post(reverse('register'), data, format='json')
+
+    def login(self, password):
+        return self.client.post(reverse('login'), {'email': 'rider@example.com', 'password': password}, format='json')
+
+    def test_register_then_login(self):
+        response = self.register()
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(pk=response.json()['id']).check_password('secret1'))
+
+        response = self.login('secret1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.json()['data']['token'])['user_id'], response.json()['data']['user']['id'])
+
+    def test_bad_credentials_look_alike(self):
+        self.register()
+        wrong = self.login('wrong-password')
+        self.assertEqual(wrong.status_code, 400)
+        self.assertEqual(
+            self.client.post(reverse('login'), {'email': 'nobody@example.com', 'password': 'x'}, format='json').json(),
+            wrong.json(),
+        )
+
+    def test_rejects_invalid_input(self):
+        self.assertEqual(self.register(password='short').status_code, 400)
+        self.register()
+        self.assertEqual(self.register().status_code, 400)
+        response = self.client.post(reverse('login'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_overloaded_hashing_pool_answers_429(self):
+        self.register()
+        with mock.patch('api.async_views.get_hashing_pool') as get_pool:
+            get_pool.return_value.run.side_effect = HashingOverloaded
+            response = self.login('secret1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_pool_rejects_work_beyond_its_queue(self):
+        pool = PasswordHashingPool(workers=1, max_queue=0)
+        release = threading.Event()
+        running = pool._submit(release.wait)
+        with self.assertRaises(HashingOverloaded):
+            pool.call(len, 'x')
+        finished = threading.Event()
+        # Runs after the pool's own callback has freed the slot
+        running.add_done_callback(lambda _: finished.set())
+        release.set()
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(pool.call(len, 'x'), 1)
+        self.assertEqual(pool.rejected, 1)
+
+
+class BatchMessageTests(ChatTestCase):
+    def item(self, **fields):
+        return {'chatId': str(self.chat.pk), 'senderId': str(self.user.pk), 'text': 'hi', **fields}
+
+    def test_saves_valid_items_and_reports_the_rest(self):
+        items = [
+            self.item(text='first'),
+            self.item(senderLanguage='x' * 40),
+            self.item(chatId=str(uuid.uuid4())),
+            self.item(text=''),
+            self.item(text='second', senderLanguage='fr'),
+        ]
+        with mock.patch('api.views.BatchMessageView.notify'), mock.patch('api.views.get_translation_pool'):
+            response = self.client.post(reverse('batch-messages'), {'messages': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 3))
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 400, 404, 400, 201])
+        self.assertIn('senderLanguage', response.data['results'][1]['error'])
+        self.assertEqual(
+            sorted(Message.objects.values_list('text', 'target_language')), [('first', 'en'), ('second', 'fr')]
+        )
+        membership = ChatMember.objects.get(chat=self.chat, user=self.other)
+        self.assertEqual(membership.unread_count, 2)
+
+
+class InboxTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = make_user('first')
+        self.second = make_user('second')
+        self.older = make_chat(self.user, self.first)
+        self.newer = make_chat(self.user, self.second)
+
+    def send(self, chat, sender, text):
+        response = self.client.post(
+            reverse('add-message'), {'chatId': str(chat.pk), 'senderId': str(sender.pk), 'text': text}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def inbox(self, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.user)
+        return client.get(reverse('inbox', args=[(user or self.user).pk])).data['results']
+
+    def test_most_recent_chat_first_with_unread_counts(self):
+        self.send(self.older, self.first, 'one')
+        self.send(self.older, self.first, 'two')
+        last = self.send(self.newer, self.user, 'three')
+
+        with self.assertNumQueries(1):
+            self.client.get(reverse('inbox', args=[self.user.pk]))
+        entries = self.inbox()
+        self.assertEqual([entry['chat'] for entry in entries], [str(self.newer.pk), str(self.older.pk)])
+        self.assertEqual(entries[0]['last_message']['id'], str(last['id']))
+        self.assertEqual(entries[0]['counterpart']['id'], str(self.second.pk))
+        self.assertEqual([entry['unread_count'] for entry in entries], [0, 2])
+        self.assertEqual(self.inbox(self.second)[0]['unread_count'], 1)
+
+    def test_only_the_owner_sees_an_inbox(self):
+        self.assertEqual(self.client.get(reverse('inbox', args=[self.second.pk])).status_code, 403)
+
+    def test_an_older_message_does_not_replace_the_last_one(self):
+        newest = Message.objects.create(chat=self.older, sender=self.first, text='new')
+        Chat.objects.record_message(newest)
+        late = Message.objects.create(chat=self.older, sender=self.first, text='late')
+        backdate(late, newest.created_at - timedelta(minutes=1))
+        late.refresh_from_db()
+        Chat.objects.record_message(late)
+        self.older.refresh_from_db()
+        self.assertEqual(self.older.last_message_id, newest.pk)
+        self.assertEqual(ChatMember.objects.get(chat=self.older, user=self.user).unread_count, 2)
+
+    def test_mark_read_resets_the_counter(self):
+        self.send(self.older, self.first, 'one')
+        response = self.client.post(reverse('mark-chat-read', args=[self.older.pk]), {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        membership = ChatMember.objects.get(chat=self.older, user=self.user)
+        self.assertEqual(membership.unread_count, 0)
+        self.assertIsNotNone(membership.last_read_at)
+
+        # Always the requesting user's membership, whatever the body says
+        self.send(self.newer, self.user, 'two')
+        response = self.client.post(
+            reverse('mark-chat-read', args=[self.newer.pk]), {'userId': str(self.second.pk)}, format='json'
+        )
+        self.assertEqual(response.data['userId'], str(self.user.pk))
+        self.assertEqual(ChatMember.objects.get(chat=self.newer, user=self.second).unread_count, 1)
+
+        elsewhere = make_chat(self.first, self.second)
+        self.assertEqual(self.client.post(reverse('mark-chat-read', args=[elsewhere.pk])).status_code, 404)
+
+
+class MessageArchiveTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        old = timezone.now() - timedelta(days=365)
+        backdate(self.chat, old)
+        for i in range(12):
+            message = Message.objects.create(chat=self.chat, sender=self.user if i % 2 else self.other, text=f'm{i}')
+            if i < 10:
+                backdate(message, old + timedelta(minutes=i))
+        Chat.objects.record_messages(Message.objects.filter(chat=self.chat))
+        self.rows = list(Message.objects.filter(chat=self.chat).order_by('created_at', 'id').values(*ARCHIVE_COLUMNS))
+        self.ids = [str(row['id']) for row in self.rows]
+        self.url = reverse('get-messages', args=[self.chat.pk])
+
+    def test_segments_round_trip(self):
+        self.assertEqual(decode_segment(encode_segment(self.rows), self.chat.pk), self.rows)
+
+    def test_moves_old_messages_into_full_segments(self):
+        result = run_archive(segment_size=4)
+        self.assertEqual((result.chats, result.messages), (1, 10))
+        self.assertEqual(
+            list(MessageArchive.objects.order_by('first_at').values_list('message_count', flat=True)), [4, 4, 2]
+        )
+        self.assertEqual(Message.objects.count(), 2)
+        archived = [
+            row for segment in MessageArchive.objects.order_by('first_at')
+            for row in decode_segment(segment.data, self.chat.pk)
+        ]
+        self.assertEqual(archived, self.rows[:10])
+        self.assertEqual(run_archive(segment_size=4).messages, 0)
+
+    def test_pending_translation_holds_back_the_rest(self):
+        Message.objects.filter(pk=self.rows[5]['id']).update(translation_status=Message.TRANSLATION_PENDING)
+        self.assertEqual(run_archive(segment_size=4).messages, 5)
+
+    def test_paging_back_reads_through_to_the_archive(self):
+        before = walk_pages(self, self.url, {'limit': 3}, 'previous')
+        run_archive(segment_size=4)
+        after = walk_pages(self, self.url, {'limit': 3}, 'previous')
+        self.assertEqual(after, before)
+        self.assertEqual([pk for page in reversed(after) for pk in page], self.ids)
+
+    def test_paging_forward_from_an_archived_cursor(self):
+        cursor = encode_cursor(self.rows[0]['created_at'], self.rows[0]['id'])
+        run_archive(segment_size=4)
+        pages = walk_pages(self, self.url, {'limit': 4, 'after': cursor}, 'next')
+        self.assertEqual([pk for page in pages for pk in page], self.ids[1:])
+
+    def test_paging_forward_past_an_archive_newer_than_the_setting(self):
+        cursor = encode_cursor(self.rows[0]['created_at'], self.rows[0]['id'])
+        with override_settings(MESSAGE_ARCHIVE_AFTER_DAYS=400):
+            run_archive(older_than=timedelta(days=1), segment_size=4)
+            pages = walk_pages(self, self.url, {'limit': 4, 'after': cursor}, 'next')
+        self.assertEqual([pk for page in pages for pk in page], self.ids[1:])
+
+
+class EstimateTests(APITestCase):
+    def test_vectorized_distances_match_the_scalar_formula(self):
+        rng = np.random.default_rng(11)
+        points = np.column_stack((rng.uniform(-80, 80, 50), rng.uniform(-180, 180, 50),
+                                  rng.uniform(-80, 80, 50), rng.uniform(-180, 180, 50)))
+        expected = [haversine_km(*row) for row in points.tolist()]
+        np.testing.assert_allclose(haversine_km_many(*points.T), expected, rtol=1e-9)
+
+    def test_speed_bands(self):
+        seconds = travel_seconds([0, 1, 5, 20], bands=DEFAULT_SPEED_BANDS, detour=1.0)
+        np.testing.assert_allclose(seconds, [0, 240, 480 + 432, 480 + 1152 + 900])
+
+    def test_cache_does_not_change_results(self):
+        origins = np.array([(-1.95, 30.06)] * 3)
+        destinations = np.array([(-1.96, 30.07), (-1.97, 30.08), (-1.96, 30.07)])
+        pairs = PairCache(1024)
+        expected = estimate(origins, destinations)
+        for _ in range(2):
+            for actual, wanted in zip(estimate(origins, destinations, pairs), expected):
+                np.testing.assert_array_equal(actual, wanted)
+        self.assertEqual(pairs.stats, {'hits': 3, 'misses': 3})
+
+    def test_pairs_and_broadcast(self):
+        url = reverse('order-estimates')
+        response = self.client.post(url, {
+            'origins': [[-1.95, 30.06], [-1.95, 30.06]], 'destinations': [[-1.95, 30.06], [-1.96, 30.07]],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['distance_km'][0], 0)
+        self.assertEqual(response.data['eta_seconds'][0], 0)
+
+        response = self.client.post(url, {
+            'origins': [[-1.95, 30.06]], 'destinations': [[-1.96, 30.07]] * 3,
+        }, format='json')
+        self.assertEqual(response.data['count'], 3)
+
+    def test_rejects_bad_points(self):
+        url = reverse('order-estimates')
+        for origins, destinations in [
+            ([[-1.95, 30.06]] * 2, [[-1.96, 30.07]] * 3),
+            ([['nan', 30.06]], [[-1.96, 30.07]]),
+            ([[91, 30.06]], [[-1.96, 30.07]]),
+            ([], [[-1.96, 30.07]]),
+            ([[-1.95]], [[-1.96, 30.07]]),
+        ]:
+            response = self.client.post(url, {'origins': origins, 'destinations': destinations}, format='json')
+            self.assertEqual(response.status_code, 400, origins)
+
+    def test_order_against_drivers_fastest_first(self):
+        rider = make_user('rider', latitude=-1.95, longitude=30.06)
+        far = make_user('far', roleKey='driver', latitude=-1.99, longitude=30.10)
+        near = make_user('near', roleKey='driver', latitude=-1.951, longitude=30.061)
+        order = make_order(rider)
+        response = self.client.post(reverse('order-estimates'), {
+            'orderId': str(order.pk), 'driverIds': [str(far.pk), str(near.pk)],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([driver['id'] for driver in response.data['drivers']], [str(near.pk), str(far.pk)])
+
+        response = self.client.post(reverse('order-estimates'), {'orderId': str(order.pk)}, format='json')
+        self.assertEqual([driver['id'] for driver in response.data['drivers']], [str(near.pk), str(far.pk)])
+
+    def test_order_errors(self):
+        order = make_order(self.user)
+        url = reverse('order-estimates')
+        self.assertEqual(self.client.post(url, {'orderId': str(uuid.uuid4())}, format='json').status_code, 404)
+        self.assertEqual(self.client.post(url, {'orderId': str(order.pk)}, format='json').status_code, 409)
+        response = self.client.post(url, {'orderId': str(order.pk), 'driverIds': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice', city='Musanze')
+        self.alicia = make_user('alicia', city='Huye')
+        self.chat = make_chat(self.user, self.alice)
+        self.other_chat = make_chat(self.alice, self.alicia)
+        for text in ['pick me up at the market', 'market is closed today', 'see you at the station']:
+            Message.objects.create(chat=self.chat, sender=self.user, text=text)
+        Message.objects.create(chat=self.other_chat, sender=self.alice, text='meet at the market')
+
+    def found(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_users_by_substring_and_city(self):
+        names = [user['username'] for user in self.found(reverse('search-users'), q='alic')]
+        self.assertEqual(sorted(names), ['alice', 'alicia'])
+        self.assertEqual([user['username'] for user in self.found(reverse('search-users'), q='huye')], ['alicia'])
+        self.assertEqual(self.client.get(reverse('search-users'), {'q': 'al'}).status_code, 400)
+
+    def test_index_follows_updates_and_soft_deletes(self):
+        User.objects.filter(pk=self.alicia.pk).update(city='Rubavu')
+        self.assertEqual(self.found(reverse('search-users'), q='huye'), [])
+        soft_delete_user(self.alice)
+        self.assertEqual([user['username'] for user in self.found(reverse('search-users'), q='alic')], ['alicia'])
+
+    def test_messages_need_every_word_and_prefix_the_last(self):
+        texts = {message['text'] for message in self.found(reverse('search-messages'), q='market clo')}
+        self.assertEqual(texts, {'market is closed today'})
+        self.assertEqual(len(self.found(reverse('search-messages'), q='mark')), 3)
+
+    def test_messages_within_a_chat_or_a_users_chats(self):
+        url = reverse('search-messages')
+        self.assertEqual(len(self.found(url, q='market', chatId=str(self.chat.pk))), 2)
+        self.assertEqual(len(self.found(url, q='market', userId=str(self.alicia.pk))), 1)
+        self.assertEqual(len(self.found(url, q='market', userId=str(uuid.uuid4()))), 0)
+        self.assertEqual(self.client.get(url, {'q': 'market', 'chatId': 'x'}).status_code, 400)
+
+    def test_results_page_by_score(self):
+        pages = walk_pages(self, reverse('search-messages'), {'q': 'market', 'limit': 1}, 'next')
+        everything = self.found(reverse('search-messages'), q='market')
+        self.assertEqual([pk for page in pages for pk in page], [message['id'] for message in everything])
+
+
+class RollupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = RollupBuffer(flush_interval=0)
+        patcher = mock.patch('api.rollups._rollup_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counters(self):
+        return set(Rollup.objects.exclude(value=0).values_list('metric', 'dimension', 'bucket', 'value'))
+
+    def write_history(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            driver = make_user('driver', roleKey='driver')
+            make_user('staying', roleKey='driver', city='Huye')
+            leaving = make_user('leaving', roleKey='driver', city='Huye')
+            promoted = make_user('promoted')
+            rider = make_user('rider', city='Huye')
+            orders = [make_order(sender) for sender in (self.user, self.user, rider, rider)]
+            orders[0].isComplete = True
+            orders[0].save()
+            orders[2].isComplete = True
+            orders[2].save()
+            orders[3].delete()
+            chat = make_chat(self.user, driver)
+            for text in ['one', 'two', 'three']:
+                Message.objects.create(chat=chat, sender=self.user, text=text)
+            promoted.roleKey = 'driver'
+            promoted.save()
+            soft_delete_user(leaving)
+        self.buffer.flush()
+
+    def test_incremental_counters_match_reconcile(self):
+        self.write_history()
+        counted = self.counters()
+        hour = hour_of(timezone.now())
+        self.assertIn((DRIVERS, 'Kigali', TOTAL_BUCKET, 2), counted)
+        self.assertIn((DRIVERS, 'Huye', TOTAL_BUCKET, 1), counted)
+        self.assertIn(('orders_created', 'Kigali', hour, 2), counted)
+        self.assertIn(('orders_completed', 'Huye', hour, 1), counted)
+        self.assertIn(('messages', '', hour, 3), counted)
+
+        Rollup.objects.update(value=0)
+        reconcile(full=True)
+        self.assertEqual(self.counters(), counted)
+
+    def test_archived_messages_still_count(self):
+        self.write_history()
+        old = timezone.now() - timedelta(days=365)
+        Chat.objects.update(created_at=old, last_message=None)
+        Message.objects.update(created_at=old)
+        self.assertEqual(run_archive().messages, 3)
+        reconcile(full=True)
+        self.assertIn(('messages', '', hour_of(old), 3), self.counters())
+
+    def test_failed_flush_keeps_the_deltas(self):
+        self.buffer.add(DRIVERS, 'Kigali', TOTAL_BUCKET, 2)
+        with mock.patch('api.rollups.apply_deltas', side_effect=DatabaseError):
+            with self.assertLogs('api.rollups', 'ERROR'), self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(Rollup.objects.get(metric=DRIVERS).value, 2)
+
+    def test_stats_view(self):
+        self.write_history()
+        response = self.client.get(reverse('stats'), {'hours': 2, 'city': 'Huye'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['city'], row['created'], row['completed']) for row in response.data['orders']],
+                         [('Huye', 1, 1)])
+        self.assertEqual(response.data['drivers'], [{'city': 'Huye', 'count': 1}])
+        self.assertEqual([row['count'] for row in response.data['messages']], [3])
+        for hours in [0, 24 * 7 + 1, 'x']:
+            self.assertEqual(self.client.get(reverse('stats'), {'hours': hours}).status_code, 400)
+
+
+class LoadTestBudgetTests(TestCase):
+    budgets = {'get-user': {'p95_ms': 50, 'queries': 2}}
+
+    def test_passes_within_budget(self):
+        result = RouteResult('get-user', 'GET', latencies=[0.01, 0.02], queries=[2, 2])
+        self.assertEqual(check_budgets([result], self.budgets), [])
+
+    def test_fails_routes_that_raised_or_completed_nothing(self):
+        result = RouteResult('get-user', 'GET', exceptions=3, exception='OperationalError: database is locked')
+        violations = check_budgets([result], self.budgets)
+        self.assertEqual(len(violations), 2)
+        self.assertIn('database is locked', violations[0])
+        self.assertIn('no request completed', violations[1])
+
+    def test_fails_over_budget_and_unbudgeted_routes(self):
+        results = [
+            RouteResult('get-user', 'GET', latencies=[0.2], queries=[3], errors=1),
+            RouteResult('stats', 'GET', latencies=[0.01], queries=[1]),
+        ]
+        violations = check_budgets(results, self.budgets)
+        self.assertEqual(len(violations), 4)
+        self.assertTrue(violations[-1].startswith('stats: no '))
+
+    def test_one_request_over_the_query_budget_fails(self):
+        result = RouteResult('get-user', 'GET', latencies=[0.01] * 100, queries=[2] * 99 + [3])
+        self.assertEqual(check_budgets([result], self.budgets), ['get-user: up to 3 queries/request, budget 2'])
+
+
+class UserDeletionTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        old = timezone.now() - timedelta(days=365)
+        backdate(self.chat, old)
+        for i in range(10):
+            message = Message.objects.create(
+                chat=self.chat, sender=self.user if i % 2 else self.other, text=f'old {i}'
+            )
+            backdate(message, old + timedelta(minutes=i))
+        Message.objects.create(chat=self.chat, sender=self.user, text='recent')
+        Message.objects.create(chat=self.chat, sender=self.other, text='latest')
+        run_archive(segment_size=4)
+        for receiver in (self.other, None, None):
+            make_order(self.user, receiver=receiver)
+        make_order(self.other, receiver=self.user)
+        LocationChunk.objects.create(
+            user=self.user, window_start=old, started_at=old, ended_at=old, point_count=0, data=b''
+        )
+
+    def archived(self):
+        return [
+            row['sender_id'] for segment in MessageArchive.objects.all()
+            for row in decode_segment(segment.data, segment.chat_id)
+        ]
+
+    def test_users_can_only_delete_themselves(self):
+        response = self.client.delete(reverse('delete-user', kwargs={'user_id': self.other.pk}))
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(User.objects.filter(pk=self.other.pk).exists())
+
+        response = self.client.delete(reverse('delete-user', kwargs={'user_id': self.user.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertTrue(User.all_objects.filter(pk=self.user.pk).exists())
+        self.assertTrue(UserPurge.objects.filter(user_id=self.user.pk, finished_at=None).exists())
+
+    def test_purge_removes_the_users_rows_only(self):
+        self.assertEqual(len(self.archived()), 10)
+        soft_delete_user(self.user)
+        result = run_purge(batch_size=2)
+        self.assertEqual(result.users, 1)
+        self.assertFalse(User.all_objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(list(Message.objects.values_list('text', flat=True)), ['latest'])
+        self.assertEqual(self.archived(), [self.other.pk] * 5)
+        self.assertFalse(LocationChunk.objects.exists())
+        membership = ChatMember.objects.get(chat=self.chat)
+        self.assertEqual((membership.user_id, membership.counterpart_id), (self.other.pk, None))
+        purge = UserPurge.objects.get(user_id=self.user.pk)
+        self.assertIsNotNone(purge.finished_at)
+        self.assertEqual(purge.removed['orders'], 4)
+        self.assertEqual(purge.removed['archives'], 5)
+
+    def test_purge_resumes_where_it_stopped(self):
+        soft_delete_user(self.user)
+        purge = UserPurge.objects.get(user_id=self.user.pk)
+        for _ in range(3):
+            purge_step(purge.pk, 1)
+        purge.refresh_from_db()
+        self.assertEqual((purge.stage, purge.removed), ('orders', {'orders': 3}))
+        self.assertEqual(Order.objects.count(), 1)
+        run_purge(batch_size=1)
+        purge.refresh_from_db()
+        self.assertEqual(purge.removed['orders'], 4)
+        self.assertFalse(User.all_objects.filter(pk=self.user.pk).exists())
+        self.assertIsNone(purge_step(purge.pk, 1))
+
+    def test_deleted_users_cannot_subscribe_to_events(self):
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(authenticate_token(token), self.user.pk)
+        soft_delete_user(self.user)
+        self.assertIsNone(authenticate_token(token))
+        self.assertIsNone(authenticate_token('not a token'))
+
+
+class WarmupTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        # Closing for real would end the test's transaction
+        patcher = mock.patch('api.startup.connections.close_all', side_effect=lambda: self.calls.append('close'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_closes_connections_after_every_step(self):
+        def failing():
+            self.calls.append('failing')
+            raise RuntimeError('unreachable')
+
+        warmup = Warmup(steps=[('databases', lambda: self.calls.append('databases')), ('failing', failing)])
+        self.assertFalse(warmup.run())
+        self.assertEqual(self.calls, ['databases', 'failing', 'close'])
+
+    def test_not_ready_until_every_step_succeeds(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError('not yet')
+
+        warmup = Warmup(steps=[('first', lambda: None), ('flaky', flaky)])
+        request = RequestFactory().get('/ready')
+        with mock.patch('api.startup.warmup', warmup):
+            response = ready_view(request)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(json.loads(response.content)['failed'], ['flaky'])
+            response = ready_view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(set(json.loads(response.content)['steps']), {'first', 'flaky'})
+
+    def test_fresh_process_starts_within_budget(self):
+        try:
+            elapsed, report = cold_start()
+        except OSError as e:
+            self.skipTest(f'Cannot start a subprocess here: {e}')
+        self.assertEqual(report['errors'], {})
+        self.assertLessEqual(elapsed, getattr(settings, 'COLD_START_MAX_SECONDS', 3.0))
+
+
+class RequestMetricsTests(TestCase):
+    def view(self, request):
+        with timed('serialize'):
+            with timed('serialize'):
+                User.objects.exists()
+        return HttpResponse('ok')
+
+    def observed(self):
+        return sum(count for (view, _, _), count in registry.requests.items() if view == 'unmatched')
+
+    def test_sync_requests_are_timed(self):
+        before = self.observed()
+        response = RequestMetricsMiddleware(self.view)(RequestFactory().get('/anything'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", serialize;dur=[\d.]+, total;')
+        self.assertEqual(self.observed(), before + 1)
+
+    def test_async_chain_stays_async(self):
+        async def view(request):
+            with timed('external'):
+                pass
+            return HttpResponse('ok')
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/anything'))
+        self.assertIn('external;dur=', response['Server-Timing'])
+        self.assertIn('desc="0 queries"', response['Server-Timing'])
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_translation_cache_counters_are_exported(self):
+        service = TranslationService(FakeTranslator())
+        with mock.patch('api.translation._service', service):
+            service.translate_many(['hi', 'bye', 'hi'], 'fr')
+            service.translate('hi', 'fr')
+            response = self.client.get(reverse('metrics'))
+        body = response.content.decode()
+        self.assertIn('saferide_translation_cache_hits_total{tier="memory"} 1\n', body)
+        self.assertIn('saferide_translation_cache_hits_total{tier="db"} 0\n', body)
+        self.assertIn('saferide_translation_cache_misses_total 3\n', body)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_STICKY_SECONDS=5.0)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.user_id = uuid.uuid4()
+        self.lag = 1.0
+        patcher = mock.patch.object(replica_monitor, 'lag', side_effect=lambda alias: self.lag)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def view(self, request):
+        note_user(self.user_id)
+        return HttpResponse(ReplicaRouter().db_for_read(User))
+
+    def request(self, method, middleware=None):
+        middleware = middleware or ReplicaRoutingMiddleware(self.view)
+        call = async_to_sync(middleware) if iscoroutinefunction(middleware) else middleware
+        return call(RequestFactory().generic(method, '/anything')).content.decode()
+
+    def test_reads_go_to_a_replica_and_writes_to_the_primary(self):
+        self.assertEqual(self.request('GET'), 'replica')
+        self.assertEqual(self.request('POST'), 'default')
+        self.assertEqual(ReplicaRouter().db_for_read(User), 'default')
+
+    def test_reads_after_a_write_wait_for_the_replica_to_catch_up(self):
+        self.request('POST')
+        self.assertEqual(self.request('GET'), 'default')
+        self.lag = 0.0
+        self.assertEqual(self.request('GET'), 'replica')
+
+    def test_async_chain_stays_async(self):
+        async def view(request):
+            note_user(self.user_id)
+            # As the ORM does, the router runs on the sync side
+            return HttpResponse(await sync_to_async(ReplicaRouter().db_for_read)(User))
+
+        middleware = ReplicaRoutingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertEqual(self.request('GET', middleware), 'replica')
+        self.assertEqual(self.request('POST', middleware), 'default')
+        self.assertEqual(self.request('GET', middleware), 'default')
@@ -0,0 +1,347 @@
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Language tags as the translation API takes them: en, pt-BR, zh-CN, mni-Mtei
+_LANGUAGE_CODE = re.compile(r'[A-Za-z]{2,3}(-[A-Za-z0-9]{2,8})*')
+# Message.target_language and TranslationCacheEntry.target_language
+MAX_LANGUAGE_LENGTH = 16
+
+
+class TranslationUnavailable(Exception):
+    pass
+
+
+class BaseTranslator:
+    """Translates a batch of texts into one target language, preserving order."""
+
+    def translate(self, texts, target_language):
+        raise NotImplementedError
+
+
+class GoogleTranslator(BaseTranslator):
+    """Google Cloud Translation with one client shared by the whole process."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    if 'GOOGLE_APPLICATION_CREDENTIALS' not in os.environ:
+                        raise TranslationUnavailable('GOOGLE_APPLICATION_CREDENTIALS not set')
+                    from google.cloud import translate_v2 as translate
+                    self._client = translate.Client()
+        return self._client
+
+    def translate(self, texts, target_language):
+        results = self.get_client().translate(list(texts), target_language=target_language)
+        return [result['translatedText'] for result in results]
+
+
+class FakeTranslator(BaseTranslator):
+    """Deterministic local backend for tests and benchmarks."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def translate(self, texts, target_language):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [f'[{target_language}] {text}' for text in texts]
+
+
+def valid_language(code):
+    return isinstance(code, str) and len(code) <= MAX_LANGUAGE_LENGTH and bool(_LANGUAGE_CODE.fullmatch(code))
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TranslationService:
+    """Translator with a bounded in-process LRU and an optional DB-backed tier.
+
+    Failures never propagate: the original text is returned and nothing is cached.
+    """
+
+    def __init__(self, backend, cache_size=10000, persistent=False):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.persistent = persistent
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'db_hits': 0, 'misses': 0, 'errors': 0}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self._cache)
+        lookups = stats['hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['db_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, translated):
+        self._cache[key] = translated
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def translate(self, text, target_language):
+        return self.translate_many([text], target_language)[0]
+
+    def translate_many(self, texts, target_language, fallback=True):
+        """Translate texts in order. With fallback=False backend errors are raised."""
+        keys = [(text_hash(text), target_language) for text in texts]
+        results = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for index, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.counters['hits'] += 1
+                    results[index] = cached
+                else:
+                    missing.setdefault(key, []).append(index)
+
+        if missing and self.persistent:
+            self._load_persistent(missing, results, target_language)
+
+        if missing:
+            with self._lock:
+                self.counters['misses'] += sum(len(indexes) for indexes in missing.values())
+            unique = list(missing)
+            sources = [texts[missing[key][0]] for key in unique]
+            try:
+                with timed('external'):
+                    translated = self.backend.translate(sources, target_language)
+            except TranslationUnavailable as e:
+                if not fallback:
+                    raise
+                logger.warning(f"{e}. Skipping translation.")
+                translated = None
+            except Exception as e:
+                if not fallback:
+                    with self._lock:
+                        self.counters['errors'] += 1
+                    raise
+                logger.error(f"Translation error: {e}")
+                translated = None
+
+            if translated is None:
+                with self._lock:
+                    self.counters['errors'] += 1
+                for key in unique:
+                    for index in missing[key]:
+                        results[index] = texts[index]
+            else:
+                with self._lock:
+                    for key, value in zip(unique, translated):
+                        self._remember(key, value)
+                for key, value in zip(unique, translated):
+                    for index in missing[key]:
+                        results[index] = value
+                if self.persistent:
+                    self._store_persistent(dict(zip(unique, translated)), target_language)
+        return results
+
+    def _load_persistent(self, missing, results, target_language):
+        from .models import TranslationCacheEntry
+
+        rows = TranslationCacheEntry.objects.filter(
+            target_language=target_language,
+            text_hash__in=[key[0] for key in missing],
+        ).values_list('text_hash', 'translated_text')
+        with self._lock:
+            for digest, translated in rows:
+                key = (digest, target_language)
+                indexes = missing.pop(key, ())
+                for index in indexes:
+                    results[index] = translated
+                self.counters['db_hits'] += len(indexes)
+                self._remember(key, translated)
+
+    def _store_persistent(self, translations, target_language):
+        from .models import TranslationCacheEntry
+
+        TranslationCacheEntry.objects.bulk_create(
+            [
+                TranslationCacheEntry(text_hash=key[0], target_language=target_language, translated_text=value)
+                for key, value in translations.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_translation_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                backend = import_string(getattr(settings, 'TRANSLATION_BACKEND', 'api.translation.GoogleTranslator'))
+                _service = TranslationService(
+                    backend(),
+                    cache_size=getattr(settings, 'TRANSLATION_CACHE_SIZE', 10000),
+                    persistent=getattr(settings, 'TRANSLATION_PERSISTENT_CACHE', False),
+                )
+    return _service
+
+
+def translation_cache_stats():
+    """The shared service's counters; zeros until it is first used."""
+    if _service is None:
+        return {'hits': 0, 'db_hits': 0, 'misses': 0, 'errors': 0, 'size': 0, 'hit_ratio': 0.0}
+    return _service.stats()
+
+
+class TranslationWorkerPool:
+    """Translates saved messages in the background.
+
+    Message ids are put on a local queue. Each worker takes what is waiting (up
+    to ``batch_size``, waiting at most ``batch_wait`` seconds for more), groups
+    it by target language, sends one translate call per language and writes
+    the results back with a single ``bulk_update``.
+    """
+
+    def __init__(self, service, workers=2, batch_size=50, batch_wait=0.05):
+        self.service = service
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'translation-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, message_id):
+        self.start()
+        self.queue.put(message_id)
+
+    def join(self):
+        """Block until every submitted message has been processed."""
+        self.queue.join()
+
+    def _take_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self.process(batch)
+            except Exception:
+                logger.exception("Translation batch of %d messages failed", len(batch))
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self.queue.task_done()
+
+    def process(self, message_ids):
+        """Translate the given pending messages. Returns the number translated."""
+        from .conditional import invalidate_resource
+        from .models import ChatMember, Message
+        from .realtime import publish_to_users
+
+        messages = Message.objects.filter(
+            id__in=message_ids, translation_status=Message.TRANSLATION_PENDING
+        ).only('id', 'chat_id', 'text', 'target_language')
+        by_language = defaultdict(list)
+        for message in messages:
+            by_language[message.target_language].append(message)
+
+        updated = []
+        for language, group in by_language.items():
+            try:
+                results = self.service.translate_many([m.text for m in group], language, fallback=False)
+            except Exception as e:
+                logger.error(f"Translation error: {e}")
+                for message in group:
+                    message.translation_status = Message.TRANSLATION_FAILED
+            else:
+                for message, translated in zip(group, results):
+                    message.translated_text = translated
+                    message.translation_status = Message.TRANSLATION_DONE
+            updated.extend(group)
+
+        if not updated:
+            return 0
+        # bulk_update skips auto_now; bump it so conditional GETs see the change
+        now = timezone.now()
+        for message in updated:
+            message.updated_at = now
+        Message.objects.bulk_update(updated, ['translated_text', 'translation_status', 'updated_at'])
+        for chat_id in {message.chat_id for message in updated}:
+            invalidate_resource('messages', chat_id)
+
+        chat_ids = {message.chat_id for message in updated}
+        members = defaultdict(list)
+        for chat_id, user_id in ChatMember.objects.filter(chat_id__in=chat_ids).values_list('chat_id', 'user_id'):
+            members[chat_id].append(user_id)
+        for message in updated:
+            publish_to_users(members[message.chat_id], 'message.translated', {
+                'id': str(message.id),
+                'chat': str(message.chat_id),
+                'translated_text': message.translated_text,
+                'translation_status': message.translation_status,
+            })
+        return sum(1 for message in updated if message.translation_status == Message.TRANSLATION_DONE)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_translation_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = TranslationWorkerPool(
+                    get_translation_service(),
+                    workers=getattr(settings, 'TRANSLATION_WORKERS', 2),
+                    batch_size=getattr(settings, 'TRANSLATION_BATCH_SIZE', 50),
+                    batch_wait=getattr(settings, 'TRANSLATION_BATCH_WAIT', 0.05),
+                )
+    return _pool
@@ -1,22 +1,28 @@
 from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from .async_views import AsyncLoginUserView, AsyncRegisterUserView
 from .views import (
-    RegisterUserView, LoginUserView, GetCurrentUserView, GetUsersView,
-    GetUserByIdView, UpdateUserLocationView, UpdateUserView, UpdatePasswordView,
-    DeleteUserView, CreateChatView, UserChatsView, GetAllChatsView, FindChatView,
-    AddMessageView, GetMessagesView, CreateOrderView, GetAllOrdersView,
-    DeleteOrderView
+    GetCurrentUserView, GetUsersView, SearchUsersView, NearbyUsersView,
+    GetUserByIdView, UpdateUserLocationView, BatchLocationView, LocationHistoryView, UpdateUserView, UpdatePasswordView,
+    DeleteUserView, CreateChatView, UserChatsView, InboxView, MarkChatReadView, GetAllChatsView, FindChatView,
+    AddMessageView, BatchMessageView, GetMessagesView, SearchMessagesView, CreateOrderView, GetAllOrdersView,
+    OrderCountsView, OrderEstimatesView, DeleteOrderView, StatsView
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
     # User URLs
-    path('register/', RegisterUserView.as_view(), name='register'),
-    path('login/', LoginUserView.as_view(), name='login'),
+    path('register/', csrf_exempt(AsyncRegisterUserView.as_view()), name='register'),
+    path('login/', csrf_exempt(AsyncLoginUserView.as_view()), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('current-user/', GetCurrentUserView.as_view(), name='current-user'),
     path('users/', GetUsersView.as_view(), name='get-users'),
+    path('users/search/', SearchUsersView.as_view(), name='search-users'),
+    path('users/nearby/', NearbyUsersView.as_view(), name='nearby-users'),
+    path('users/locations/batch/', BatchLocationView.as_view(), name='batch-locations'),
     path('users/<uuid:user_id>/', GetUserByIdView.as_view(), name='get-user'),
     path('users/<uuid:user_id>/location/', UpdateUserLocationView.as_view(), name='update-location'),
+    path('users/<uuid:user_id>/location/history/', LocationHistoryView.as_view(), name='location-history'),
     path('users/<uuid:user_id>/update/', UpdateUserView.as_view(), name='update-user'),
     path('users/<uuid:user_id>/password/', UpdatePasswordView.as_view(), name='update-password'),
     path('users/<uuid:user_id>/', DeleteUserView.as_view(), name='delete-user'),
@@ -24,15 +30,24 @@ urlpatterns = [
     # Chat URLs
     path('chats/', CreateChatView.as_view(), name='create-chat'),
     path('chats/user/<uuid:user_id>/', UserChatsView.as_view(), name='user-chats'),
+    path('chats/user/<uuid:user_id>/inbox/', InboxView.as_view(), name='inbox'),
+    path('chats/<uuid:chat_id>/read/', MarkChatReadView.as_view(), name='mark-chat-read'),
     path('chats/all/', GetAllChatsView.as_view(), name='all-chats'),
     path('chats/find/<uuid:first_id>/<uuid:second_id>/', FindChatView.as_view(), name='find-chat'),
     
     # Message URLs
     path('messages/', AddMessageView.as_view(), name='add-message'),
+    path('messages/batch/', BatchMessageView.as_view(), name='batch-messages'),
+    path('messages/search/', SearchMessagesView.as_view(), name='search-messages'),
     path('messages/<uuid:chat_id>/', GetMessagesView.as_view(), name='get-messages'),
     
     # Order URLs
     path('orders/', CreateOrderView.as_view(), name='create-order'),
     path('orders/all/', GetAllOrdersView.as_view(), name='all-orders'),
+    path('orders/counts/', OrderCountsView.as_view(), name='order-counts'),
+    path('orders/estimates/', OrderEstimatesView.as_view(), name='order-estimates'),
     path('orders/<uuid:id>/', DeleteOrderView.as_view(), name='delete-order'),
+    
+    # Operational stats
+    path('stats/', StatsView.as_view(), name='stats'),
 ]
\ No newline at end of file
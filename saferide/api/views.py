@@ -1,87 +1,176 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework import generics, permissions, status
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound, ValidationError
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from .models import User, Chat, Message, Order
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import User, Chat, ChatMember, Message, Order
+from .archive import MessageHistoryPagination
+from .conditional import conditional_response, invalidate_resource, queryset_validators
+from .eta import estimate, get_pair_cache
+from .fast_serializers import FastListMixin, FastListSerializer
+from .filters import filter_orders
+from .history import location_path
+from .locations import get_location_buffer, nearby_users, valid_ping
+from .metrics import timed
+from .pagination import InboxPagination, KeysetPagination, RankedPagination
+from .purge import soft_delete_user
+from .realtime import publish_to_users
+from .rollups import count_messages, read_stats, rollups_enabled
+from .search import MIN_WORD_LENGTH, query_words, search_messages, search_users, user_query_words
+from .translation import get_translation_pool, valid_language
 from .serializers import (
-    UserSerializer, UserRegisterSerializer, UserLoginSerializer,
-    ChatSerializer, MessageSerializer, OrderSerializer
+    UserSerializer, ChatSerializer, MessageSerializer, OrderSerializer, InboxSerializer
 )
-from google.cloud import translate_v2 as translate
 import json
+import math
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-class RegisterUserView(generics.CreateAPIView):
-    serializer_class = UserRegisterSerializer
-    permission_classes = [permissions.AllowAny]
-    
-    def post(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.save()
-            
-            # Generate token
-            from rest_framework_simplejwt.tokens import RefreshToken
-            refresh = RefreshToken.for_user(user)
-            
-            return Response({
-                'id': str(user.id),
-                'username': user.username,
-                'email': user.email,
-                'city': user.city,
-                'roleKey': user.roleKey,
-                'phone': user.phone,
-                'access': str(refresh.access_token),
-                'refresh': str(refresh)
-            }, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+import numpy as np
 
-class LoginUserView(APIView):
-    permission_classes = [permissions.AllowAny]
-    
-    def post(self, request):
-        serializer = UserLoginSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.validated_data['user']
-            return Response({
-                'data': {
-                    'token': serializer.validated_data['access'],
-                    'user': {
-                        'id': str(user.id),
-                        'username': user.username,
-                        'email': user.email,
-                        'city': user.city,
-                        'roleKey': user.roleKey,
-                        'phone': user.phone
-                    }
-                },
-                'message': 'Login successful'
-            })
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+# Read-only list output without per-instance serializer overhead
+fast_users = FastListSerializer(UserSerializer)
+fast_chats = FastListSerializer(ChatSerializer)
+fast_messages = FastListSerializer(MessageSerializer)
+fast_orders = FastListSerializer(OrderSerializer)
 
 class GetCurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        serializer = UserSerializer(request.user)
-        return Response({'data': serializer.data})
+        user = request.user
+        return conditional_response(
+            request, ('user', user.pk), (user.updated_at, user.latitude, user.longitude), user.updated_at,
+            lambda: {'data': UserSerializer(user).data},
+            variant='current-user'
+        )
 
-class GetUsersView(generics.ListAPIView):
+class GetUsersView(FastListMixin, generics.ListAPIView):
     serializer_class = UserSerializer
+    fast_serializer = fast_users
     permission_classes = [IsAuthenticated]
     queryset = User.objects.all()
 
+class SearchView(APIView):
+    """Ranked search: ``?q=`` with ``?limit=`` and ``?after=<cursor>`` for the next page."""
+    permission_classes = [IsAuthenticated]
+    serializer = None
+    queryset = None
+    query_error = 'q must contain a word'
+    
+    def valid_query(self, query):
+        return bool(query_words(query))
+    
+    def search(self, request, query, after, count):
+        raise NotImplementedError
+    
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        if not self.valid_query(query):
+            return Response(
+                {'message': self.query_error}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        paginator = RankedPagination()
+        hits = paginator.paginate(request, lambda after, count: self.search(request, query, after, count))
+        rows = {row['id']: row for row in self.serializer.values(self.queryset.filter(pk__in=[pk for pk, _ in hits]))}
+        found = [(rows[pk], score) for pk, score in hits if pk in rows]
+        data = self.serializer.to_representation([row for row, _ in found])
+        for item, (_, score) in zip(data, found):
+            item['score'] = round(score, 6)
+        return paginator.get_paginated_response(data)
+
+class SearchUsersView(SearchView):
+    """Users by username, email, phone or city."""
+    serializer = fast_users
+    queryset = User.objects.all()
+    query_error = f'q must contain a word of at least {MIN_WORD_LENGTH} characters'
+    
+    def valid_query(self, query):
+        return bool(user_query_words(query))
+    
+    def search(self, request, query, after, count):
+        return search_users(query, limit=count, after=after)
+
 class GetUserByIdView(generics.RetrieveAPIView):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
     queryset = User.objects.all()
     lookup_field = 'id'
+    lookup_url_kwarg = 'user_id'
+    
+    def retrieve(self, request, *args, **kwargs):
+        user_id = kwargs[self.lookup_url_kwarg]
+        # Location pings are bulk-written without touching updated_at
+        version = self.get_queryset().filter(id=user_id).values_list(
+            'updated_at', 'latitude', 'longitude'
+        ).first()
+        if version is None:
+            raise NotFound()
+        return conditional_response(
+            request, ('user', user_id), version, version[0],
+            lambda: self.get_serializer(self.get_object()).data
+        )
+    
+    def delete(self, request, *args, **kwargs):
+        # delete-user shares this path, and Django routes by path alone
+        return DeleteUserView.as_view()(request._request, *args, **kwargs)
+
+class NearbyUsersView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_radius_km = 50
+    max_limit = 200
+    
+    def get(self, request):
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lng'])
+            radius = float(request.query_params.get('radius', 5))
+            limit = int(request.query_params.get('limit', 50))
+        except (KeyError, ValueError):
+            return Response(
+                {'message': 'lat and lng are required numbers'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not (math.isfinite(radius) and radius > 0):
+            return Response(
+                {'message': 'Invalid coordinates or radius'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        radius = min(radius, self.max_radius_km)
+        limit = max(1, min(limit, self.max_limit))
+        results = nearby_users(
+            latitude, longitude, radius,
+            role_key=request.query_params.get('roleKey'),
+            limit=limit
+        )
+        
+        data = []
+        for distance, user in results:
+            item = UserSerializer(user).data
+            item['distance_km'] = round(distance, 3)
+            data.append(item)
+        return Response(data)
 
 class UpdateUserLocationView(APIView):
     permission_classes = [IsAuthenticated]
     
     def patch(self, request, user_id):
         user = get_object_or_404(User, id=user_id)
+        if user.pk != request.user.pk:
+            return Response(
+                {'message': 'You can only update your own location'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
         latitude = request.data.get('latitude')
         longitude = request.data.get('longitude')
         
@@ -91,13 +180,134 @@ class UpdateUserLocationView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        user.latitude = latitude
-        user.longitude = longitude
-        user.save()
+        try:
+            latitude = float(latitude)
+            longitude = float(longitude)
+            ts = request.data.get('ts')
+            ts = None if ts is None else float(ts)
+        except (TypeError, ValueError):
+            return Response(
+                {'message': 'Latitude, longitude and ts must be numbers'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not valid_ping(latitude, longitude, ts):
+            return Response(
+                {'message': 'Invalid coordinates or ts'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Written behind by the location buffer, coalesced with other pings
+        get_location_buffer().add(user.pk, latitude, longitude, ts)
         
         return Response({
             'message': 'User location updated successfully',
-            'user': UserSerializer(user).data
+            'user': {'id': str(user.pk), 'latitude': latitude, 'longitude': longitude}
+        })
+
+class BatchLocationView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_pings = 1000
+    
+    def post(self, request):
+        pings = request.data.get('pings')
+        
+        if not isinstance(pings, list) or not pings:
+            return Response(
+                {'message': 'pings must be a non-empty list'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(pings) > self.max_pings:
+            return Response(
+                {'message': f'At most {self.max_pings} pings per batch'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        buffer = get_location_buffer()
+        accepted = 0
+        dropped = 0
+        rejected = []
+        for index, ping in enumerate(pings):
+            try:
+                user_id = uuid.UUID(str(ping['userId']))
+                latitude = float(ping['latitude'])
+                longitude = float(ping['longitude'])
+                ts = ping.get('ts')
+                ts = None if ts is None else float(ts)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                rejected.append(index)
+                continue
+            if not valid_ping(latitude, longitude, ts):
+                rejected.append(index)
+                continue
+            if buffer.add(user_id, latitude, longitude, ts):
+                accepted += 1
+            else:
+                dropped += 1
+        
+        return Response({
+            'accepted': accepted,
+            'dropped': dropped,
+            'rejected': rejected
+        }, status=status.HTTP_202_ACCEPTED)
+
+class LocationHistoryView(APIView):
+    """The requesting user's recorded path between ``from`` and ``to`` (ISO 8601 or epoch seconds).
+
+    Defaults to the last hour. The path is simplified with Douglas-Peucker to
+    at most ``points`` points, and further to ``tolerance`` metres when given.
+    """
+    permission_classes = [IsAuthenticated]
+    default_range = timedelta(hours=1)
+    max_range = timedelta(days=1)
+    default_points = 500
+    max_points = 5000
+    
+    def parse_time(self, value):
+        try:
+            return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+        except ValueError:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise
+            return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+    
+    def get(self, request, user_id):
+        if user_id != request.user.pk:
+            return Response(
+                {'message': 'You can only view your own location history'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            end = request.query_params.get('to')
+            end = timezone.now() if end is None else self.parse_time(end)
+            start = request.query_params.get('from')
+            start = end - self.default_range if start is None else self.parse_time(start)
+            points = int(request.query_params.get('points', self.default_points))
+            tolerance = request.query_params.get('tolerance')
+            tolerance = None if tolerance is None else float(tolerance)
+            if tolerance is not None and not tolerance >= 0:
+                raise ValueError(tolerance)
+        except (ValueError, OverflowError, OSError):
+            return Response(
+                {'message': 'from and to must be ISO 8601 or epoch seconds; points and tolerance numbers'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if start > end or end - start > self.max_range:
+            return Response(
+                {'message': f'from must precede to by at most {self.max_range}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        path, total = location_path(
+            user_id, start, end, max_points=max(2, min(points, self.max_points)), tolerance_m=tolerance
+        )
+        return Response({
+            'userId': str(user_id),
+            'from': start,
+            'to': end,
+            'total': total,
+            'points': [[round(ts, 3), lat, lng] for ts, lat, lng in path]
         })
 
 class UpdateUserView(APIView):
@@ -128,7 +338,8 @@ class UpdatePasswordView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        user.set_password(new_password)
+        with timed('hashing'):
+            user.set_password(new_password)
         user.save()
         
         return Response({'message': 'User password updated successfully'})
@@ -137,10 +348,17 @@ class DeleteUserView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
     queryset = User.objects.all()
     lookup_field = 'id'
+    lookup_url_kwarg = 'user_id'
     
     def delete(self, request, *args, **kwargs):
         instance = self.get_object()
-        self.perform_destroy(instance)
+        if instance.pk != request.user.pk:
+            return Response(
+                {'message': 'You can only delete your own account'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        # Their orders, messages and the rest are removed in the background (api.purge)
+        soft_delete_user(instance)
         return Response({'message': 'User deleted successfully'})
 
 class CreateChatView(APIView):
@@ -156,38 +374,90 @@ class CreateChatView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if chat already exists
-        existing_chat = Chat.objects.filter(
-            members__contains=[sender_id, receiver_id]
-        ).first()
+        try:
+            sender_id = uuid.UUID(str(sender_id))
+            receiver_id = uuid.UUID(str(receiver_id))
+        except ValueError:
+            return Response(
+                {'error': 'senderId and receiverId must be valid ids'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if sender_id == receiver_id:
+            return Response(
+                {'error': 'senderId and receiverId must be different users'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        if existing_chat:
-            return Response(ChatSerializer(existing_chat).data)
+        if User.objects.filter(id__in=[sender_id, receiver_id]).count() != 2:
+            return Response(
+                {'error': 'User not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        chat = Chat.objects.create(members=[sender_id, receiver_id])
-        return Response(ChatSerializer(chat).data, status=status.HTTP_201_CREATED)
+        chat, created = Chat.objects.get_or_create_direct(sender_id, receiver_id)
+        return Response(
+            ChatSerializer(chat).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
 
 class UserChatsView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, user_id):
-        chats = Chat.objects.filter(members__contains=[user_id])
-        serializer = ChatSerializer(chats, many=True)
-        return Response(serializer.data)
+        chats = Chat.objects.for_user(user_id)
+        last_modified, count = queryset_validators(chats)
+        
+        def build():
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(fast_chats.values(chats), request, view=self)
+            return paginator.get_paginated_response(fast_chats.to_representation(page)).data
+        
+        return conditional_response(request, ('user-chats', user_id), (last_modified, count), last_modified, build)
 
-class GetAllChatsView(generics.ListAPIView):
+class InboxView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, user_id):
+        if user_id != request.user.pk:
+            return Response(
+                {'message': 'You can only view your own inbox'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        # One query: memberships joined to chat, last message and counterpart
+        memberships = ChatMember.objects.filter(user_id=user_id).select_related(
+            'chat', 'chat__last_message', 'counterpart'
+        )
+        paginator = InboxPagination()
+        page = paginator.paginate_queryset(memberships, request, view=self)
+        return paginator.get_paginated_response(InboxSerializer(page, many=True).data)
+
+class MarkChatReadView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request, chat_id):
+        user_id = request.user.pk
+        read_at = timezone.now()
+        updated = ChatMember.objects.filter(chat_id=chat_id, user_id=user_id).update(
+            unread_count=0, last_read_at=read_at
+        )
+        if not updated:
+            return Response(
+                {'error': 'Chat not found for this user'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response({'chatId': str(chat_id), 'userId': str(user_id), 'unread_count': 0, 'last_read_at': read_at})
+
+class GetAllChatsView(FastListMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ChatSerializer
+    fast_serializer = fast_chats
     queryset = Chat.objects.all()
 
 class FindChatView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, first_id, second_id):
-        # Find chat where members contain both users
-        chat = Chat.objects.filter(
-            members__contains=[first_id, second_id]
-        ).first()
+        chat = Chat.objects.find_direct(first_id, second_id)
         
         if chat:
             return Response(ChatSerializer(chat).data)
@@ -198,7 +468,6 @@ class FindChatView(APIView):
 import json
 
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
@@ -216,37 +485,33 @@ class AddMessageView(APIView):
                 {'error': 'chatId, senderId, and text are required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not valid_language(sender_language):
+            return Response(
+                {'error': 'senderLanguage must be a language code such as en or pt-BR'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         try:
             chat = Chat.objects.get(id=chat_id)
             sender = User.objects.get(id=sender_id)
             
-            # Google Cloud Translation
-            translated_text = text
-            try:
-                # Check for credentials
-                if 'GOOGLE_APPLICATION_CREDENTIALS' not in os.environ:
-                    logger.warning("GOOGLE_APPLICATION_CREDENTIALS not set. Skipping translation.")
-                else:
-                    # Initialize translation client
-                    translate_client = translate.Client()
-                    
-                    # Translate text
-                    if sender_language != 'en':
-                        result = translate_client.translate(
-                            text, 
-                            target_language=sender_language
-                        )
-                        translated_text = result['translatedText']
-            except Exception as e:
-                logger.error(f"Translation error: {e}")
-                # Fallback to original text is already set
+            needs_translation = sender_language != 'en'
+            with transaction.atomic():
+                message = Message.objects.create(
+                    chat=chat,
+                    sender=sender,
+                    text=text,
+                    target_language=sender_language,
+                    translation_status=(
+                        Message.TRANSLATION_PENDING if needs_translation
+                        else Message.TRANSLATION_NOT_REQUIRED
+                    )
+                )
+                Chat.objects.record_message(message)
             
-            message = Message.objects.create(
-                chat=chat,
-                sender=sender,
-                text=translated_text
-            )
+            # Translated in the background; clients get a message.translated event
+            if needs_translation:
+                transaction.on_commit(lambda: get_translation_pool().submit(message.id))
             
             return Response(MessageSerializer(message).data)
             
@@ -266,14 +531,128 @@ class AddMessageView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class BatchMessageView(APIView):
+    """Send many messages at once, e.g. a client replaying its offline queue.
+    
+    Takes ``{"messages": [{chatId, senderId, text, senderLanguage}, ...]}`` and
+    answers with one result per item, in order. Valid items are saved together
+    even when others fail.
+    """
+    permission_classes = [IsAuthenticated]
+    max_messages = 500
+    
+    def post(self, request):
+        items = request.data.get('messages')
+        
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'messages must be a non-empty list'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.max_messages:
+            return Response(
+                {'error': f'At most {self.max_messages} messages per batch'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = [None] * len(items)
+        parsed = []
+        for index, item in enumerate(items):
+            try:
+                text = item.get('text')
+                language = item.get('senderLanguage', 'en')
+                if not (item.get('chatId') and item.get('senderId') and isinstance(text, str) and text):
+                    raise ValueError
+                parsed_item = (index, uuid.UUID(str(item['chatId'])), uuid.UUID(str(item['senderId'])), text, language)
+            except (AttributeError, TypeError, ValueError):
+                results[index] = {
+                    'index': index, 'status': status.HTTP_400_BAD_REQUEST,
+                    'error': 'chatId, senderId, and text are required'
+                }
+                continue
+            if not valid_language(language):
+                results[index] = {
+                    'index': index, 'status': status.HTTP_400_BAD_REQUEST,
+                    'error': 'senderLanguage must be a language code such as en or pt-BR'
+                }
+                continue
+            parsed.append(parsed_item)
+        
+        chats = Chat.objects.only('id').in_bulk({chat_id for _, chat_id, _, _, _ in parsed})
+        senders = User.objects.only('id').in_bulk({sender_id for _, _, sender_id, _, _ in parsed})
+        
+        accepted = []
+        messages = []
+        for index, chat_id, sender_id, text, language in parsed:
+            if chat_id not in chats:
+                results[index] = {'index': index, 'status': status.HTTP_404_NOT_FOUND, 'error': 'Chat not found'}
+            elif sender_id not in senders:
+                results[index] = {'index': index, 'status': status.HTTP_404_NOT_FOUND, 'error': 'User not found'}
+            else:
+                accepted.append(index)
+                messages.append(Message(
+                    chat_id=chat_id,
+                    sender_id=sender_id,
+                    text=text,
+                    target_language=language,
+                    translation_status=(
+                        Message.TRANSLATION_PENDING if language != 'en'
+                        else Message.TRANSLATION_NOT_REQUIRED
+                    )
+                ))
+        
+        if messages:
+            with transaction.atomic():
+                Message.objects.bulk_create(messages)
+                Chat.objects.record_messages(messages)
+                # bulk_create sends no post_save, so do what the Message signals would
+                if rollups_enabled():
+                    count_messages(messages)
+                transaction.on_commit(lambda: self.notify(messages))
+            
+            data = MessageSerializer(messages, many=True).data
+            for index, message_data in zip(accepted, data):
+                results[index] = {'index': index, 'status': status.HTTP_201_CREATED, 'message': message_data}
+        
+        return Response({
+            'created': len(messages),
+            'failed': len(items) - len(messages),
+            'results': results
+        })
+    
+    def notify(self, messages):
+        chat_ids = {message.chat_id for message in messages}
+        for chat_id in chat_ids:
+            invalidate_resource('messages', chat_id)
+        
+        members = {}
+        for chat_id, user_id in ChatMember.objects.filter(chat_id__in=chat_ids).values_list('chat_id', 'user_id'):
+            members.setdefault(chat_id, []).append(user_id)
+        for message in messages:
+            publish_to_users(members.get(message.chat_id, []), 'message.created', MessageSerializer(message).data)
+        
+        # The pool groups pending messages by language into shared translate calls
+        pool = get_translation_pool()
+        for message in messages:
+            if message.translation_status == Message.TRANSLATION_PENDING:
+                pool.submit(message.id)
+
 class GetMessagesView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request, chat_id):
         try:
-            messages = Message.objects.filter(chat_id=chat_id).order_by('created_at')
-            serializer = MessageSerializer(messages, many=True)
-            return Response(serializer.data)
+            messages = Message.objects.filter(chat_id=chat_id)
+            last_modified, count = queryset_validators(messages)
+            
+            def build():
+                paginator = MessageHistoryPagination(chat_id)
+                page = paginator.paginate_queryset(fast_messages.values(messages), request, view=self)
+                return paginator.get_paginated_response(fast_messages.to_representation(page)).data
+            
+            return conditional_response(request, ('messages', chat_id), (last_modified, count), last_modified, build)
+        except NotFound:
+            raise
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
@@ -281,6 +660,22 @@ class GetMessagesView(APIView):
             )
 
 
+class SearchMessagesView(SearchView):
+    """Messages by text, optionally within ``chatId`` or the chats of ``userId``."""
+    serializer = fast_messages
+    queryset = Message.objects.all()
+    
+    def search(self, request, query, after, count):
+        filters = {}
+        for param, name in (('chatId', 'chat_id'), ('userId', 'user_id')):
+            if request.query_params.get(param):
+                try:
+                    filters[name] = uuid.UUID(request.query_params[param])
+                except ValueError:
+                    raise ValidationError({param: ['Must be a valid id.']})
+        return search_messages(query, limit=count, after=after, **filters)
+
+
 class CreateOrderView(generics.CreateAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
@@ -292,10 +687,184 @@ class CreateOrderView(generics.CreateAPIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class GetAllOrdersView(generics.ListAPIView):
+class GetAllOrdersView(FastListMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
+    fast_serializer = fast_orders
     permission_classes = [IsAuthenticated]
     queryset = Order.objects.all()
+    
+    def get_queryset(self):
+        return filter_orders(super().get_queryset(), self.request.query_params)
+
+class OrderCountsView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_groups = 500
+    
+    def get(self, request):
+        orders = filter_orders(Order.objects.all(), request.query_params)
+        open_orders = Count('id', filter=Q(isComplete=False))
+        complete_orders = Count('id', filter=Q(isComplete=True))
+        
+        group_by = request.query_params.get('groupBy')
+        if group_by is None:
+            return Response(orders.aggregate(open=open_orders, complete=complete_orders, total=Count('id')))
+        
+        if group_by not in ('sender', 'receiver'):
+            return Response(
+                {'message': 'groupBy must be sender or receiver'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows = (
+            orders.order_by().values(group_by)
+            .annotate(open=open_orders, complete=complete_orders, total=Count('id'))
+            .order_by('-total')[:self.max_groups]
+        )
+        return Response([
+            {'user': row[group_by], 'open': row['open'], 'complete': row['complete'], 'total': row['total']}
+            for row in rows
+        ])
+
+class StatsView(APIView):
+    """Operational counters for the last ``hours`` hours, optionally for one ``city``.
+
+    Served from the rollups (api.rollups), so the cost depends on the hours
+    asked for, not on the size of the orders or messages tables. Counters
+    trail writes by up to ROLLUP_FLUSH_INTERVAL seconds.
+    """
+    permission_classes = [IsAuthenticated]
+    default_hours = 24
+    max_hours = 24 * 7
+    
+    def get(self, request):
+        try:
+            hours = int(request.query_params.get('hours', self.default_hours))
+        except ValueError:
+            hours = 0
+        if not 1 <= hours <= self.max_hours:
+            return Response(
+                {'message': f'hours must be a number from 1 to {self.max_hours}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        since = timezone.now() - timedelta(hours=hours - 1)
+        stats = read_stats(since, city=request.query_params.get('city'))
+        return Response({'hours': hours, **stats})
+
+class OrderEstimatesView(APIView):
+    """Distance and ETA for many coordinate pairs, or for one order against many drivers.
+
+    Send ``origins`` and ``destinations`` as lists of [lat, lng] of equal
+    length (or one point against many), or an ``orderId`` with optional
+    ``driverIds``; without them, the drivers near the order's pickup are used.
+    """
+    permission_classes = [IsAuthenticated]
+    max_pairs = 10000
+    max_drivers = 200
+    
+    def parse_points(self, value):
+        try:
+            points = np.asarray(value, dtype=np.float64)
+        except (TypeError, ValueError):
+            return None
+        if points.ndim != 2 or points.shape[1] != 2 or not len(points):
+            return None
+        if not (np.all(np.abs(points[:, 0]) <= 90) and np.all(np.abs(points[:, 1]) <= 180)):
+            return None
+        return points
+    
+    def post(self, request):
+        if request.data.get('orderId') is not None:
+            return self.estimate_order(request)
+        
+        origins = self.parse_points(request.data.get('origins'))
+        destinations = self.parse_points(request.data.get('destinations'))
+        if origins is None or destinations is None:
+            return Response(
+                {'message': 'origins and destinations must be non-empty lists of [lat, lng]'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(origins) != len(destinations) and 1 not in (len(origins), len(destinations)):
+            return Response(
+                {'message': 'origins and destinations must have the same length, or one of them a single point'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if max(len(origins), len(destinations)) > self.max_pairs:
+            return Response(
+                {'message': f'At most {self.max_pairs} pairs per request'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        km, seconds = estimate(origins, destinations, get_pair_cache())
+        return Response({
+            'count': len(km),
+            'distance_km': np.round(km, 3).tolist(),
+            'eta_seconds': np.rint(seconds).astype(np.int64).tolist()
+        })
+    
+    def estimate_order(self, request):
+        driver_ids = request.data.get('driverIds')
+        try:
+            order_id = uuid.UUID(str(request.data['orderId']))
+            if driver_ids is not None:
+                if not isinstance(driver_ids, list):
+                    raise TypeError(driver_ids)
+                driver_ids = [uuid.UUID(str(driver_id)) for driver_id in driver_ids]
+        except (TypeError, ValueError, AttributeError):
+            return Response(
+                {'message': 'orderId must be an id and driverIds a list of ids'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if driver_ids is not None and len(driver_ids) > self.max_drivers:
+            return Response(
+                {'message': f'At most {self.max_drivers} drivers per request'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Orders are picked up at the sender's last known position, as in dispatch
+        pickup = Order.objects.filter(pk=order_id).values_list('sender__latitude', 'sender__longitude').first()
+        if pickup is None:
+            return Response(
+                {'message': 'Order not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if None in pickup:
+            return Response(
+                {'message': 'The order sender has no known location'}, 
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        if driver_ids is None:
+            drivers = [
+                (user.id, user.latitude, user.longitude)
+                for _, user in nearby_users(
+                    pickup[0], pickup[1], getattr(settings, 'DISPATCH_MAX_DISTANCE_KM', 10.0),
+                    role_key=getattr(settings, 'DISPATCH_DRIVER_ROLE', 'driver'), limit=self.max_drivers
+                )
+            ]
+        else:
+            drivers = list(
+                User.objects.filter(pk__in=driver_ids)
+                .exclude(latitude=None).exclude(longitude=None)
+                .values_list('id', 'latitude', 'longitude')
+            )
+        
+        results = []
+        if drivers:
+            km, seconds = estimate(
+                [pickup], [(lat, lng) for _, lat, lng in drivers], get_pair_cache()
+            )
+            for index in np.argsort(seconds, kind='stable').tolist():
+                results.append({
+                    'id': str(drivers[index][0]),
+                    'distance_km': round(float(km[index]), 3),
+                    'eta_seconds': int(round(float(seconds[index])))
+                })
+        return Response({
+            'orderId': str(order_id),
+            'origin': list(pickup),
+            'drivers': results
+        })
 
 class DeleteOrderView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
@@ -2,6 +2,8 @@
 ASGI config for saferide project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections under ``/ws/`` go to the
+realtime push endpoint in ``api.realtime``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -13,4 +15,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "saferide.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.realtime import websocket_application  # noqa: E402
+from api.startup import warm_up_on_startup  # noqa: E402
+
+# Before the server hands this process any requests
+warm_up_on_startup()
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        if scope["path"].rstrip("/") == "/ws/events":
+            return await websocket_application(scope, receive, send)
+        await receive()
+        await send({"type": "websocket.close", "code": 4404})
+        return
+    return await django_application(scope, receive, send)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+from datetime import timedelta
 import os
 from dotenv import load_dotenv
 
@@ -52,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.RequestMetricsMiddleware",
+    "api.routers.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -95,6 +98,19 @@ DATABASES = {
     }
 }
 
+# Read replicas, e.g. DB_REPLICA_HOSTS=replica-1.internal,replica-2.internal.
+# Tests mirror them onto the test database.
+for _number, _host in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), start=1):
+    DATABASES[f"replica{_number}"] = {**DATABASES["default"], "HOST": _host.strip(), "TEST": {"MIRROR": "default"}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["api.routers.ReplicaRouter"]
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "shared": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "saferide_cache"},
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -134,14 +150,152 @@ STATIC_URL = "static/"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'api.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'api.renderers.ContentNegotiation',
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=3),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
-}
\ No newline at end of file
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.TokenRefreshSerializer',
+}
+
+# Nearby-user lookups (api.locations.nearby_users). 'db' (the default) reads the
+# users in the grid cells around the point through the indexed `geocell` column;
+# 'memory' keeps every located user in a per-process CellIndex, loaded at startup
+# and kept current by saves and location flushes, and only fetches the hits.
+NEARBY_INDEX_BACKEND = 'db'
+
+# Location pings (api.locations). Pings are coalesced per user and written every
+# LOCATION_FLUSH_INTERVAL seconds, or at once when LOCATION_FLUSH_SIZE users are
+# waiting; a ping that moved less than LOCATION_MIN_MOVE_METERS is dropped. A
+# client `ts` (epoch seconds) more than LOCATION_PING_MAX_AGE seconds old or
+# LOCATION_PING_MAX_SKEW seconds ahead of the server clock is rejected.
+LOCATION_FLUSH_INTERVAL = 2.0
+LOCATION_FLUSH_SIZE = 500
+LOCATION_MIN_MOVE_METERS = 5.0
+LOCATION_PING_MAX_AGE = 3600
+LOCATION_PING_MAX_SKEW = 60
+
+# Authenticated users are served from a per-process cache for up to this many
+# seconds (api.authentication.CachedJWTAuthentication).
+AUTH_USER_CACHE_TTL = 30
+AUTH_USER_CACHE_SIZE = 10000
+
+# Login/registration hash passwords on a dedicated pool (api.hashing); requests
+# beyond workers + queue are rejected with 429 instead of waiting.
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_MAX_QUEUE = 16
+
+# Fan-out used to push chat and order events to WebSocket clients (/ws/events/).
+# The in-memory backend only reaches connections on the same process.
+REALTIME_FANOUT_BACKEND = 'api.realtime.InMemoryFanout'
+
+# Message translation (api.translation). Swap the backend for
+# 'api.translation.FakeTranslator' in tests and benchmarks.
+TRANSLATION_BACKEND = 'api.translation.GoogleTranslator'
+TRANSLATION_CACHE_SIZE = 10000
+TRANSLATION_PERSISTENT_CACHE = False
+TRANSLATION_WORKERS = 2
+TRANSLATION_BATCH_SIZE = 50
+TRANSLATION_BATCH_WAIT = 0.05
+
+# Server-side cache of GET payloads for messages, chats and users, keyed by
+# resource version (api.conditional). ETag/304 handling is always on.
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Order dispatch (api.dispatch, `manage.py dispatch_orders`). Batches up to
+# DISPATCH_OPTIMAL_MAX_CELLS orders x drivers use optimal assignment, larger
+# ones greedy nearest-first.
+DISPATCH_DRIVER_ROLE = 'driver'
+DISPATCH_BATCH_SIZE = 10000
+DISPATCH_MAX_DISTANCE_KM = 10.0
+DISPATCH_LOCATION_MAX_AGE = 120
+DISPATCH_OPTIMAL_MAX_CELLS = 62500
+
+# Request instrumentation (api.metrics). Every request feeds the per-view latency
+# histograms on /metrics; a METRICS_SAMPLE_RATE fraction also gets the DB,
+# serialization, external-call and hashing breakdown and a Server-Timing header.
+# Set METRICS_TOKEN to require `Authorization: Bearer <token>` on /metrics.
+METRICS_SAMPLE_RATE = 1.0
+METRICS_SERVER_TIMING = True
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Message archival (api.archive, `manage.py archive_messages`). Messages older
+# than MESSAGE_ARCHIVE_AFTER_DAYS move into compressed per-chat segments of up to
+# MESSAGE_ARCHIVE_SEGMENT_SIZE messages; GET messages reads through to them when
+# paging back or forward.
+MESSAGE_ARCHIVE_AFTER_DAYS = 90
+MESSAGE_ARCHIVE_SEGMENT_SIZE = 500
+
+# Replica routing (api.routers). GET requests read from a replica in
+# DATABASE_REPLICAS lagging at most DATABASE_REPLICA_MAX_LAG seconds; a user's
+# reads stay on the primary until a replica has caught up with their last write
+# (or for DATABASE_STICKY_SECONDS where lag cannot be measured). Write times are
+# kept in DATABASE_STICKY_CACHE_ALIAS, which must be shared between processes;
+# the middleware refuses to start with replicas and a per-process cache. The
+# 'shared' cache lives on the primary (`manage.py createcachetable` once).
+DATABASE_REPLICA_MAX_LAG = 10.0
+DATABASE_REPLICA_CHECK_INTERVAL = 5.0
+DATABASE_STICKY_SECONDS = 5.0
+DATABASE_STICKY_CACHE_ALIAS = 'shared'
+
+# Location history (api.history). Accepted pings are appended every
+# LOCATION_HISTORY_FLUSH_INTERVAL seconds to one delta-encoded chunk per user and
+# LOCATION_HISTORY_WINDOW seconds (at most ~24 days).
+LOCATION_HISTORY_ENABLED = True
+LOCATION_HISTORY_WINDOW = 3600
+LOCATION_HISTORY_FLUSH_INTERVAL = 30.0
+LOCATION_HISTORY_MAX_BUFFERED = 200000
+
+# Distance and ETA estimates (api.eta, POST orders/estimates/). Straight-line
+# distance is stretched by ETA_DETOUR_FACTOR and driven at ETA_SPEED_BANDS
+# speeds: [up to km, km/h] per band, the last one open-ended. ETA_CACHE_SIZE
+# slots of per-process pair cache; 0 disables it.
+ETA_DETOUR_FACTOR = 1.3
+ETA_SPEED_BANDS = [[2.0, 15.0], [10.0, 25.0], [None, 40.0]]
+ETA_CACHE_SIZE = 0
+
+# Search (api.search, GET users/search/ and messages/search/). Message search
+# ranks only the newest SEARCH_MESSAGE_CANDIDATES matches of a query.
+SEARCH_MESSAGE_CANDIDATES = 5000
+
+# User deletion (api.purge, `manage.py purge_users`). DELETE users/<id>/ only
+# soft-deletes; the purge job then removes the user's orders, messages and other
+# rows USER_PURGE_BATCH_SIZE at a time, resuming where it stopped after a crash.
+USER_PURGE_BATCH_SIZE = 1000
+
+# Cold start (api.startup, `manage.py warmup`). With STARTUP_WARMUP the WSGI/ASGI
+# application imports views, loads DRF, JWT and translation machinery and checks
+# the databases before serving; GET /ready returns 503 until that has succeeded.
+# `manage.py warmup --check` fails when a fresh process takes longer than
+# COLD_START_MAX_SECONDS to get there.
+STARTUP_WARMUP = True
+COLD_START_MAX_SECONDS = 3.0
+
+# Stats rollups (api.rollups, GET stats/, `manage.py reconcile_rollups`). Each
+# process adds its buffered counter changes to the rollups table every
+# ROLLUP_FLUSH_INTERVAL seconds; reconciling recomputes the last
+# ROLLUP_RECONCILE_HOURS from the tables to repair drift.
+ROLLUPS_ENABLED = True
+ROLLUP_FLUSH_INTERVAL = 5.0
+ROLLUP_RECONCILE_HOURS = 48
@@ -16,8 +16,15 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from api.metrics import metrics_view
+from api.startup import ready_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/", include("api.urls")),
+    path("api-auth/", include("rest_framework.urls")),
+    path("metrics", metrics_view, name="metrics"),
+    path("ready", ready_view, name="ready"),
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "saferide.settings")
 
 application = get_wsgi_application()
+
+from api.startup import warm_up_on_startup  # noqa: E402
+
+# Before the server hands this process any requests
+warm_up_on_startup()
@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
+from api.metrics import metrics_view
+from api.startup import ready_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('ready', ready_view, name='ready'),
 ]
\ No newline at end of file